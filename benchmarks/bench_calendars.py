@@ -0,0 +1,85 @@
+"""
+fleet evaluation with shared exception calendars, against the same fleet
+without calendars and against a linear scan of the calendar per resource.
+run from the repo root with:
+    python -m benchmarks.bench_calendars --size 100000 --entries 5000
+"""
+import argparse
+from datetime import datetime, timedelta
+import random
+import time
+
+from benchmarks.corpus import generate
+import calendars
+import evaluate
+import timezones
+
+WHEN = datetime(2016, 1, 4, 17)
+NAMES = ('us-holidays', 'eu-holidays', 'db-maint', 'web-maint')
+
+
+def entries(count, rng):
+    # whole days and a few hour long windows spread over ten years
+    start = datetime(2010, 1, 1)
+    out = []
+    for _ in xrange(count):
+        day = start + timedelta(days=rng.randrange(3650))
+        if rng.random() < 0.5:
+            out.append(day.strftime(calendars.DATE_FORMAT))
+        else:
+            begin = day + timedelta(hours=rng.randrange(24))
+            out.append({'start': begin.strftime('%Y-%m-%dT%H:%M'),
+                        'end': (begin + timedelta(hours=4)).strftime(
+                            '%Y-%m-%dT%H:%M'),
+                        'state': rng.choice(('on', 'off'))})
+    return out
+
+
+def linear(resources, when):
+    # what a per resource scan of the raw entries would cost
+    raw = dict((name, calendars.get_calendar(name).intervals())
+               for name in NAMES)
+    forced = 0
+    for _, tag in resources:
+        name = tag.rpartition('cal=')[2]
+        if name in raw:
+            local = timezones.to_local(when, 'et')
+            for start, end, state in raw[name]:
+                if start <= local < end:
+                    forced += 1
+                    break
+    return forced
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='exception calendars')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--entries', type=int, default=5000,
+                        help='entries per calendar')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    start = time.time()
+    for name in NAMES:
+        calendars.register(name, entries(args.entries, rng))
+    print('registered %d calendars of %d entries in %.3fs' % (
+        len(NAMES), args.entries, time.time() - start))
+
+    plain = [('i-%d' % i, tag)
+             for i, tag in enumerate(generate(args.size, args.seed))]
+    with_cal = [(rid, '%s;cal=%s' % (tag, NAMES[i % len(NAMES)]))
+                for i, (rid, tag) in enumerate(plain)]
+    for name, resources in (('no calendars', plain),
+                            ('calendars', with_cal)):
+        evaluate.evaluate(resources, WHEN)
+        start = time.time()
+        evaluate.evaluate(resources, WHEN)
+        print('%-14s %8.3fs' % (name, time.time() - start))
+    start = time.time()
+    linear(with_cal, WHEN)
+    print('%-14s %8.3fs (calendar lookups only)' % (
+        'linear scan', time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+cold start of a short lived process that compiles a fleet's tags, with and
+without the persistent cache file. every run is a fresh interpreter. run
+from the repo root with:
+    python -m benchmarks.bench_coldstart --size 100000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.corpus import generate
+import diskcache
+
+CHILD = '''
+import json, sys, time
+start = time.time()
+import evaluate, diskcache
+tags = json.load(open(sys.argv[1]))
+imported = time.time()
+store = diskcache.load(sys.argv[2]) if sys.argv[2] != '-' else None
+loaded = time.time()
+evaluate.compile_tags(tags, store=store)
+done = time.time()
+print(json.dumps([imported - start, loaded - imported, done - loaded]))
+'''
+
+
+def run(tags_path, cache_path):
+    """
+    returns (import seconds, load seconds, compile seconds) of a fresh process
+    """
+    out = subprocess.check_output([sys.executable, '-c', CHILD, tags_path,
+                                   cache_path], cwd=os.getcwd())
+    return json.loads(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cold start with a cache file')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--popular', type=float, default=0.2)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+    tmp = tempfile.mkdtemp()
+    try:
+        tags = generate(args.size, args.seed, popular=args.popular)
+        tags_path = os.path.join(tmp, 'tags.json')
+        cache_path = os.path.join(tmp, 'offhours.cache')
+        with open(tags_path, 'w') as f:
+            json.dump(tags, f)
+        entries = diskcache.build(cache_path, tags)
+        print('%d tags, %d distinct, cache file %d bytes' % (
+            len(tags), entries, os.path.getsize(cache_path)))
+        for name, path in (('no cache', '-'), ('cache file', cache_path)):
+            best = min((run(tags_path, path) for _ in xrange(args.runs)),
+                       key=sum)
+            print('%-10s import %.3fs  load %.4fs  compile %.3fs  total %.3fs' % (
+                (name,) + tuple(best) + (sum(best),)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+dispatching the stop/start calls of a fleet against the fake cloud api, one
+call per resource against bulk calls on a worker pool. run from the repo
+root with:
+    python -m benchmarks.bench_dispatch --size 20000 --latency 0.02
+"""
+import argparse
+from datetime import datetime
+import time
+
+from benchmarks.corpus import generate
+import dispatcher
+import evaluate
+
+REGIONS = ('us-east-1', 'us-west-2', 'eu-west-1')
+ACCOUNTS = ('1111', '2222', '3333', '4444')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='action dispatch')
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds per fake api call')
+    parser.add_argument('--throttle', type=float, default=0.05,
+                        help='chance a fake api call is throttled')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=200,
+                        help='api calls per second')
+    parser.add_argument('--max-batch', type=int, default=50)
+    parser.add_argument('--serial-sample', type=int, default=100,
+                        help='resources to dispatch one call at a time')
+    args = parser.parse_args(argv)
+    tags = generate(args.size, args.seed)
+    resources = [('i-%07d' % i, tag) for i, tag in enumerate(tags)]
+    groups = dict((resource_id, (REGIONS[i % len(REGIONS)],
+                                 ACCOUNTS[i % len(ACCOUNTS)]))
+                  for i, (resource_id, _) in enumerate(resources))
+    # monday 19:00 eastern, when the popular schedules stop
+    decisions = evaluate.evaluate(resources, datetime(2016, 1, 5, 0))
+    actions = len(decisions.stop) + len(decisions.start)
+    print('%d resources, %d stops, %d starts' % (
+        len(resources), len(decisions.stop), len(decisions.start)))
+
+    backend = dispatcher.FakeBackend(args.latency, args.throttle,
+                                     args.max_batch, seed=args.seed)
+    serial = dispatcher.Dispatcher(backend, workers=1, max_batch=1,
+                                   base_delay=0.01, seed=args.seed)
+    sample = sorted(decisions.stop)[:args.serial_sample]
+    start = time.time()
+    serial.dispatch(evaluate.Decisions(set(sample), set(), set()), groups)
+    seconds = time.time() - start
+    print('one call per resource  %8.3fs for %d, ~%.0fs for all' % (
+        seconds, len(sample), seconds * actions / max(len(sample), 1)))
+
+    backend = dispatcher.FakeBackend(args.latency, args.throttle,
+                                     args.max_batch, seed=args.seed)
+    bulk = dispatcher.Dispatcher(backend, args.workers, args.rate,
+                                 max_batch=args.max_batch, base_delay=0.01,
+                                 seed=args.seed)
+    start = time.time()
+    result = bulk.dispatch(decisions, groups)
+    seconds = time.time() - start
+    print('bulk, %d workers      %8.3fs  %d calls, %d retries, %d failed, '
+          'peak %d in flight' % (args.workers, seconds, result.calls,
+                                 result.retries, len(result.failed),
+                                 backend.peak))
+
+
+if __name__ == '__main__':
+    main()
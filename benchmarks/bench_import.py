@@ -0,0 +1,61 @@
+"""
+import time of the parser modules in a fresh interpreter, and the modules
+each one loads. run from the repo root with:
+    python -m benchmarks.bench_import --repeat 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the core single tag parse path first, then the heavier entry points
+MODULES = ('function_parser', 'class_parser', 'schedule', 'validation',
+           'evaluate', 'scheduler', 'intervals', 'canonical', 'diskcache',
+           'bulk', 'parallel', 'service')
+
+# optional backends and stdlib modules the core parse path must not load
+HEAVY = ('numpy', 'pytz', 'logging', 'threading', 'mmap', 'tempfile',
+         'multiprocessing', 'hashlib', 'json', 'argparse', 're')
+
+_SCRIPT = '''
+import sys, time
+before = set(sys.modules)
+start = time.time()
+import %s
+seconds = time.time() - start
+print(repr(seconds))
+print(' '.join(sorted(m for m in set(sys.modules) - before
+                      if sys.modules[m] is not None)))
+'''
+
+
+def import_cost(module, python=sys.executable):
+    """
+    imports a module in a new interpreter
+
+    returns:
+        tuple: (seconds the import took, set of the modules it loaded)
+    """
+    out = subprocess.check_output([python, '-c', _SCRIPT % module], cwd=ROOT)
+    seconds, loaded = out.split('\n', 1)
+    return float(seconds), set(loaded.split())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='module import times')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    print('%-16s %9s %8s  %s' % ('module', 'ms', 'modules', 'heavy'))
+    for module in args.modules:
+        runs = [import_cost(module) for _ in xrange(args.repeat)]
+        loaded = runs[0][1]
+        print('%-16s %9.2f %8d  %s' % (
+            module, min(s for s, _ in runs) * 1000, len(loaded),
+            ' '.join(m for m in HEAVY if m in loaded)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+fleet wide slot queries on the inverted index against re-parsing and
+scanning every tag, plus the cost of building the index and of a delta.
+run from the repo root with:
+    python -m benchmarks.bench_index --size 1000000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.corpus import generate
+from compiled import compile_schedule
+import fleetindex
+import function_parser
+import timezones
+
+# friday 19:00 and sunday 10:00 pacific, monday 08:00 eastern
+QUERIES = (('pt', 4, 19, 'off'), ('pt', 6, 10, 'on'), ('et', 0, 8, 'on'))
+
+
+def scan(resources, tz, weekday, hour, state):
+    # what answering a query took without the index
+    zone = timezones.resolve(tz)
+    out = set()
+    for resource_id, tag in resources:
+        schedule = compile_schedule(function_parser.parse_off_hours(tag))
+        if schedule is None or not schedule.scheduled or \
+                timezones.resolve(schedule.tz) != zone:
+            continue
+        if schedule.state_at(weekday, hour) == state:
+            out.add(resource_id)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='inverted fleet index')
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--churn', type=float, default=0.01)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    resources = [('i-%07d' % i, tag)
+                 for i, tag in enumerate(generate(args.size, args.seed))]
+
+    index = fleetindex.FleetIndex()
+    start = time.time()
+    index.update(resources)
+    print('%-26s %8.3fs  %d schedules' % (
+        'build %d resources' % len(index), time.time() - start,
+        len(index._schedules)))
+
+    function_parser.cache.clear()
+    start = time.time()
+    scan(resources, *QUERIES[0])
+    print('%-26s %8.3fs' % ('scan, cold cache', time.time() - start))
+    start = time.time()
+    scan(resources, *QUERIES[0])
+    print('%-26s %8.3fs' % ('scan, warm cache', time.time() - start))
+
+    for query in QUERIES:
+        index._answers.clear()
+        start = time.time()
+        answer = index.at(*query)
+        seconds = time.time() - start
+        start = time.time()
+        ids = set(answer)
+        listed = time.time() - start
+        start = time.time()
+        count = index.count(*query)
+        counted = time.time() - start
+        print('%-26s %8.4fs  %7d resources, ids %.3fs, count %.5fs' % (
+            'at%r' % (query,), seconds, len(ids), listed, counted))
+    start = time.time()
+    # off on friday evening yet already up on monday at 06:00
+    both = index.changes('pt', 4, 19, 'off') & index.at('pt', 0, 6)
+    print('%-26s %8.4fs  %7d resources' % (
+        'changes & at', time.time() - start, len(both)))
+
+    fresh = generate(int(args.size * args.churn), args.seed + 1)
+    changed = [(resources[rng.randrange(args.size)][0], tag)
+               for tag in fresh]
+    start = time.time()
+    index.apply(changed=changed)
+    print('%-26s %8.3fs' % ('delta of %d changes' % len(changed),
+                             time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+overhead of the instrumentation hooks. compares parse_off_hours with the
+hooks disabled against the same code without the enabled check, and with a
+MemorySink attached, on warm (cache hit) and cold (cache miss) passes. run
+from the repo root with:
+    python -m benchmarks.bench_instrument --size 20000
+"""
+import argparse
+import timeit
+
+from benchmarks.corpus import generate
+import function_parser
+import instrument
+
+_missing = object()
+
+
+def unhooked(offhours):
+    # parse_off_hours as it was before the hooks
+    output = function_parser.cache.get(offhours, _missing)
+    if output is not _missing:
+        return output
+    output = function_parser._parse_off_hours(offhours)
+    function_parser.cache.put(offhours, output)
+    return output
+
+
+def passes(tags, parse):
+    """
+    returns (warm seconds, cold seconds) for parsing every tag
+    """
+    def warm():
+        for tag in tags:
+            parse(tag)
+
+    def cold():
+        function_parser.cache.clear()
+        warm()
+
+    warm()
+    return (min(timeit.repeat(warm, number=1, repeat=9)),
+            min(timeit.repeat(cold, number=1, repeat=9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='instrumentation overhead')
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    tags = generate(args.size, args.seed)
+    # keep every distinct tag so the warm pass only hits
+    function_parser.cache.maxsize = None
+    results = [('unhooked', passes(tags, unhooked)),
+               ('disabled', passes(tags, function_parser.parse_off_hours))]
+    instrument.enable(instrument.MemorySink())
+    try:
+        results.append(('memory sink', passes(tags, function_parser.parse_off_hours)))
+    finally:
+        instrument.disable()
+    base_warm, base_cold = results[0][1]
+    for name, (warm, cold) in results:
+        print('%-12s warm %7.1fns/tag (x%.2f)  cold %7.2fus/tag (x%.2f)' % (
+            name, warm / len(tags) * 1e9, warm / base_warm,
+            cold / len(tags) * 1e6, cold / base_cold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+memory held by the parsed schedules of a fleet, comparing the dict output of
+parse_off_hours with interned Schedule objects. run from the repo root with:
+    python -m benchmarks.bench_memory --size 100000
+"""
+import argparse
+import sys
+
+from benchmarks.corpus import generate
+import function_parser
+import schedule
+
+
+def deep_size(obj, seen=None):
+    """
+    returns the bytes held by obj and everything it references, counting
+    shared objects once
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
+
+def measure(size, seed=0):
+    """
+    returns (name, bytes) for the parsed schedules of size resources
+    """
+    tags = generate(size, seed)
+    container = sys.getsizeof([None] * size)
+    fresh = [function_parser._parse_off_hours(tag) for tag in tags]
+    function_parser.cache.clear()
+    cached = [function_parser.parse_off_hours(tag) for tag in tags]
+    interned = [schedule.parse(tag) for tag in tags]
+    return [
+        ('dicts, parsed per resource', deep_size(fresh) - container),
+        ('dicts, shared through the parse cache', deep_size(cached) - container),
+        ('interned Schedule objects', deep_size(interned) - container),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='parsed schedule memory')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    for name, size in measure(args.size, args.seed):
+        print('%-40s %12d bytes' % (name, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+lookup speed and size of compiled schedules with times off the hour, such as
+off=(M-F,19:30), against the same schedules on the hour. run from the repo
+root with:
+    python -m benchmarks.bench_minutes --lookups 1000000
+"""
+import argparse
+import random
+import sys
+import time
+
+from compiled import compile_schedule
+from function_parser import parse_off_hours
+
+HOURLY = 'off=[(M-F,19),(S,14)];on=[(M-F,7),(S,9)]'
+MINUTES = 'off=[(M-F,19:30),(S,14:15)];on=[(M-F,7:45),(S,9:05)]'
+
+
+def size_of(schedule):
+    # bytes held by the compiled schedule, its mask and its edges
+    size = sys.getsizeof(schedule) + sys.getsizeof(schedule.mask)
+    for hour, edges in (schedule.edges or {}).iteritems():
+        size += sys.getsizeof(hour) + sys.getsizeof(edges)
+    if schedule.edges is not None:
+        size += sys.getsizeof(schedule.edges)
+    return size
+
+
+def time_lookups(schedule, times, repeat):
+    is_on = schedule.is_on
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for weekday, hour, minute in times:
+            is_on(weekday, hour, minute)
+        seconds = time.time() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='minute schedule lookups')
+    parser.add_argument('--lookups', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    times = [(rng.randrange(7), rng.randrange(24), rng.randrange(60))
+             for _ in xrange(args.lookups)]
+
+    per_minute = [None] * (7 * 24 * 60)
+    print('%-8s %12s %10s %8s' % ('tag', 'ns/lookup', 'bytes', 'edges'))
+    for name, tag in (('hourly', HOURLY), ('minutes', MINUTES)):
+        schedule = compile_schedule(parse_off_hours(tag))
+        seconds = time_lookups(schedule, times, args.repeat)
+        print('%-8s %12.0f %10d %8d' % (
+            name, seconds * 1e9 / len(times), size_of(schedule),
+            sum(len(e) for e in (schedule.edges or {}).itervalues())))
+    print('a list of per minute states would take %d bytes' %
+          sys.getsizeof(per_minute))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+scaling of the process pool parse across 1 - N processes on a corpus with a
+long tail of unique tags. run from the repo root with:
+    python -m benchmarks.bench_parallel --size 200000
+"""
+import argparse
+from multiprocessing import cpu_count
+import time
+
+from benchmarks.corpus import generate
+import parallel
+
+
+def scaling(size, seed=0, max_processes=None, popular=0.2):
+    """
+    returns a list of (processes, seconds, warm seconds) for compiling a
+    corpus with freshly started workers, then again with the same workers
+    """
+    tags = generate(size, seed, popular=popular)
+    results = []
+    for processes in xrange(1, (max_processes or cpu_count()) + 1):
+        parallel.close_pools()
+        parallel._parsers.clear()
+        start = time.time()
+        parallel.compile_parallel(tags, processes)
+        cold = time.time() - start
+        start = time.time()
+        parallel.compile_parallel(tags, processes)
+        results.append((processes, cold, time.time() - start))
+    parallel.close_pools()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='process pool scaling')
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=cpu_count())
+    args = parser.parse_args(argv)
+    results = scaling(args.size, args.seed, args.processes)
+    base = results[0][1]
+    for processes, seconds, warm in results:
+        print('%3d processes %8.3fs  x%.2f  warm %8.3fs' % (
+            processes, seconds, base / seconds, warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+one year savings projection of a fleet in closed form, against evaluating
+each distinct schedule hour by hour. run from the repo root with:
+    python -m benchmarks.bench_projection --size 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+
+from benchmarks.corpus import generate
+import evaluate
+import projection
+import timezones
+
+START = datetime(2016, 1, 1)
+END = datetime(2017, 1, 1)
+
+
+def hourly(counts, start, end):
+    """
+    on hours of the fleet from evaluating every distinct schedule at every
+    hour of the range
+    """
+    compiled = evaluate.compile_tags(counts)
+    total = 0
+    for tag, count in counts.iteritems():
+        schedule = compiled[tag]
+        when = start
+        on = 0
+        while when < end:
+            if schedule is None or schedule.is_on(
+                    *timezones.local_slot(when, schedule.tz)):
+                on += 1
+            when += timedelta(hours=1)
+        total += on * count
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='fleet projection')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--popular', type=float, default=0.7)
+    parser.add_argument('--malformed', type=float, default=0.1)
+    parser.add_argument('--hourly-sample', type=int, default=50,
+                        help='distinct tags to evaluate hour by hour')
+    args = parser.parse_args(argv)
+    counts = {}
+    for tag in generate(args.size, args.seed, args.popular, args.malformed):
+        counts[tag] = counts.get(tag, 0) + 1
+    # parse up front so both sides time the projection only
+    compiled = evaluate.compile_tags(counts)
+    resources = {}
+    for tag, count in counts.iteritems():
+        resources[compiled[tag]] = resources.get(compiled[tag], 0) + count
+    timezones.preload(years=(START.year, END.year + 1))
+
+    start = time.time()
+    total, per_schedule = projection.project_schedules(resources, START, END)
+    closed = time.time() - start
+    print('%d resources, %d distinct tags, %d schedules' % (
+        total.resources, len(counts), len(per_schedule)))
+    print('closed form  %8.3fs  on %.0f saved %.0f instance hours' % (
+        closed, total.on_hours, total.saved_hours))
+
+    sample = dict(sorted(counts.items())[:args.hourly_sample])
+    start = time.time()
+    hourly(sample, START, END)
+    seconds = time.time() - start
+    print('hour by hour %8.3fs for %d distinct tags, ~%.0fs for all' % (
+        seconds, len(sample), seconds * len(counts) / len(sample)))
+
+
+if __name__ == '__main__':
+    main()
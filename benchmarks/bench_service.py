@@ -0,0 +1,84 @@
+"""
+latency and throughput of the schedule service against in-process calls.
+the service runs in a child process on a unix socket. run from the repo root
+with:
+    python -m benchmarks.bench_service
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from benchmarks.corpus import generate
+import function_parser
+import service
+
+
+def start_service(path):
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen([sys.executable, os.path.join(here, 'service.py'),
+                             '--unix', path])
+    for _ in xrange(100):
+        try:
+            service.Connection(path).close()
+            return proc
+        except socket.error:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError('service did not start')
+
+
+def compare(size=1000, number=20):
+    """
+    returns a list of (name, seconds per call, tags per second)
+    """
+    tags = generate(size, seed=0)
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'offhours.sock')
+    proc = start_service(path)
+    client = service.ScheduleClient(path)
+    try:
+        one = tags[:1]
+        batches = [tags[i:i + size // 10] for i in xrange(0, size, size // 10)]
+        requests = [{'id': i, 'op': 'parse', 'tags': b}
+                    for i, b in enumerate(batches)]
+        # warm both caches
+        client.parse(tags)
+        for tag in tags:
+            function_parser.parse_off_hours(tag)
+        cases = [
+            ('in-process, 1 tag', lambda: function_parser.parse_off_hours(one[0]), 1),
+            ('in-process, batch', lambda: [function_parser.parse_off_hours(t)
+                                           for t in tags], size),
+            ('service, 1 tag', lambda: client.parse(one), 1),
+            ('service, batch', lambda: client.parse(tags), size),
+            ('service, pipelined', lambda: client.pipeline(requests), size),
+        ]
+        results = []
+        for name, func, ops in cases:
+            seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+            results.append((name, seconds, ops / seconds))
+        return results
+    finally:
+        client.close()
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(tmp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='service vs in-process')
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args(argv)
+    for name, seconds, rate in compare(args.size, args.number):
+        print('%-22s %10.1f us/call %12.0f tags/sec' % (name, seconds * 1e6, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+timeline export of a fleet over a month, against building the same runs
+hour by hour for each resource. run from the repo root with:
+    python -m benchmarks.bench_timeline --size 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.corpus import generate
+from compiled import compile_schedule
+import function_parser
+import timeline
+import timezones
+
+START, END = datetime(2016, 3, 1), datetime(2016, 4, 1)
+
+
+def hourly(tag, start, end):
+    # runs of one resource from an hour by hour walk of the range
+    schedule = compile_schedule(function_parser.parse_off_hours(tag))
+    runs = []
+    while start < end:
+        on = schedule is None or not schedule.scheduled or \
+            schedule.is_on(*timezones.local_slot(start, schedule.tz))
+        state = 'on' if on else 'off'
+        if runs and runs[-1][2] == state:
+            runs[-1][1] = start + timedelta(hours=1)
+        else:
+            runs.append([start, start + timedelta(hours=1), state])
+        start += timedelta(hours=1)
+    return runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='fleet timeline export')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=timeline.FORMATS)
+    parser.add_argument('--hourly-sample', type=int, default=200,
+                        help='resources to walk hour by hour')
+    args = parser.parse_args(argv)
+    resources = [('i-%07d' % i, tag)
+                 for i, tag in enumerate(generate(args.size, args.seed))]
+
+    fmt = args.format or ('parquet' if timeline.get_pyarrow() else 'csv')
+    fd, path = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(fd)
+    try:
+        start = time.time()
+        rows = timeline.export(resources, START, END, path, fmt)
+        seconds = time.time() - start
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    shared = len(set(id(line) for _, line in
+                     timeline.fleet_timelines(resources, START, END)))
+    print('%s export  %8.3fs  %d rows, %d timelines, %.1fMB, peak rss %dMB' % (
+        fmt, seconds, rows, shared, size / 1e6,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024))
+
+    sample = resources[:args.hourly_sample]
+    start = time.time()
+    for _, tag in sample:
+        hourly(tag, START, END)
+    seconds = time.time() - start
+    print('hour by hour %8.3fs for %d, ~%.0fs for all' % (
+        seconds, len(sample), seconds * len(resources) / max(len(sample), 1)))
+
+
+if __name__ == '__main__':
+    main()
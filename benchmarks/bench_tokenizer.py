@@ -0,0 +1,67 @@
+"""
+compares the tokenizer based parsers against the old split/translate/regex
+ones on a mix of real and malformed tags. run from the repo root with:
+    python -m benchmarks.bench_tokenizer
+"""
+import timeit
+
+import function_parser
+from class_parser import ScheduleParser
+from benchmarks import legacy
+
+CORPUS = [
+    'off=(M-F,19);on=(M-F,7)',
+    'off=(M-F,19);on=(M-F,7);tz=pt',
+    'off=[(M-F,21),(U,18)];on=[(M-F,6),(U,10)];tz=pt',
+    'off=[(M-F,19),(S,19)];on=(M-F,7);tz=ct',
+    'off=(F-T,20);on=(F-T,8);tz=gmt',
+    'off=[(M,19),(T,19),(W,19),(H,19),(F,19)];on=[(M,7),(T,7),(W,7),(H,7),(F,7)]',
+    'tz=pt',
+    # malformed
+    'off=(M-F,asdf);on=(M-F,asdf)',
+    'off=(asdf,19);on=(asdf,7)',
+    'off=[(M-F,21,123),(U,18)];on=(M-F,7)',
+    'off=[(M-Z,21),(U,18)];on=(M-F,7)',
+    'foo=[(M-F,19),(S,19)];on=(M-F,7)',
+    'off=(M-F,19)=(M-F,7)',
+    'this is not a schedule',
+    '',
+]
+
+
+class _NullCache(object):
+
+    def get(self, key, default=None):
+        return default
+
+    def put(self, key, value):
+        pass
+
+
+def compare(number=2000):
+    """
+    returns a list of (name, seconds) for parsing the corpus number times
+    """
+    parser = ScheduleParser(cache=_NullCache())
+    cases = [
+        ('parse_off_hours legacy', legacy.parse_off_hours),
+        ('parse_off_hours tokenizer', function_parser._parse_off_hours),
+        ('ScheduleParser.parse legacy', legacy.schedule_parse),
+        ('ScheduleParser.parse tokenizer', parser.parse),
+    ]
+    results = []
+    for name, parse in cases:
+        def run(parse=parse):
+            for tag in CORPUS:
+                parse(tag)
+        results.append((name, min(timeit.repeat(run, number=number, repeat=3))))
+    return results
+
+
+def main():
+    for name, seconds in compare():
+        print('%-32s %8.3f ms per corpus' % (name, seconds * 1000.0 / 2000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+cost of applying a delta to the incremental tracker against a full
+re-evaluation sweep, for a fleet and a range of churn rates. run from the
+repo root with:
+    python -m benchmarks.bench_tracker --size 100000
+"""
+import argparse
+from datetime import datetime
+import random
+import time
+
+from benchmarks.corpus import generate
+import evaluate
+import function_parser
+import tracker
+
+WHEN = datetime(2016, 1, 4, 13)
+CHURN = (0.001, 0.01, 0.1)
+
+
+def churn(size, rate, seed=0):
+    """
+    returns (sweep seconds, delta seconds) for changing size * rate tags
+    """
+    rng = random.Random(seed)
+    tags = generate(size, seed, popular=0.2)
+    resources = [('i-%d' % i, tag) for i, tag in enumerate(tags)]
+    state = tracker.ScheduleTracker(WHEN)
+    state.update(resources)
+    fresh = generate(int(size * rate), seed + 1, popular=0.2)
+    changed = [(resources[rng.randrange(size)][0], tag) for tag in fresh]
+
+    # the sweep starts from a cold cache, as a scheduled re-parse would
+    function_parser.cache.clear()
+    current = dict(resources)
+    current.update(changed)
+    start = time.time()
+    evaluate.evaluate(current.iteritems(), WHEN)
+    sweep = time.time() - start
+
+    start = time.time()
+    state.apply(changed=changed)
+    delta = time.time() - start
+    return sweep, delta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='incremental tracker churn')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    for rate in CHURN:
+        sweep, delta = churn(args.size, rate, args.seed)
+        print('churn %5.1f%%  sweep %8.3fs  delta %8.4fs  x%.0f' % (
+            rate * 100, sweep, delta, sweep / delta))
+
+
+if __name__ == '__main__':
+    main()
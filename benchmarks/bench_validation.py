@@ -0,0 +1,49 @@
+"""
+rejection cost on a mostly invalid corpus: the exception driven parsers from
+before the tokenizer, the current parser, the parser behind fast_reject and
+the full error report. caches are bypassed so every tag is parsed. run from
+the repo root with:
+    python -m benchmarks.bench_validation --size 50000 --malformed 0.9
+"""
+import argparse
+import timeit
+
+from benchmarks import legacy
+from benchmarks.corpus import generate
+import function_parser
+import validation
+
+
+def candidates():
+    parse = function_parser._parse_off_hours
+    fast_reject = validation.fast_reject
+    return [
+        ('legacy parse_off_hours', legacy.parse_off_hours),
+        ('parse_off_hours', parse),
+        ('fast_reject + parse', lambda tag: not fast_reject(tag) and parse(tag)),
+        ('fast_reject only', fast_reject),
+        ('errors', validation.errors),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='rejection cost')
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--malformed', type=float, default=0.9)
+    args = parser.parse_args(argv)
+    tags = generate(args.size, args.seed, popular=0.0, malformed=args.malformed)
+    rejected = sum(validation.fast_reject(tag) for tag in tags)
+    invalid = sum(function_parser._parse_off_hours(tag) is None for tag in tags)
+    print('%d tags, %d invalid, %d caught by fast_reject' % (
+        len(tags), invalid, rejected))
+    for name, run in candidates():
+        def sweep():
+            for tag in tags:
+                run(tag)
+        best = min(timeit.repeat(sweep, number=1, repeat=5))
+        print('%-24s %7.2fus/tag' % (name, best / len(tags) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
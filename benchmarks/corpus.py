@@ -0,0 +1,94 @@
+"""
+seeded generator for realistic tag corpora: a few popular schedules repeated
+heavily, a long tail of unique ones and some malformed input
+"""
+import random
+
+DAYS = 'MTWHFSU'
+TIMEZONES = ('et', 'pt', 'ct', 'mt', 'gmt')
+
+POPULAR = (
+    'off=(M-F,19);on=(M-F,7)',
+    'off=(M-F,19);on=(M-F,7);tz=pt',
+    'off=(M-F,20);on=(M-F,8);tz=ct',
+    'off=[(M-F,21),(U,18)];on=[(M-F,6),(U,10)];tz=pt',
+    'off=(M-F,18);on=(M-F,6);tz=gmt',
+)
+
+
+def random_group(rng):
+    """
+    returns a random (days,hour) group valid for both parsers
+    """
+    start = rng.randrange(7)
+    hour = rng.randint(1, 23)
+    if start < 6 and rng.random() < 0.6:
+        end = rng.randrange(start + 1, 7)
+        return '(%s-%s,%d)' % (DAYS[start], DAYS[end], hour)
+    return '(%s,%d)' % (DAYS[start], hour)
+
+
+def random_hours(rng):
+    groups = [random_group(rng) for _ in range(rng.choice((1, 1, 2, 3)))]
+    if len(groups) == 1 and rng.random() < 0.5:
+        return groups[0]
+    return '[%s]' % ','.join(groups)
+
+
+def random_schedule(rng):
+    """
+    returns a random valid schedule tag
+    """
+    tag = 'off=%s;on=%s' % (random_hours(rng), random_hours(rng))
+    if rng.random() < 0.7:
+        tag += ';tz=%s' % rng.choice(TIMEZONES)
+    return tag
+
+
+def malform(rng, tag):
+    """
+    breaks a valid tag in one of the ways seen in real inventories
+    """
+    kind = rng.randrange(7)
+    if kind == 0:
+        return tag.replace('M', 'Z', 1)
+    elif kind == 1:
+        return tag.replace(',', ',x', 1)
+    elif kind == 2:
+        return tag.replace(')', ',123)', 1)
+    elif kind == 3:
+        return tag.replace('=', '', 1)
+    elif kind == 4:
+        return tag.replace('off', 'of', 1)
+    elif kind == 5:
+        return tag + ';tz=pt=x'
+    return tag[:rng.randrange(1, len(tag))]
+
+
+def generate(size, seed=0, popular=0.7, malformed=0.1):
+    """
+    generates a list of size tag strings
+
+    args:
+        size (int):
+            number of tags
+        seed (int):
+            random seed, the same seed always gives the same corpus
+        popular (float):
+            fraction of tags drawn from the POPULAR schedules
+        malformed (float):
+            fraction of tags that are broken
+    returns:
+        list: tag strings
+    """
+    rng = random.Random(seed)
+    out = []
+    for _ in range(size):
+        r = rng.random()
+        if r < popular:
+            out.append(rng.choice(POPULAR))
+        elif r < popular + malformed:
+            out.append(malform(rng, random_schedule(rng)))
+        else:
+            out.append(random_schedule(rng))
+    return out
@@ -0,0 +1,129 @@
+"""
+the split/translate/regex parsers as they were before the tokenizer, kept
+only so the benchmarks can compare against them
+"""
+from itertools import cycle
+import re
+
+from function_parser import valid_days, valid_hours, tz_aliases, default_tz
+from class_parser import VALID_DAYS, VALID_HOURS, DEFAULT_TZ
+
+
+def parse_time(days, hour):
+    out = []
+    if len(days) == 3:
+        if days[0] == days[2] or days[0] not in valid_days or \
+            days[1] != '-' or days[2] not in valid_days:
+            return out
+    elif len(days) != 1 or days not in valid_days:
+        return out
+    if not hour in valid_hours:
+        return out
+    if not days in valid_days and len(days) == 3:
+        inrange = False
+        for d in cycle(valid_days):
+            if days[0] == d:
+                inrange = True
+            if inrange:
+                out.append({ "days": d, "hour": hour })
+            if days[2] == d and inrange:
+                break
+    else:
+        out.append({ "days": days, "hour": hour })
+    return out
+
+
+def parse_keys(item):
+    out = {}
+    tl = []
+    pair = item.split("=")
+    if len(pair) != 2: return None
+    key, values = pair[0], pair[1]
+    values = values.translate(None, "[]")
+    if key in ('tz'):
+        out[key] = default_tz
+        if values in tz_aliases:
+            out[key] = values
+        return out
+    elif key in ('off', 'on'):
+        pattern = re.compile(r'\(([^)]*)\)')
+        values = pattern.findall(values)
+        for time in values:
+            time = time.split(",")
+            if len(time) != 2: return None
+            try:
+                pt = parse_time(time[0], int(time[1]))
+            except:
+                return None
+            if not len(pt): return None
+            tl = tl + pt
+        out[key] = tl
+        return out
+    else:
+        return None
+
+
+def parse_off_hours(offhours):
+    output = {}
+    for item in offhours.split(';'):
+        p = parse_keys(item)
+        if not p:
+            return None
+        output.update(p)
+    if not output.get('tz'):
+        output['tz'] = default_tz
+    return output
+
+
+def _expand_day_range(days):
+    if len(days) == 1:
+        if days not in VALID_DAYS:
+            raise ValueError
+        return [days]
+    days = days.split('-')
+    if not len(days) == 2:
+        return []
+    if days[0] not in VALID_DAYS or days[1] not in VALID_DAYS:
+        raise ValueError
+    return VALID_DAYS[VALID_DAYS.index(days[0]):VALID_DAYS.index(days[1])+1]
+
+
+def _parse_custom_hours(hours):
+    parsed = []
+    for hour in hours.translate(None, '[]').split(',('):
+        hour = hour.translate(None, '()').split(',')
+        if not len(hour) == 2:
+            return []
+        try:
+            hour[1] = int(hour[1])
+            if hour[1] not in VALID_HOURS:
+                raise ValueError
+            parsed.append({'days': _expand_day_range(hour[0]), 'hour': hour[1]})
+        except ValueError:
+            return []
+    return parsed
+
+
+def schedule_parse(tag_value):
+    # ScheduleParser.parse without the cache
+    schedule = {}
+    for piece in tag_value.split(';'):
+        kv = piece.split('=')
+        if not len(kv) == 2:
+            continue
+        key, value = kv
+        if key == 'on' or key == 'off':
+            value = _parse_custom_hours(value)
+        schedule[key] = value
+    if 'tz' not in schedule:
+        schedule['tz'] = DEFAULT_TZ
+    if ('off' in schedule) != ('on' in schedule):
+        return None
+    for key in ('off', 'on'):
+        if key in schedule:
+            if not schedule[key]:
+                return None
+            for hour in schedule[key]:
+                if not hour['days']:
+                    return None
+    return schedule
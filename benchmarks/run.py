@@ -0,0 +1,181 @@
+"""
+benchmark harness for the parsers. run from the repo root with:
+    python -m benchmarks.run --json results.json
+and compare two runs with:
+    python -m benchmarks.run --baseline old.json
+
+results are reported as ops/sec, where one op is one tag, and the number
+of objects the first pass over the corpus leaves alive, which is what its
+caches and results hold on to.
+"""
+import argparse
+from datetime import datetime
+import gc
+import json
+import platform
+import sys
+import timeit
+
+from benchmarks.corpus import generate
+from cache import LRUCache
+from class_parser import ScheduleParser
+import evaluate
+import function_parser
+from tokenizer import tokenize_hours
+
+WHEN = datetime(2016, 1, 4, 13)
+
+
+def measure(run, ops, number, repeat=3):
+    """
+    times run() and returns ops/sec
+
+    args:
+        run (callable):
+            does ops operations per call
+        ops (int):
+            number of operations per call
+        number (int):
+            calls per timing
+        repeat (int):
+            timings to take, the best one is kept
+    returns:
+        dict
+    """
+    best = min(timeit.repeat(run, number=number, repeat=repeat))
+    result = {
+        'ops': ops * number,
+        'seconds': best,
+        'ops_per_sec': ops * number / best if best else None
+    }
+    return result
+
+
+def retained(run):
+    """
+    calls run() once and returns the number of objects tracked by the
+    garbage collector that it left alive. python 2 has no tracemalloc, this
+    counts containers (dicts, lists, tuples, instances) but not their bytes
+    """
+    gc.collect()
+    before = len(gc.get_objects())
+    run()
+    gc.collect()
+    return len(gc.get_objects()) - before
+
+
+def cases(corpus):
+    """
+    returns (name, run, ops) for every benchmark over corpus
+    """
+    def parse_off_hours_cold():
+        function_parser.cache = LRUCache(None)
+        for tag in corpus:
+            function_parser.parse_off_hours(tag)
+
+    def parse_off_hours_warm():
+        for tag in corpus:
+            function_parser.parse_off_hours(tag)
+
+    def schedule_parser_cold():
+        parse = ScheduleParser(cache=LRUCache(None)).parse
+        for tag in corpus:
+            parse(tag)
+
+    warm = ScheduleParser(cache=LRUCache(None))
+
+    def schedule_parser_warm():
+        parse = warm.parse
+        for tag in corpus:
+            parse(tag)
+
+    ranges = ['F-T', 'M-F', 'S-U', 'T-H', 'W-M'] * 20
+    class_ranges = tokenize_hours(
+        '[(M-F,1),(S-U,1),(T-H,1),(M-U,1),(W-S,1)]')[::2] * 20
+    parser = ScheduleParser()
+
+    def function_range_expansion():
+        for days in ranges:
+            function_parser.parse_time(days, 9)
+
+    def class_range_expansion():
+        for token in class_ranges:
+            parser.expand_days(token)
+
+    resources = list(enumerate(corpus))
+
+    def evaluation():
+        evaluate.evaluate(resources, WHEN)
+
+    return [
+        ('parse_off_hours.cold', parse_off_hours_cold, len(corpus)),
+        ('parse_off_hours.warm', parse_off_hours_warm, len(corpus)),
+        ('ScheduleParser.parse.cold', schedule_parser_cold, len(corpus)),
+        ('ScheduleParser.parse.warm', schedule_parser_warm, len(corpus)),
+        ('range_expansion.function', function_range_expansion, len(ranges)),
+        ('range_expansion.class', class_range_expansion, len(class_ranges)),
+        ('evaluate', evaluation, len(corpus)),
+    ]
+
+
+def run(size=10000, seed=0, number=5):
+    """
+    runs every benchmark and returns the results as a json friendly dict
+    """
+    corpus = generate(size, seed)
+    saved = function_parser.cache
+    results = {}
+    try:
+        for name, func, ops in cases(corpus):
+            # the first pass warms caches and imports so the first timing
+            # is not an outlier
+            kept = retained(func)
+            results[name] = measure(func, ops, number)
+            results[name]['objects_retained'] = kept
+    finally:
+        function_parser.cache = saved
+    return {
+        'python': platform.python_version(),
+        'size': size,
+        'seed': seed,
+        'distinct_tags': len(set(corpus)),
+        'results': results
+    }
+
+
+def report(data, baseline=None, out=sys.stdout):
+    out.write('python %(python)s, %(size)d tags (%(distinct_tags)d distinct), '
+              'seed %(seed)d\n' % data)
+    for name in sorted(data['results']):
+        result = data['results'][name]
+        line = '%-28s %14.0f ops/sec' % (name, result['ops_per_sec'])
+        line += ' %10d objects retained' % result['objects_retained']
+        if baseline and name in baseline['results']:
+            line += '  x%.2f' % (result['ops_per_sec'] /
+                                 baseline['results'][name]['ops_per_sec'])
+        out.write(line + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='offhours parser benchmarks')
+    parser.add_argument('--size', type=int, default=10000,
+                        help='number of tags in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--number', type=int, default=5,
+                        help='passes over the corpus per timing')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file to compare against')
+    args = parser.parse_args(argv)
+    data = run(args.size, args.seed, args.number)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(data, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
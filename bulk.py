@@ -0,0 +1,223 @@
+"""
+streaming bulk parser for large tag exports. records are read lazily from
+jsonl or csv, the schedule field of each one is parsed (identical tags only
+once) and the records are written back out with the result, so memory use
+does not depend on the size of the export.
+
+    python bulk.py tags.jsonl -o parsed.jsonl --field offhours
+    python bulk.py tags.csv --format csv --flavor class > parsed.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+from class_parser import ScheduleParser
+import function_parser
+
+FORMATS = ('jsonl', 'csv')
+FLAVORS = ('function', 'class')
+
+INVALID_SCHEDULE = 'invalid schedule'
+MISSING_FIELD = 'missing field'
+INVALID_TAG = 'schedule is not a string'
+INVALID_JSON = 'invalid json'
+INVALID_RECORD = 'record is not an object'
+
+# fields parse_records adds to each record
+RESULT_FIELDS = ('valid', 'parsed', 'error')
+
+
+class ErrorRecord(dict):
+    """
+    a jsonl line read_records could not turn into a record, with its line
+    number in 'line' and the reason in 'error'
+    """
+
+
+def get_parser(flavor, cache_size=DEFAULT_CACHE_SIZE, cache=None):
+    """
+    returns the parse function for a flavor with its own bounded cache
+
+    args:
+        flavor (str):
+            'function' for parse_off_hours, 'class' for ScheduleParser.parse
+        cache_size (int):
+            number of distinct tags to remember
+        cache (LRUCache):
+            cache to use instead of creating one of cache_size
+    returns:
+        callable: tag string -> dict or None
+    """
+    if cache is None:
+        cache = LRUCache(cache_size)
+    if flavor == 'class':
+        return ScheduleParser(cache=cache).parse
+    elif flavor == 'function':
+        missing = object()
+
+        def parse(tag):
+            parsed = cache.get(tag, missing)
+            if parsed is missing:
+                parsed = function_parser._parse_off_hours(tag)
+                cache.put(tag, parsed)
+            return parsed
+        return parse
+    raise ValueError('unknown flavor %r, expected one of %s' % (flavor, FLAVORS))
+
+
+def read_records(fileobj, fmt='jsonl'):
+    """
+    yields one dict per record of a jsonl or csv file, blank jsonl lines are
+    skipped. a jsonl line that is not valid json, or not an object, yields
+    an ErrorRecord instead of stopping the read
+    """
+    if fmt == 'jsonl':
+        for number, line in enumerate(fileobj, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield ErrorRecord(line=number, error=INVALID_JSON)
+                continue
+            if isinstance(record, dict):
+                yield record
+            else:
+                yield ErrorRecord(line=number, error=INVALID_RECORD)
+    elif fmt == 'csv':
+        for row in csv.DictReader(fileobj):
+            yield row
+    else:
+        raise ValueError('unknown format %r, expected one of %s' % (fmt, FORMATS))
+
+
+def parse_records(records, field='schedule', flavor='function',
+                  cache_size=DEFAULT_CACHE_SIZE):
+    """
+    parses the schedule field of each record. yields a copy of each record
+    with 'valid', 'parsed' (the parse result or None) and 'error' (None or
+    the reason the record was rejected) added. an ErrorRecord keeps its
+    error, and a schedule field that is not a string, like a number or
+    null, is rejected without parsing
+
+    args:
+        records (iterable):
+            dicts, as yielded by read_records
+        field (str):
+            name of the field holding the tag value
+        flavor (str):
+            'function' or 'class'
+        cache_size (int):
+            number of distinct tags to remember
+    """
+    parse = get_parser(flavor, cache_size)
+    for record in records:
+        out = dict(record)
+        tag = record.get(field)
+        if isinstance(record, ErrorRecord):
+            parsed, error = None, record['error']
+        elif tag is None:
+            parsed, error = None, MISSING_FIELD
+        elif not isinstance(tag, basestring):
+            parsed, error = None, INVALID_TAG
+        else:
+            parsed = parse(tag)
+            error = None if parsed is not None else INVALID_SCHEDULE
+        out['valid'] = error is None
+        out['parsed'] = parsed
+        out['error'] = error
+        yield out
+
+
+def write_records(records, fileobj, fmt='jsonl', columns=None):
+    """
+    writes records as they come in. in csv the parsed schedule is written as
+    a json string. the header is written before the first row, so it is
+    columns followed by valid, parsed, error and extra, where extra holds
+    the keys of a record that are not in the header as a json object
+
+    args:
+        records (iterable):
+            dicts, as yielded by parse_records
+        fileobj (file):
+            file to write to
+        fmt (str):
+            'jsonl' or 'csv'
+        columns (list):
+            input columns of a csv file, defaults to the keys of the first
+            record
+    returns:
+        int: number of records written
+    """
+    count = 0
+    if fmt == 'jsonl':
+        for record in records:
+            fileobj.write(json.dumps(record, sort_keys=True))
+            fileobj.write('\n')
+            count += 1
+    elif fmt == 'csv':
+        writer = None
+        for record in records:
+            record = dict(record)
+            record['parsed'] = json.dumps(record['parsed'], sort_keys=True)
+            if writer is None:
+                if columns is None:
+                    columns = sorted(record)
+                header = [c for c in columns if c not in RESULT_FIELDS] + \
+                    list(RESULT_FIELDS)
+                known = set(header)
+                writer = csv.DictWriter(fileobj, header + ['extra'])
+                writer.writeheader()
+            extra = dict((k, record.pop(k)) for k in list(record)
+                         if k not in known)
+            record['extra'] = json.dumps(extra, sort_keys=True) if extra else ''
+            writer.writerow(record)
+            count += 1
+    else:
+        raise ValueError('unknown format %r, expected one of %s' % (fmt, FORMATS))
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help="jsonl or csv file, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file, '-' (the default) for stdout")
+    parser.add_argument('--format', choices=FORMATS, default='jsonl',
+                        help='input format')
+    parser.add_argument('--output-format', choices=FORMATS,
+                        help='output format, defaults to the input format')
+    parser.add_argument('--field', default='schedule',
+                        help='field holding the schedule tag')
+    parser.add_argument('--flavor', choices=FLAVORS, default='function',
+                        help='parse_off_hours (function) or ScheduleParser (class)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        lines = infile
+        if args.format == 'csv':
+            # csv output keeps the columns of a csv input
+            header = infile.readline()
+            columns = next(csv.reader([header]), [])
+            lines = itertools.chain([header], infile)
+        else:
+            columns = [args.field]
+        records = parse_records(read_records(lines, args.format), args.field,
+                                args.flavor, args.cache_size)
+        write_records(records, outfile, args.output_format or args.format,
+                      columns)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+# the lock type of threading.Lock, without loading the threading module on
+# the import path of the parsers
+from thread import allocate_lock
+
+DEFAULT_CACHE_SIZE = 4096
+
+_missing = object()
+
+
+class LRUCache(object):
+    """
+    bounded least recently used cache shared by the parsers. all access goes
+    through a lock so it is safe to share between threads. hits, misses and
+    evictions are counted so the cache can be sized from real traffic.
+
+    args:
+        maxsize (int or None):
+            number of entries to keep before evicting the least recently used
+            one. None means unbounded
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        if maxsize is not None and maxsize <= 0:
+            raise ValueError('maxsize must be a positive integer or None')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = allocate_lock()
+
+    def get(self, key, default=None):
+        """
+        returns the cached value for key and marks it as recently used, or
+        default if the key is not cached
+        """
+        with self._lock:
+            value = self._data.pop(key, _missing)
+            if value is _missing:
+                self.misses += 1
+                return default
+            # re-insert so the key moves to the most recently used end
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        drops every entry and resets the counters
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __contains__(self, key):
+        # membership checks do not touch the recency order or the counters
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
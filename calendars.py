@@ -0,0 +1,203 @@
+"""
+exception calendars for company holidays and one-off maintenance windows. a
+schedule refers to a calendar by name with the cal key:
+
+    off=(M-F,19);on=(M-F,7);tz=pt;cal=us-holidays
+
+while a calendar interval covers the local time of a resource, its state is
+the calendar's, 'off' or 'on', whatever the weekly rule says. calendars are
+registered once per process, from code or from a json file:
+
+    {"us-holidays": ["2016-12-26", "2017-01-02"],
+     "db-maint": [{"start": "2016-12-27T22:00", "end": "2016-12-28T02:00",
+                   "state": "on"}]}
+
+each calendar is held as sorted, disjoint intervals, so a lookup is a bisect
+whatever the number of entries. calendar times are local wall clock times,
+a holiday is the same date in every timezone. a name that is not registered
+has no exceptions.
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import os
+
+import timezones
+
+OFF, ON = 'off', 'on'
+
+# characters a calendar name can hold
+NAME_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz'
+                       'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.')
+
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', DATE_FORMAT)
+
+# registered calendars by name, and (mtime, names) of the loaded files
+calendars = {}
+_files = {}
+_day = timedelta(days=1)
+
+
+def valid_name(name):
+    """
+    returns True if name can be used as a calendar name in a tag
+    """
+    return bool(name) and NAME_CHARS.issuperset(name)
+
+
+def parse_time(text):
+    """
+    returns the naive datetime of an iso 8601 date or local date and time
+    """
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError('invalid calendar time %r' % (text,))
+
+
+class Calendar(object):
+    """
+    sorted, disjoint exception intervals [start, end) with their state.
+    where an off and an on interval overlap, off wins, as it does for the
+    weekly rules
+
+    args:
+        name (str):
+            calendar name
+        intervals (iterable):
+            (start, end, state) tuples of naive local datetimes and 'off' or
+            'on'
+    """
+
+    __slots__ = ('name', 'starts', 'ends', 'states')
+
+    def __init__(self, name, intervals):
+        self.name = name
+        self.starts = []
+        self.ends = []
+        self.states = []
+        # sweep the interval bounds, counting the off and on intervals open
+        # after each one
+        bounds = {}
+        for start, end, state in intervals:
+            if state not in (OFF, ON):
+                raise ValueError('invalid calendar state %r' % (state,))
+            if start < end:
+                bounds.setdefault(start, []).append((state, 1))
+                bounds.setdefault(end, []).append((state, -1))
+        counts = {OFF: 0, ON: 0}
+        current = None
+        for when in sorted(bounds):
+            for state, step in bounds[when]:
+                counts[state] += step
+            state = OFF if counts[OFF] else ON if counts[ON] else None
+            if state == current:
+                continue
+            if current is not None:
+                self.ends.append(when)
+            if state is not None:
+                self.starts.append(when)
+                self.states.append(state)
+            current = state
+
+    @classmethod
+    def from_entries(cls, name, entries):
+        """
+        builds a Calendar from json style entries: a date string for a whole
+        day off, or a dict with start, end (both iso dates or local times)
+        and an optional state that defaults to 'off'
+        """
+        intervals = []
+        for entry in entries:
+            if isinstance(entry, basestring):
+                day = datetime.strptime(entry, DATE_FORMAT)
+                intervals.append((day, day + _day, OFF))
+            else:
+                intervals.append((parse_time(entry['start']),
+                                  parse_time(entry['end']),
+                                  entry.get('state', OFF)))
+        return cls(name, intervals)
+
+    def state_at(self, local):
+        """
+        returns 'off' or 'on' if an exception covers a naive local datetime,
+        None otherwise
+        """
+        i = bisect_right(self.starts, local) - 1
+        if i >= 0 and local < self.ends[i]:
+            return self.states[i]
+        return None
+
+    def intervals(self):
+        return zip(self.starts, self.ends, self.states)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return 'Calendar(%r, %d intervals)' % (self.name, len(self))
+
+
+def register(name, entries):
+    """
+    registers (or replaces) a calendar built from json style entries, see
+    Calendar.from_entries
+
+    returns:
+        Calendar
+    """
+    if not valid_name(name):
+        raise ValueError('invalid calendar name %r' % (name,))
+    calendar = calendars[name] = Calendar.from_entries(name, entries)
+    return calendar
+
+
+def load(path):
+    """
+    registers the calendars of a json file of name -> entries. a file is
+    only read again once its modification time changes
+
+    returns:
+        list: names of the calendars in the file
+    """
+    mtime = os.path.getmtime(path)
+    loaded = _files.get(path)
+    if loaded is not None and loaded[0] == mtime:
+        return loaded[1]
+    import json
+    with open(path) as f:
+        data = json.load(f)
+    names = sorted(data)
+    for name in names:
+        register(str(name), data[name])
+    _files[path] = (mtime, names)
+    return names
+
+
+def get_calendar(name):
+    """
+    returns the registered Calendar or None
+    """
+    return calendars.get(name)
+
+
+def clear():
+    """
+    forgets every registered calendar and loaded file
+    """
+    calendars.clear()
+    _files.clear()
+
+
+def state_at(name, when, tz):
+    """
+    returns the state a calendar forces at a utc instant for a resource in
+    tz: 'off', 'on', or None when no exception applies or the calendar is not
+    registered
+    """
+    calendar = calendars.get(name)
+    if calendar is None:
+        return None
+    return calendar.state_at(timezones.to_local(when, tz))
@@ -0,0 +1,298 @@
+"""
+canonical form of schedules. tags that describe the same weekly on/off
+pattern in the same timezone, such as off=(M-F,19), off=[(M-F,19)] and
+off=[(M,19),(T-F,19)], get the same canonical string and fingerprint:
+
+    >>> canonical('off=[(M,19),(T-F,19)];on=(M-F,7);tz=pst')
+    'off=(M-F,19);on=(M-F,7);tz=pt'
+
+the fingerprint only depends on the compiled schedule, so it is the same
+for both parser flavors. print the schedule cardinality of an export with:
+    python canonical.py tags.jsonl --field offhours
+"""
+import sys
+
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+from class_parser import ScheduleParser
+from compiled import CompiledSchedule, DAYS, HOURS_PER_DAY, MINUTES_PER_HOUR, \
+    ALL_ON
+import function_parser
+import timezones
+
+_missing = object()
+
+
+def _preferred_aliases():
+    # the shortest alias of each zone, 'pt' rather than 'pst'
+    preferred = {}
+    for alias, zone in sorted(timezones.tz_aliases.items(),
+                              key=lambda a: (len(a[0]), a[0])):
+        preferred.setdefault(zone, alias)
+    return preferred
+
+preferred_aliases = _preferred_aliases()
+
+
+def canonical_tz(tz):
+    """
+    returns the preferred alias of the zone tz resolves to, or the zone name
+    when it has no alias
+    """
+    zone = timezones.resolve(tz)
+    return preferred_aliases.get(zone, zone)
+
+
+def canonical_of(schedule, flavor='function'):
+    """
+    returns the canonical tag of a CompiledSchedule. only real transitions
+    are kept, days sharing a time are merged into ranges and the groups are
+    sorted by day. times off the hour are written as h:mm. flavor='function'
+    writes midnight as hour 24 of the day before, flavor='class' as hour 0.
+
+    args:
+        schedule (CompiledSchedule):
+            compiled schedule, None for an invalid one
+        flavor (str):
+            parser the tag has to be valid for, 'function' or 'class'
+    returns:
+        str or None
+    """
+    if schedule is None:
+        return None
+    tz = 'tz=%s' % canonical_tz(schedule.tz)
+    if schedule.cal is not None:
+        tz += ';cal=%s' % schedule.cal
+    if schedule.mask == ALL_ON and schedule.edges is None:
+        return tz
+    events = schedule.changes()
+    if not events:
+        # always off, written as an on and off at the same hour
+        events = [(0, 'on'), (0, 'off')]
+    hours = {'off': {}, 'on': {}}
+    for when, state in events:
+        slot, minute = divmod(when, MINUTES_PER_HOUR)
+        day, hour = divmod(slot, HOURS_PER_DAY)
+        if hour == 0 and minute == 0 and flavor == 'function':
+            day, hour = (day - 1) % 7, HOURS_PER_DAY
+        hours[state].setdefault((hour, minute), []).append(day)
+    return ';'.join(['off=%s' % _groups(hours['off']),
+                     'on=%s' % _groups(hours['on']), tz])
+
+
+def _groups(hours):
+    groups = []
+    for hour, days in hours.items():
+        days.sort()
+        start = days[0]
+        for prev, day in zip(days, days[1:] + [None]):
+            if day != prev + 1:
+                groups.append((start, prev, hour))
+                start = day
+    groups.sort()
+    text = ','.join(
+        '(%s,%s)' % (DAYS[a] if a == b else '%s-%s' % (DAYS[a], DAYS[b]),
+                     '%d:%02d' % h if h[1] else h[0])
+        for a, b, h in groups)
+    if len(groups) == 1:
+        return text
+    return '[%s]' % text
+
+
+def fingerprint_key(schedule):
+    """
+    returns the string a fingerprint is the hash of, the same for every
+    spelling of a schedule. cheaper than the fingerprint when it is only
+    used to group schedules in one process
+    """
+    if schedule is None:
+        return None
+    key = '%x/%s' % (schedule.mask, timezones.resolve(schedule.tz))
+    if schedule.edges is not None:
+        # schedules on the hour keep the fingerprints they always had
+        key += '/' + ','.join('%d.%d.%d' % (slot, minute, on)
+                              for slot, edges in sorted(schedule.edges.items())
+                              for minute, on in edges)
+    if schedule.cal is not None:
+        key += '/cal=' + schedule.cal
+    return key
+
+
+def fingerprint_of(schedule):
+    """
+    returns a stable 16 hex digit fingerprint of a CompiledSchedule, the
+    same in every process and for every spelling of the schedule
+    """
+    # hashlib is left out of the import of the module, evaluate uses it
+    import hashlib
+    if schedule is None:
+        return None
+    return hashlib.sha1(fingerprint_key(schedule)).hexdigest()[:16]
+
+
+def _parser(flavor):
+    # uncached parse functions, the fingerprint cache replaces the tag keyed
+    # ones
+    if flavor == 'class':
+        return ScheduleParser(cache=LRUCache(1)).parse
+    return function_parser._parse_off_hours
+
+_parsers = {'function': _parser('function'), 'class': _parser('class')}
+
+
+def canonical(tag, flavor='function'):
+    """
+    returns the canonical tag for a tag, or None if it is invalid
+    """
+    return canonical_of(
+        CompiledSchedule.from_parsed(_parsers[flavor](tag)), flavor)
+
+
+def fingerprint(tag, flavor='function'):
+    """
+    returns the fingerprint of a tag, or None if it is invalid
+    """
+    return fingerprint_of(CompiledSchedule.from_parsed(_parsers[flavor](tag)))
+
+
+class FingerprintCache(object):
+    """
+    compiled schedules keyed by fingerprint. every spelling only costs a
+    tag -> fingerprint entry, the CompiledSchedule is kept once per distinct
+    schedule and shared by all of its spellings.
+
+    args:
+        flavor (str):
+            'function' or 'class'
+        maxsize (int or None):
+            spellings to remember, and distinct schedules to keep
+    """
+
+    def __init__(self, flavor='function', maxsize=DEFAULT_CACHE_SIZE):
+        self.flavor = flavor
+        self.parse = _parser(flavor)
+        self.fingerprints = LRUCache(maxsize)
+        self.schedules = LRUCache(maxsize)
+
+    def lookup(self, tag):
+        """
+        returns (fingerprint, CompiledSchedule) for a tag, (None, None) if it
+        is invalid
+        """
+        key = self.fingerprints.get(tag, _missing)
+        if key is not _missing:
+            if key is None:
+                return None, None
+            schedule = self.schedules.get(key)
+            if schedule is not None:
+                return key, schedule
+        schedule = CompiledSchedule.from_parsed(self.parse(tag))
+        key = fingerprint_of(schedule)
+        self.fingerprints.put(tag, key)
+        if key is not None:
+            shared = self.schedules.get(key)
+            if shared is None:
+                self.schedules.put(key, schedule)
+            else:
+                schedule = shared
+        return key, schedule
+
+    def fingerprint(self, tag):
+        return self.lookup(tag)[0]
+
+    def get(self, tag):
+        """
+        returns the shared CompiledSchedule of a tag, or None if it is invalid
+        """
+        return self.lookup(tag)[1]
+
+    def fingerprint_tags(self, tags):
+        """
+        returns a dict of distinct tag -> fingerprint
+        """
+        out = {}
+        for tag in tags:
+            if tag not in out:
+                out[tag] = self.fingerprint(tag)
+        return out
+
+    def stats(self):
+        return {'spellings': len(self.fingerprints),
+                'schedules': len(self.schedules)}
+
+
+def cardinality(tags, flavor='function', top=10):
+    """
+    fleet report of how many distinct schedules hide behind the distinct
+    tag spellings
+
+    args:
+        tags (iterable):
+            one tag string per resource
+        flavor (str):
+            'function' or 'class'
+        top (int):
+            number of most used schedules to list
+    returns:
+        dict: counts of resources, invalid resources, spellings and
+        schedules, and the top schedules with their canonical tag, resource
+        count and number of spellings
+    """
+    cache = FingerprintCache(flavor, maxsize=None)
+    spellings = {}
+    for tag in tags:
+        spellings[tag] = spellings.get(tag, 0) + 1
+    resources = {}
+    variants = {}
+    schedules = {}
+    invalid = 0
+    for tag, count in spellings.iteritems():
+        key, schedule = cache.lookup(tag)
+        if key is None:
+            invalid += count
+            continue
+        resources[key] = resources.get(key, 0) + count
+        variants[key] = variants.get(key, 0) + 1
+        schedules[key] = schedule
+    ranked = sorted(resources, key=lambda k: (-resources[k], k))[:top]
+    return {
+        'resources': sum(spellings.itervalues()),
+        'invalid': invalid,
+        'spellings': len(spellings),
+        'schedules': len(resources),
+        'top': [{'fingerprint': k,
+                 'canonical': canonical_of(schedules[k], flavor),
+                 'resources': resources[k],
+                 'spellings': variants[k]} for k in ranked]
+    }
+
+
+def main(argv=None):
+    import argparse
+    import bulk
+    parser = argparse.ArgumentParser(description='schedule cardinality report')
+    parser.add_argument('input', help="jsonl or csv file, '-' for stdin")
+    parser.add_argument('--format', choices=bulk.FORMATS, default='jsonl')
+    parser.add_argument('--field', default='schedule',
+                        help='field holding the schedule tag')
+    parser.add_argument('--flavor', choices=bulk.FLAVORS, default='function')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        records = bulk.read_records(infile, args.format)
+        report = cardinality((r.get(args.field) for r in records
+                              if isinstance(r.get(args.field), basestring)),
+                             args.flavor, args.top)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    print('%(resources)d resources, %(invalid)d invalid, %(spellings)d '
+          'spellings of %(schedules)d schedules' % report)
+    for entry in report['top']:
+        print('%(resources)8d  %(spellings)4d spellings  %(fingerprint)s  '
+              '%(canonical)s' % entry)
+
+
+if __name__ == '__main__':
+    main()
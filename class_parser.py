@@ -1,63 +1,126 @@
-DEFAULT_TZ = 'et'
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+from calendars import valid_name
+import instrument
+from timezones import default_tz as DEFAULT_TZ
+from tokenizer import scan_items, iter_items, tokenize_hours, KEY, DAY, RANGE, \
+    HOUR, MINUTE, UNEXPECTED_EQUALS
+
 VALID_DAYS = ['M', 'T', 'W', 'H', 'F', 'S', 'U']
 VALID_HOURS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18,
                19, 20, 21, 22, 23)
+VALID_MINUTES = tuple(range(60))
+DAY_INDEX = dict((d, i) for i, d in enumerate(VALID_DAYS))
+
+_missing = object()
 
 
 class ScheduleParser:
 
-    cache = {}
+    # shared by every instance unless one is given its own
+    cache = LRUCache(DEFAULT_CACHE_SIZE)
+
+    def __init__(self, cache=None, per_instance=False):
+        if cache is not None:
+            self.cache = cache
+        elif per_instance:
+            self.cache = LRUCache(DEFAULT_CACHE_SIZE)
 
     def parse(self, tag_value):
+        if instrument.enabled:
+            return self._parse_instrumented(tag_value)
         # check the cache
-        if tag_value in self.cache:
-            return self.cache[tag_value]
+        schedule = self.cache.get(tag_value, _missing)
+        if schedule is not _missing:
+            return schedule
+        schedule = self.build(iter_items(tag_value, bare=True))
+        # validate
+        if not self.is_valid(schedule):
+            schedule = None
+        # cache
+        self.cache.put(tag_value, schedule)
+        return schedule
+
+    def _parse_instrumented(self, tag_value):
+        # parse with each stage reported to the instrument sinks
+        schedule = self.cache.get(tag_value, _missing)
+        if schedule is not _missing:
+            instrument.count('cache_hits', parser='class')
+            return schedule
+        instrument.count('cache_misses', parser='class')
+        instrument.count('parses', parser='class')
+        with instrument.timer('tokenize', parser='class'):
+            pieces = scan_items(tag_value, bare=True)
+        with instrument.timer('expand', parser='class'):
+            schedule = self.build(pieces)
+        with instrument.timer('validate', parser='class'):
+            valid = self.is_valid(schedule)
+        if not valid:
+            reason = instrument.rejection_reason(tag_value, 'class')
+            instrument.count('rejections', parser='class', reason=reason)
+            schedule = None
+        self.cache.put(tag_value, schedule)
+        return schedule
+
+    def build(self, pieces):
         schedule = {}
         # parse schedule components
-        pieces = tag_value.split(';')
         for piece in pieces:
-            kv = piece.split('=')
             # components must by key-value
-            if not len(kv) == 2:
+            if piece[0].kind is not KEY or piece[-1].value == UNEXPECTED_EQUALS:
                 continue
-            key = kv[0]
-            value = kv[1]
+            key = piece[0].value
             if key == 'on' or key == 'off':
                 # parse custom on/off hours
-                value = self.parse_custom_hours(value)
+                value = self.custom_hours(piece[1:])
+            else:
+                value = piece[1].value
             schedule[key] = value
         # add default timezone, if none supplied
         if 'tz' not in schedule:
             schedule['tz'] = DEFAULT_TZ
-        # validate
-        if not self.is_valid(schedule):
-            schedule = None
-        # cache
-        self.cache[tag_value] = schedule
         return schedule
 
     def parse_custom_hours(self, hours):
+        return self.custom_hours(tokenize_hours(hours, bare=True))
+
+    def custom_hours(self, tokens):
         parsed = []
-        hours = hours.translate(None, '[]').split(',(')
-        for hour in hours:
-            hour = hour.translate(None, '()').split(',')
-            # custom hours must have two parts: (<days>, <hour>)
-            if not len(hour) == 2:
-                #force an all or nothing senario in terms of bad values
-                return []
-            try:
-                hour[1] = int(hour[1])
-                if not self.is_valid_hour_range(hour[1]):
-                    raise ValueError
+        days = None
+        for token in tokens:
+            kind = token.kind
+            if kind is HOUR:
+                if not self.is_valid_hour_range(token.value):
+                    #force an all or nothing senario in terms of bad values
+                    return []
                 parsed.append({
-                    'days': self.expand_day_range(hour[0]),
-                    'hour': hour[1]
+                    'days': self.expand_days(days),
+                    'hour': token.value
                     })
-            except ValueError:
+            elif kind is MINUTE:
+                if not self.is_valid_minute(token.value):
+                    return []
+                # only times off the hour carry a minute, (M-F,19:30)
+                if token.value:
+                    parsed[-1]['minute'] = token.value
+            elif kind is DAY or kind is RANGE:
+                days = token
+            else:
                 #force an all or nothing senario in terms of bad values
                 return []
         return parsed
 
+    def expand_days(self, token):
+        if token.kind is DAY:
+            return [token.value]
+        start, end = token.value
+        return self.day_span(start, end)
+
+    def day_span(self, start, end):
+        # days from start to end, wrapping past sunday for ranges like F-M
+        first = DAY_INDEX[start]
+        count = (DAY_INDEX[end] - first) % len(VALID_DAYS) + 1
+        return [VALID_DAYS[(first + n) % len(VALID_DAYS)] for n in xrange(count)]
+
     def expand_day_range(self, days):
         if len(days) == 1:
             if not self.is_valid_day(days):
@@ -70,10 +133,12 @@ class ScheduleParser:
 
         if not self.is_valid_day(days[0]) or not self.is_valid_day(days[1]):
             raise ValueError
-        # return a slice of valid days
-        return VALID_DAYS[VALID_DAYS.index(days[0]):VALID_DAYS.index(days[1])+1]
+        return self.day_span(days[0], days[1])
 
     def is_valid(self, schedule):
+        # a calendar reference has to be a usable name
+        if 'cal' in schedule and not valid_name(schedule['cal']):
+            return False
         # off and on are both required if either is present
         if 'off' in schedule and 'on' not in schedule:
             return False
@@ -105,6 +170,11 @@ class ScheduleParser:
             return True
         return False
 
+    def is_valid_minute(self, minute):
+        if minute in VALID_MINUTES:
+            return True
+        return False
+
     def is_valid_day(self, day):
         if day in VALID_DAYS:
             return True
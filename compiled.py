@@ -0,0 +1,291 @@
+HOURS_PER_DAY = 24
+HOURS_PER_WEEK = 7 * HOURS_PER_DAY
+MINUTES_PER_HOUR = 60
+MINUTES_PER_WEEK = HOURS_PER_WEEK * MINUTES_PER_HOUR
+ALL_ON = (1 << HOURS_PER_WEEK) - 1
+
+DAYS = ('M', 'T', 'W', 'H', 'F', 'S', 'U')
+DAY_INDEX = dict((d, i) for i, d in enumerate(DAYS))
+
+
+def _entry_days(entry):
+    """
+    returns the days of a parsed entry as a sequence. function_parser emits a
+    single day per entry ("M") while class_parser emits a list (["M", "T"])
+    """
+    days = entry['days']
+    if isinstance(days, basestring):
+        return (days,)
+    return days
+
+
+def slot(weekday, hour):
+    """
+    returns the index (0 - 167) of the weekly hour slot for a weekday and hour.
+    hour 24 (allowed by function_parser) is midnight of the following day.
+
+    args:
+        weekday (int):
+            0 - 6 where 0 is Monday, same as datetime.weekday()
+        hour (int):
+            0 - 24
+    returns:
+        int: weekly slot index
+    """
+    return (weekday * HOURS_PER_DAY + hour) % HOURS_PER_WEEK
+
+
+def transitions(parsed):
+    """
+    collects the on/off transitions of a parsed schedule keyed by minute of
+    the week (slot * 60 + minute). when on and off land on the same minute,
+    off wins.
+
+    args:
+        parsed (dict):
+            output of parse_off_hours or ScheduleParser.parse
+    returns:
+        dict: minute of the week -> 'on' or 'off'
+    """
+    events = {}
+    for state in ('on', 'off'):
+        for entry in parsed.get(state) or ():
+            minute = entry.get('minute', 0)
+            for day in _entry_days(entry):
+                events[slot(DAY_INDEX[day], entry['hour']) * MINUTES_PER_HOUR +
+                       minute] = state
+    return events
+
+
+def build(events):
+    """
+    turns a dict of minute of the week -> state transitions into the
+    (mask, edges) pair of a CompiledSchedule. bit i of the mask is the state
+    at the start of hour slot i, and edges maps the slots holding a
+    transition off the hour to their (minute, on) transitions. only real
+    changes are kept in edges, like in CompiledSchedule.changes, so spellings
+    of a schedule compile to the same edges. edges is None when every change
+    is on the hour.
+    """
+    hourly = {}
+    edges = None
+    # the state at the start of an hour is the one of the last transition at
+    # or before it. a transition at monday 00:00 comes after the ones of the
+    # last hour of the week
+    for minute in sorted(events, key=lambda m: m or MINUTES_PER_WEEK):
+        hour, offset = divmod(minute, MINUTES_PER_HOUR)
+        state = events[minute]
+        if offset:
+            if edges is None:
+                edges = {}
+            edges.setdefault(hour, []).append((offset, state == 'on'))
+            hour = (hour + 1) % HOURS_PER_WEEK
+        hourly[hour] = state
+    mask = build_mask(hourly)
+    if edges is not None:
+        # an off at 19:30 when the schedule is already off changes nothing
+        real = {}
+        for hour, e in edges.iteritems():
+            on = mask >> hour & 1
+            kept = []
+            for offset, state in e:
+                if state != on:
+                    kept.append((offset, state))
+                    on = state
+            if kept:
+                real[hour] = tuple(kept)
+        edges = real or None
+    return mask, edges
+
+
+def build_mask(events):
+    """
+    turns a dict of slot -> state transitions into a 168 bit integer where a
+    set bit means the resource is on for that hour. a schedule without any
+    transitions is always on.
+    """
+    if not events:
+        return ALL_ON
+    slots = sorted(events)
+    # the state at slot 0 is carried over from the last transition of the week
+    mask = ALL_ON >> (HOURS_PER_WEEK - slots[0]) \
+        if events[slots[-1]] == 'on' else 0
+    # set the run of bits from each on transition up to the next transition
+    for start, end in zip(slots, slots[1:] + [HOURS_PER_WEEK]):
+        if events[start] == 'on':
+            mask |= (1 << end) - (1 << start)
+    return mask
+
+
+class CompiledSchedule(object):
+    """
+    weekly on/off bitmask built once from a parse result. lookups are a shift
+    and a mask, and two schedules compare equal when their masks, edges and
+    timezones match, so a fleet sharing a handful of schedules can share the
+    objects.
+
+    schedules with transitions off the hour, such as 19:30, keep the same
+    mask of the state at the start of each hour plus a small dict of the
+    hours holding such a transition, so the representation grows with the
+    number of h:mm transitions rather than with the minutes of the week.
+    """
+
+    __slots__ = ('mask', 'tz', 'edges', 'cal', '_hash')
+
+    def __init__(self, mask, tz, edges=None, cal=None):
+        self.mask = mask
+        self.tz = tz
+        self.edges = edges or None
+        # name of the exception calendar, see calendars.py
+        self.cal = cal
+        self._hash = hash((mask, tz, self.pattern, cal))
+
+    @classmethod
+    def from_parsed(cls, parsed):
+        """
+        builds a CompiledSchedule from the output of parse_off_hours or
+        ScheduleParser.parse. returns None for an invalid (None) schedule
+        """
+        if parsed is None:
+            return None
+        return cls.from_events(transitions(parsed), parsed.get('tz'),
+                               parsed.get('cal'))
+
+    @classmethod
+    def from_events(cls, events, tz, cal=None):
+        """
+        builds a CompiledSchedule from a dict of minute of the week -> state
+        transitions
+        """
+        mask, edges = build(events)
+        return cls(mask, tz, edges, cal)
+
+    @property
+    def pattern(self):
+        """
+        hashable weekly on/off pattern without the timezone: the mask, or
+        (mask, sorted edges) for a schedule with transitions off the hour
+        """
+        if self.edges is None:
+            return self.mask
+        return self.mask, tuple(sorted(self.edges.iteritems()))
+
+    def is_on(self, weekday, hour, minute=0):
+        # slot() inlined, this is the hot path of evaluate
+        i = (weekday * HOURS_PER_DAY + hour) % HOURS_PER_WEEK
+        if self.edges is None or not minute or i not in self.edges:
+            return bool(self.mask >> i & 1)
+        on = self.mask >> i & 1
+        for offset, state in self.edges[i]:
+            if offset > minute:
+                break
+            on = state
+        return bool(on)
+
+    def state_at(self, weekday, hour, minute=0):
+        """
+        returns 'on' or 'off' for the given weekday (0 = Monday), hour and
+        minute
+        """
+        if self.is_on(weekday, hour, minute):
+            return 'on'
+        return 'off'
+
+    @property
+    def weekly(self):
+        # False for a weekly rule that is on every minute of the week
+        return self.mask != ALL_ON or self.edges is not None
+
+    @property
+    def scheduled(self):
+        # a schedule that is on every minute of the week never does anything,
+        # unless a calendar can turn it off
+        return self.weekly or self.cal is not None
+
+    def changes(self):
+        """
+        returns the real state changes of the week as (minute of the week,
+        'on' or 'off') pairs in order. an off at a time the schedule is
+        already off is not a change
+        """
+        edges = self.edges or {}
+        mask = self.mask
+        # the state monday 00:00 changes from is the one the week ends in
+        last = HOURS_PER_WEEK - 1
+        on = mask >> last & 1
+        for _, state in edges.get(last, ()):
+            on = state
+        out = []
+        for i in xrange(HOURS_PER_WEEK):
+            bit = mask >> i & 1
+            if bit != on:
+                out.append((i * MINUTES_PER_HOUR, 'on' if bit else 'off'))
+                on = bit
+            for offset, state in edges.get(i, ()):
+                if state != on:
+                    out.append((i * MINUTES_PER_HOUR + offset,
+                                'on' if state else 'off'))
+                    on = state
+        return out
+
+    def on_minutes(self):
+        """
+        returns the number of minutes per week the schedule is on
+        """
+        if self.edges is None:
+            return bin(self.mask).count('1') * MINUTES_PER_HOUR
+        changes = self.changes()
+        if not changes:
+            return MINUTES_PER_WEEK if self.mask & 1 else 0
+        on = 0
+        ends = [m for m, _ in changes[1:]] + [changes[0][0] + MINUTES_PER_WEEK]
+        for (start, state), end in zip(changes, ends):
+            if state == 'on':
+                on += end - start
+        return on
+
+    def on_hours(self):
+        """
+        returns the number of hours per week the schedule is on, a float for
+        schedules with transitions off the hour
+        """
+        if self.edges is None:
+            return bin(self.mask).count('1')
+        return self.on_minutes() / float(MINUTES_PER_HOUR)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompiledSchedule):
+            return NotImplemented
+        return self.mask == other.mask and self.tz == other.tz and \
+            self.edges == other.edges and self.cal == other.cal
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        extra = ''
+        if self.edges is not None:
+            extra += ', edges=%r' % (self.edges,)
+        if self.cal is not None:
+            extra += ', cal=%r' % (self.cal,)
+        return 'CompiledSchedule(mask=0x%042x, tz=%r%s)' % (
+            self.mask, self.tz, extra)
+
+
+def compile_schedule(parsed):
+    """
+    shortcut for CompiledSchedule.from_parsed
+
+    args:
+        parsed (dict):
+            output of parse_off_hours or ScheduleParser.parse
+    returns:
+        CompiledSchedule or None
+    """
+    return CompiledSchedule.from_parsed(parsed)
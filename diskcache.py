@@ -0,0 +1,348 @@
+"""
+persistent cache of compiled schedules for short lived processes. the file
+maps a fingerprint of each tag string to its compiled schedule and is memory
+mapped when opened, so loading does not depend on its size and the pages are
+shared by every process reading it.
+
+    >>> store = diskcache.load('/tmp/offhours.cache')
+    >>> evaluate.evaluate(resources, when, store=store)
+    >>> store.save()
+
+layout, little endian:
+    header    magic, format and grammar versions, flavor, slot count, entry
+              count, name count and extension count, 32 bytes
+    slots     open addressing hash table of 34 byte records: tag key (u64,
+              0 for an empty slot), 168 bit mask, timezone name index
+              (extension index for an EXTENDED record, u32), flag
+    names     timezone and calendar names, length prefixed strings, utf-8
+              encoded
+    extension per distinct timezone, calendar and edges of the schedules
+              with times off the hour or a calendar: timezone name index,
+              calendar name index (NO_NAME for none), both u32, and
+              transition count, then (slot, minute, on) bytes per transition
+
+files are only ever replaced whole by renaming a new file over the old one,
+so readers keep a consistent view of the file they opened. a file written
+by another format or grammar version, or for the other flavor, is ignored.
+"""
+from binascii import hexlify, unhexlify
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+from class_parser import ScheduleParser
+from compiled import CompiledSchedule, compile_schedule, HOURS_PER_WEEK
+import function_parser
+from tokenizer import GRAMMAR_VERSION
+
+MAGIC = 'OHCC'
+FORMAT_VERSION = 5
+FLAVORS = {'function': 0, 'class': 1}
+
+HEADER = struct.Struct('<4sHHB3xIIII4x')
+RECORD = struct.Struct('<Q%dsIB' % (HOURS_PER_WEEK // 8))
+TZ_LENGTH = struct.Struct('<H')
+EXTENSION = struct.Struct('<IIH')
+EDGE = struct.Struct('<BBB')
+NO_NAME = 0xffffffff
+
+# EXTENDED records are valid schedules with their timezone, calendar and
+# edges in the extension section
+VALID, INVALID, EXTENDED = 1, 2, 3
+
+_missing = object()
+
+
+def tag_key(tag):
+    """
+    returns the 64 bit fingerprint of a tag string, never 0
+    """
+    if isinstance(tag, unicode):
+        tag = tag.encode('utf-8')
+    return struct.unpack('<Q', hashlib.md5(tag).digest()[:8])[0] or 1
+
+
+def _pack_mask(mask):
+    return unhexlify('%042x' % mask)
+
+
+def _unpack_mask(raw):
+    return int(hexlify(raw), 16)
+
+
+def _parser(flavor):
+    if flavor == 'class':
+        return ScheduleParser().parse
+    return function_parser.parse_off_hours
+
+
+def write(path, entries, flavor='function'):
+    """
+    writes a cache file atomically: the file is written next to path and
+    renamed over it once complete
+
+    args:
+        path (str):
+            cache file
+        entries (dict):
+            tag key -> CompiledSchedule, or None for an invalid tag
+        flavor (str):
+            parser flavor the schedules were parsed with
+    returns:
+        int: number of entries written
+    """
+    slots = 16
+    while slots < 2 * len(entries):
+        slots *= 2
+    names = {}
+    # schedules sharing a timezone, calendar and edges share an extension
+    extensions = {}
+    table = bytearray(RECORD.size * slots)
+    used = [False] * slots
+    for key, schedule in entries.iteritems():
+        i = key & (slots - 1)
+        while used[i]:
+            i = (i + 1) & (slots - 1)
+        used[i] = True
+        if schedule is None:
+            record = (key, '', 0, INVALID)
+        else:
+            tz = names.setdefault(schedule.tz, len(names))
+            if schedule.edges is None and schedule.cal is None:
+                record = (key, _pack_mask(schedule.mask), tz, VALID)
+            else:
+                cal = NO_NAME if schedule.cal is None else \
+                    names.setdefault(schedule.cal, len(names))
+                edges = tuple(sorted(schedule.edges.items())) \
+                    if schedule.edges else ()
+                extension = (tz, cal, edges)
+                record = (key, _pack_mask(schedule.mask),
+                          extensions.setdefault(extension, len(extensions)),
+                          EXTENDED)
+        RECORD.pack_into(table, i * RECORD.size, *record)
+    names = sorted(names, key=names.get)
+    extended = sorted(extensions, key=extensions.get)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                prefix='.offhours-cache-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, FORMAT_VERSION, GRAMMAR_VERSION,
+                                  FLAVORS[flavor], slots, len(entries),
+                                  len(names), len(extended)))
+            out.write(table)
+            for name in names:
+                if isinstance(name, unicode):
+                    name = name.encode('utf-8')
+                out.write(TZ_LENGTH.pack(len(name)))
+                out.write(name)
+            for tz, cal, edges in extended:
+                items = [(hour, minute, on) for hour, times in edges
+                         for minute, on in times]
+                out.write(EXTENSION.pack(tz, cal, len(items)))
+                for item in items:
+                    out.write(EDGE.pack(*item))
+            out.flush()
+            os.fsync(out.fileno())
+        os.rename(temp, path)
+    except Exception:
+        os.unlink(temp)
+        raise
+    return len(entries)
+
+
+def build(path, tags, flavor='function'):
+    """
+    parses tags and writes them to a new cache file
+
+    returns:
+        int: number of entries written
+    """
+    parse = _parser(flavor)
+    entries = {}
+    for tag in tags:
+        key = tag_key(tag)
+        if key not in entries:
+            entries[key] = compile_schedule(parse(tag))
+    return write(path, entries, flavor)
+
+
+def load(path, flavor='function'):
+    """
+    memory maps a cache file. a missing, truncated or outdated file gives
+    an empty DiskCache, which writes a fresh file on save()
+
+    args:
+        path (str):
+            cache file
+        flavor (str):
+            'function' or 'class'
+    returns:
+        DiskCache
+    """
+    store = DiskCache(path, flavor)
+    try:
+        store.open()
+    except (IOError, OSError, ValueError, struct.error):
+        store.close()
+    return store
+
+
+class DiskCache(object):
+    """
+    read only view of a cache file, plus the tags compiled since it was
+    opened, which save() merges into a new file.
+
+    args:
+        path (str):
+            cache file
+        flavor (str):
+            'function' or 'class'
+    """
+
+    def __init__(self, path, flavor='function'):
+        self.path = path
+        self.flavor = flavor
+        self.parse = _parser(flavor)
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self._map = None
+        self._slots = 0
+        self._count = 0
+        self._names = []
+        self._extended = []
+        self._decoded = {}
+
+    def open(self):
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, grammar, flavor, slots, count, named, extended = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC or fmt != FORMAT_VERSION or \
+                grammar != GRAMMAR_VERSION or flavor != FLAVORS[self.flavor]:
+            raise ValueError('outdated cache file %s' % self.path)
+        pos = HEADER.size + slots * RECORD.size
+        if len(self._map) < pos:
+            raise ValueError('truncated cache file %s' % self.path)
+        names = []
+        for _ in xrange(named):
+            (length,) = TZ_LENGTH.unpack_from(self._map, pos)
+            pos += TZ_LENGTH.size
+            names.append(self._map[pos:pos + length])
+            pos += length
+        # schedules with times off the hour or a calendar are rare, their
+        # extensions are read up front
+        extensions = []
+        for _ in xrange(extended):
+            tz, cal, length = EXTENSION.unpack_from(self._map, pos)
+            pos += EXTENSION.size
+            times = {}
+            for _ in xrange(length):
+                hour, minute, on = EDGE.unpack_from(self._map, pos)
+                pos += EDGE.size
+                times.setdefault(hour, []).append((minute, bool(on)))
+            extensions.append((
+                names[tz], dict((h, tuple(t)) for h, t in times.iteritems()),
+                None if cal == NO_NAME else names[cal]))
+        self._slots, self._count, self._names = slots, count, names
+        self._extended = extensions
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._slots = self._count = 0
+        self._names = []
+        self._extended = []
+        self._decoded.clear()
+
+    def __len__(self):
+        return self._count + len(self.pending)
+
+    def _slot(self, key):
+        # index of the record holding key, or None
+        if not self._slots:
+            return None
+        mask = self._slots - 1
+        i = key & mask
+        while True:
+            found = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)[0]
+            if found == key:
+                return i
+            if not found:
+                return None
+            i = (i + 1) & mask
+
+    def get(self, tag, default=None):
+        """
+        returns the CompiledSchedule of a tag, None if the tag is invalid or
+        default if it is not cached
+        """
+        key = tag_key(tag)
+        schedule = self.pending.get(key, _missing)
+        if schedule is not _missing:
+            return schedule
+        i = self._slot(key)
+        if i is None:
+            return default
+        schedule = self._decoded.get(i, _missing)
+        if schedule is _missing:
+            schedule = self._decoded[i] = self._decode(i)
+        return schedule
+
+    def compile(self, tag):
+        """
+        returns the CompiledSchedule of a tag, parsing it when it is not in
+        the file. parsed tags are kept for the next save()
+        """
+        schedule = self.get(tag, _missing)
+        if schedule is not _missing:
+            self.hits += 1
+            return schedule
+        self.misses += 1
+        schedule = self.pending[tag_key(tag)] = compile_schedule(self.parse(tag))
+        return schedule
+
+    def entries(self):
+        """
+        returns a dict of tag key -> CompiledSchedule of the file and the
+        pending tags
+        """
+        out = {}
+        for i in xrange(self._slots):
+            key = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)[0]
+            if key:
+                out[key] = self._decode(i)
+        out.update(self.pending)
+        return out
+
+    def _decode(self, i):
+        _, mask, tz, flag = RECORD.unpack_from(
+            self._map, HEADER.size + i * RECORD.size)
+        if flag == INVALID:
+            return None
+        if flag == EXTENDED:
+            tz, edges, cal = self._extended[tz]
+            return CompiledSchedule(_unpack_mask(mask), tz, edges, cal)
+        return CompiledSchedule(_unpack_mask(mask), self._names[tz])
+
+    def save(self):
+        """
+        writes the file and the pending tags to a new file, renamed over the
+        old one, and maps the new file. does nothing without pending tags
+
+        returns:
+            int: number of entries in the file
+        """
+        if not self.pending and self._map is not None:
+            return self._count
+        count = write(self.path, self.entries(), self.flavor)
+        self.close()
+        self.pending = {}
+        self.open()
+        return count
+
+    def stats(self):
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,319 @@
+"""
+dispatch stage for the stop/start decisions of evaluate.evaluate or a
+ScheduleTracker. decisions are coalesced into bulk calls per action and
+group, where the group is the region/account a resource lives in, and the
+calls run on a bounded pool of worker threads behind a token bucket. a call
+failing with a RetryableError (throttling, a timeout) is retried with capped
+exponential backoff and full jitter, any other error fails its resources.
+
+transitions can be spread over a window, such as the first 10 minutes of the
+hour, so a fleet sharing a schedule does not hit the api all at once. each
+resource gets a stable slot of the window from a crc32 of its id.
+
+    >>> backend = dispatcher.FakeBackend(latency=0.02)
+    >>> decisions = evaluate.evaluate(resources, when)
+    >>> result = dispatcher.Dispatcher(backend, workers=8, rate=20).dispatch(
+    ...     decisions, {'i-1': ('us-east-1', '1234'), ...})
+    >>> result.done['stop']
+    set(['i-1', ...])
+"""
+from collections import namedtuple
+import random
+import threading
+import time
+import zlib
+from Queue import Queue
+
+STOP, START = 'stop', 'start'
+
+Batch = namedtuple('Batch', ('action', 'group', 'ids', 'delay'))
+DispatchResult = namedtuple('DispatchResult',
+                            ('done', 'failed', 'calls', 'retries'))
+
+
+class RetryableError(Exception):
+    """
+    raised by a backend for failures worth retrying, such as throttling
+    """
+
+
+def spread(resource_id, window, slots=60):
+    """
+    returns the stable delay (0 - window seconds) of a resource, one of slots
+    evenly spaced delays. crc32 is used instead of hash() so the delay is the
+    same in every process and run, unicode ids are hashed as utf-8
+    """
+    if not window:
+        return 0.0
+    if isinstance(resource_id, unicode):
+        resource_id = resource_id.encode('utf-8')
+    return window * ((zlib.crc32(resource_id) & 0xffffffff) % slots) / \
+        float(slots)
+
+
+def plan(decisions, group_of, max_batch=50, window=0, slots=60):
+    """
+    coalesces decisions into bulk calls
+
+    args:
+        decisions (Decisions):
+            output of evaluate.evaluate or ScheduleTracker.decisions
+        group_of (dict or callable):
+            resource id -> hashable group such as (region, account). resources
+            missing from a dict are in the None group
+        max_batch (int):
+            most resource ids per call
+        window (float):
+            seconds to spread the calls over
+        slots (int):
+            number of distinct delays in the window
+    returns:
+        list: Batch tuples ordered by delay
+    """
+    if not callable(group_of):
+        group_of = group_of.get
+    pending = {}
+    for action, ids in ((STOP, decisions.stop), (START, decisions.start)):
+        for resource_id in ids:
+            key = (spread(resource_id, window, slots), action,
+                   group_of(resource_id))
+            pending.setdefault(key, []).append(resource_id)
+    out = []
+    for (delay, action, group), ids in sorted(pending.iteritems()):
+        ids.sort()
+        for i in xrange(0, len(ids), max_batch):
+            out.append(Batch(action, group, ids[i:i + max_batch], delay))
+    return out
+
+
+def backoff(attempt, base=0.5, cap=30.0, rng=random):
+    """
+    returns the delay before retry number attempt (0 based): a uniform draw
+    up to base * 2 ** attempt, capped ("full jitter")
+    """
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket(object):
+    """
+    thread safe token bucket allowing rate calls per second on average and
+    bursts of up to burst calls
+
+    args:
+        rate (float):
+            tokens added per second
+        burst (int):
+            bucket size, defaults to rate
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.clock = clock
+        self.sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self):
+        """
+        takes a token if one is available, returns the seconds to wait
+        otherwise (0 when the token was taken)
+        """
+        with self._lock:
+            self._refill()
+            # a refill can land a rounding error short of a whole token
+            if self.tokens >= 1 - 1e-9:
+                self.tokens = max(self.tokens - 1, 0.0)
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        blocks until a token is taken
+        """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            self.sleep(wait)
+
+
+class Dispatcher(object):
+    """
+    runs the bulk calls of a set of decisions. the backend has a stop and a
+    start method taking a group and a list of resource ids.
+
+    args:
+        backend:
+            cloud api client, see FakeBackend
+        workers (int):
+            calls in flight at most
+        rate (float or None):
+            calls per second across all workers, None for no limit
+        burst (int):
+            calls allowed at once when the bucket is full
+        max_batch (int):
+            most resource ids per call
+        retries (int):
+            retries of a call failing with a RetryableError
+        base_delay, max_delay (float):
+            backoff of the retries in seconds
+        window (float):
+            seconds to spread the calls over
+        slots (int):
+            number of distinct delays in the window
+    """
+
+    def __init__(self, backend, workers=8, rate=None, burst=None,
+                 max_batch=50, retries=5, base_delay=0.5, max_delay=30.0,
+                 window=0, slots=60, clock=time.time, sleep=time.sleep,
+                 seed=None):
+        self.backend = backend
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst, clock, sleep) \
+            if rate else None
+        self.max_batch = max_batch
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.slots = slots
+        self.clock = clock
+        self.sleep = sleep
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def plan(self, decisions, group_of):
+        return plan(decisions, group_of, self.max_batch, self.window,
+                    self.slots)
+
+    def dispatch(self, decisions, group_of):
+        """
+        issues the stop and start calls of decisions and waits for them
+
+        args:
+            decisions (Decisions):
+                output of evaluate.evaluate or ScheduleTracker.decisions
+            group_of (dict or callable):
+                resource id -> group such as (region, account)
+        returns:
+            DispatchResult: done is a dict of action -> set of resource ids,
+            failed a dict of resource id -> error message, plus the number of
+            calls made and of retries among them
+        """
+        batches = self.plan(decisions, group_of)
+        result = DispatchResult({STOP: set(), START: set()}, {}, [0], [0])
+        queue = Queue()
+        for batch in batches:
+            queue.put(batch)
+        start = self.clock()
+        threads = []
+        for _ in xrange(min(self.workers, len(batches))):
+            queue.put(None)
+            thread = threading.Thread(target=self._work,
+                                      args=(queue, start, result))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return result._replace(calls=result.calls[0],
+                               retries=result.retries[0])
+
+    def _work(self, queue, start, result):
+        # batches come out in delay order, None tells the worker to stop
+        while True:
+            batch = queue.get()
+            if batch is None:
+                return
+            wait = start + batch.delay - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            self._call(batch, result)
+
+    def _call(self, batch, result):
+        call = getattr(self.backend, batch.action)
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            with self._lock:
+                result.calls[0] += 1
+            try:
+                call(batch.group, batch.ids)
+            except RetryableError as e:
+                if attempt >= self.retries:
+                    return self._failed(batch, e, result)
+                with self._lock:
+                    result.retries[0] += 1
+                    delay = backoff(attempt, self.base_delay, self.max_delay,
+                                    self._rng)
+                self.sleep(delay)
+                attempt += 1
+            except Exception as e:
+                return self._failed(batch, e, result)
+            else:
+                with self._lock:
+                    result.done[batch.action].update(batch.ids)
+                return
+
+    def _failed(self, batch, error, result):
+        message = str(error) or error.__class__.__name__
+        with self._lock:
+            for resource_id in batch.ids:
+                result.failed[resource_id] = message
+
+
+class FakeBackend(object):
+    """
+    in memory stand in for a cloud api, for tests and benchmarks. each call
+    sleeps for latency seconds, throttle is the chance a call raises a
+    RetryableError and calls with more than max_batch ids are rejected.
+    states holds the last action applied to each resource.
+    """
+
+    def __init__(self, latency=0.0, throttle=0.0, max_batch=None, seed=0,
+                 sleep=time.sleep):
+        self.latency = latency
+        self.throttle = throttle
+        self.max_batch = max_batch
+        self.sleep = sleep
+        self.states = {}
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _apply(self, action, group, ids):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            throttled = self._rng.random() < self.throttle
+        try:
+            if self.latency:
+                self.sleep(self.latency)
+            if self.max_batch is not None and len(ids) > self.max_batch:
+                raise ValueError('at most %d ids per call' % self.max_batch)
+            if throttled:
+                raise RetryableError('throttled')
+            with self._lock:
+                self.calls.append((action, group, len(ids)))
+                for resource_id in ids:
+                    self.states[resource_id] = action
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def stop(self, group, ids):
+        self._apply(STOP, group, ids)
+
+    def start(self, group, ids):
+        self._apply(START, group, ids)
@@ -0,0 +1,183 @@
+from collections import namedtuple
+
+import calendars
+from canonical import fingerprint_key
+from compiled import compile_schedule
+from function_parser import parse_off_hours
+import timezones
+
+_missing = object()
+
+# imported on the first fan out rather than with the module, None when it is
+# not installed
+numpy = _missing
+
+Decisions = namedtuple('Decisions', ('stop', 'start', 'noop'))
+
+# per resource states after evaluation
+NOOP, START, STOP = 0, 1, 2
+
+
+def compile_tags(tags, parse=parse_off_hours, store=None):
+    """
+    parses and compiles every distinct tag string once
+
+    args:
+        tags (iterable):
+            tag strings, duplicates are fine
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+        store (DiskCache):
+            persistent cache to take the compiled schedules from, parse is
+            not used when given
+    returns:
+        dict: tag string -> CompiledSchedule or None if the tag is invalid
+    """
+    compiled = {}
+    for tag in tags:
+        if tag not in compiled:
+            if store is not None:
+                compiled[tag] = store.compile(tag)
+            else:
+                compiled[tag] = compile_schedule(parse(tag))
+    return compiled
+
+
+def schedule_states(schedules, when):
+    """
+    returns the NOOP/START/STOP state of each compiled schedule at when. the
+    local (weekday, hour, minute) is only worked out once per timezone, and
+    the exception calendars are looked up once per calendar and timezone.
+
+    args:
+        schedules (list):
+            CompiledSchedule or None entries
+        when (datetime):
+            utc instant to evaluate at
+    returns:
+        list: one state per schedule
+    """
+    slots = {}
+    exceptions = {}
+    states = []
+    for schedule in schedules:
+        if schedule is None or not schedule.scheduled:
+            states.append(NOOP)
+            continue
+        if schedule.cal is not None:
+            key = (schedule.cal, schedule.tz)
+            forced = exceptions.get(key, _missing)
+            if forced is _missing:
+                forced = exceptions[key] = calendars.state_at(
+                    schedule.cal, when, schedule.tz)
+            if forced is not None:
+                states.append(START if forced == calendars.ON else STOP)
+                continue
+            # a tag with only a calendar, like cal=maint, does nothing
+            # outside of the calendar intervals
+            if not schedule.weekly:
+                states.append(NOOP)
+                continue
+        local = slots.get(schedule.tz)
+        if local is None:
+            local = slots[schedule.tz] = timezones.local_time(when, schedule.tz)
+        states.append(START if schedule.is_on(*local) else STOP)
+    return states
+
+
+def evaluate(resources, when, parse=parse_off_hours, store=None):
+    """
+    decides which resources should be stopped or started at a point in time.
+    identical tag strings are parsed once and each distinct schedule is
+    evaluated once, then the results are fanned out to the resources.
+
+    args:
+        resources (iterable):
+            (resource_id, tag_value) pairs
+        when (datetime):
+            utc instant to evaluate at, naive datetimes are treated as utc
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+        store (DiskCache):
+            persistent cache of compiled schedules to use instead of parse
+    returns:
+        Decisions: sets of resource ids to stop and start, and the ones with
+        no (or an invalid) schedule in noop
+    """
+    ids = []
+    codes = []
+    index = {}
+    for resource_id, tag in resources:
+        code = index.get(tag)
+        if code is None:
+            code = index[tag] = len(index)
+        ids.append(resource_id)
+        codes.append(code)
+    compiled = compile_tags(index, parse, store)
+    # spellings of the same schedule share one evaluation
+    unique, per_tag = distinct_schedules(
+        [compiled[t] for t in sorted(index, key=index.get)])
+    states = schedule_states(unique, when)
+    return fan_out(ids, codes, [states[i] for i in per_tag])
+
+
+def distinct_schedules(schedules):
+    """
+    groups compiled schedules by canonical.fingerprint_key, so spellings that
+    only differ in syntax or in the timezone alias, like tz=pt and tz=pst,
+    are evaluated once
+
+    args:
+        schedules (list):
+            CompiledSchedule or None entries
+    returns:
+        tuple: (unique, codes) with the first schedule of each fingerprint
+        in unique and the index in unique of each schedule in codes
+    """
+    index = {}
+    unique = []
+    codes = []
+    for schedule in schedules:
+        key = fingerprint_key(schedule)
+        code = index.get(key)
+        if code is None:
+            code = index[key] = len(unique)
+            unique.append(schedule)
+        codes.append(code)
+    return unique, codes
+
+
+def get_numpy():
+    """
+    returns the numpy module, or None if it is not installed. the import is
+    attempted once, on first use
+    """
+    global numpy
+    if numpy is _missing:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+def fan_out(ids, codes, states):
+    """
+    builds Decisions from per schedule states. codes[i] is the index in
+    states of the schedule of resource ids[i]
+    """
+    numpy = get_numpy() if ids else None
+    if numpy is not None:
+        per_resource = numpy.asarray(states, dtype=numpy.int8)[
+            numpy.asarray(codes, dtype=numpy.intp)]
+        return Decisions(
+            set(ids[i] for i in numpy.flatnonzero(per_resource == STOP)),
+            set(ids[i] for i in numpy.flatnonzero(per_resource == START)),
+            set(ids[i] for i in numpy.flatnonzero(per_resource == NOOP))
+        )
+    out = (set(), set(), set())
+    # STOP, START and NOOP map to the stop, start and noop positions
+    for resource_id, code in zip(ids, codes):
+        out[2 - states[code]].add(resource_id)
+    return Decisions(*out)
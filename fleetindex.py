@@ -0,0 +1,437 @@
+"""
+inverted index of a fleet for dashboard and capacity planning questions such
+as "which resources go off at 19:00 pacific on friday" or "how many are up on
+sunday at 10:00". every distinct schedule is filed under the
+(tz, weekday, hour, state) slots of its week, and every resource gets a
+numbered row, so an answer is the union of the rows of the few schedules in a
+slot, held as an int bitmap the same way the weekly masks are:
+
+    >>> index = fleetindex.FleetIndex()
+    >>> index.update(resources)
+    >>> going_off = index.changes('pt', 4, 19, 'off')
+    >>> weekend = index.at('pt', 6, 10)
+    >>> index.count('pt', 6, 10)
+    4213
+    >>> sorted(going_off & weekend)     # off friday evening, up on sunday
+    ['i-1', ...]
+
+like ScheduleTracker, resources are added, retagged and removed one delta at a
+time and only changed tags are parsed. the slots follow the weekly rules at
+the start of each local hour, at_time looks the schedules changing within the
+hour up at the minute. exception calendars are not applied.
+"""
+from binascii import hexlify, unhexlify
+from itertools import chain
+import operator
+
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+from compiled import ALL_ON, HOURS_PER_WEEK, MINUTES_PER_HOUR, \
+    compile_schedule, slot
+from function_parser import parse_off_hours
+import timezones
+
+_missing = object()
+
+OFF, ON = 'off', 'on'
+
+# schedules holding more than 1 / BIG_SHARE of the rows keep a bitmap of
+# their own between changes, the rows of the others are set one by one
+BIG_SHARE = 64
+
+# the set bits of every byte value
+_byte_bits = [tuple(i for i in xrange(8) if byte >> i & 1)
+              for byte in xrange(256)]
+
+
+def bitmap(rows, size):
+    """
+    returns the int bitmap of rows, all below size, with bit n for row n
+    """
+    buf = bytearray((size + 7) >> 3)
+    for row in rows:
+        buf[row >> 3] |= 1 << (row & 7)
+    if not buf:
+        return 0
+    buf.reverse()
+    return int(hexlify(buf), 16)
+
+
+def bit_rows(bits):
+    """
+    returns the rows set in an int bitmap in increasing order
+    """
+    digits = '%x' % bits
+    if len(digits) & 1:
+        digits = '0' + digits
+    buf = bytearray(unhexlify(digits))
+    buf.reverse()
+    out = []
+    extend = out.extend
+    base = 0
+    for byte in buf:
+        if byte:
+            extend([base + bit for bit in _byte_bits[byte]])
+        base += 8
+    return out
+
+
+def week_slots(schedule):
+    """
+    returns the weekly slots (0 - 167) of a compiled schedule as three lists:
+    on at the start of the slot, turning on within the slot and turning off
+    within the slot
+    """
+    mask = schedule.mask
+    if schedule.edges is None:
+        # a slot changes when its bit differs from the bit of the slot before
+        before = (mask << 1 | mask >> (HOURS_PER_WEEK - 1)) & ALL_ON
+        changed = mask ^ before
+        return (bit_rows(mask), bit_rows(changed & mask),
+                bit_rows(changed & ~mask))
+    turning = {ON: set(), OFF: set()}
+    for minute, state in schedule.changes():
+        turning[state].add(minute // MINUTES_PER_HOUR)
+    return bit_rows(mask), sorted(turning[ON]), sorted(turning[OFF])
+
+
+class ZoneSlots(object):
+    """
+    the codes of the indexed schedules of one timezone, and by weekly slot
+    the ones on at the start of the slot and the ones turning on or off
+    within it. the off codes of a slot are the codes less the on ones, so a
+    schedule is only filed under the slots it is on
+    """
+
+    __slots__ = ('codes', 'on', 'changes')
+
+    def __init__(self):
+        self.codes = set()
+        self.on = [set() for _ in xrange(HOURS_PER_WEEK)]
+        self.changes = dict((state, [set() for _ in xrange(HOURS_PER_WEEK)])
+                            for state in (ON, OFF))
+
+    def tables(self):
+        # in the order of week_slots
+        return self.on, self.changes[ON], self.changes[OFF]
+
+    def state(self, i, state):
+        if state == ON:
+            return self.on[i]
+        return self.codes - self.on[i]
+
+
+class ResourceSet(object):
+    """
+    resources of a FleetIndex as an int bitmap of their rows. sets of the same
+    index combine with &, |, - and ^, and iterating yields the resource ids.
+
+    rows are reused once their resource is removed, so a set only holds the
+    resources it was built from until the index changes, set(resources) keeps
+    the ids
+    """
+
+    __slots__ = ('index', 'bits')
+
+    def __init__(self, index, bits=0):
+        self.index = index
+        self.bits = bits
+
+    def _combine(self, other, op):
+        if not isinstance(other, ResourceSet) or other.index is not self.index:
+            return NotImplemented
+        return ResourceSet(self.index, op(self.bits, other.bits))
+
+    def __and__(self, other):
+        return self._combine(other, operator.and_)
+
+    def __or__(self, other):
+        return self._combine(other, operator.or_)
+
+    def __xor__(self, other):
+        return self._combine(other, operator.xor)
+
+    def __sub__(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __nonzero__(self):
+        return bool(self.bits)
+
+    def __iter__(self):
+        ids = self.index._ids
+        return (ids[row] for row in bit_rows(self.bits))
+
+    def __contains__(self, resource_id):
+        row = self.index._rows.get(resource_id)
+        return row is not None and bool(self.bits >> row & 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, ResourceSet):
+            return NotImplemented
+        return self.index is other.index and self.bits == other.bits
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'ResourceSet(%d resources)' % len(self)
+
+
+class FleetIndex(object):
+    """
+    index from (tz, weekday, hour, state) to the resources in that state, and
+    to the resources changing to that state within the hour. timezones are
+    resolved, so 'pt', 'pst' and 'America/Los_Angeles' are the same slots.
+
+    args:
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+        cache_size (int):
+            distinct tags to keep compiled
+    """
+
+    def __init__(self, parse=parse_off_hours, cache_size=DEFAULT_CACHE_SIZE):
+        self.parse = parse
+        self.parses = 0
+        self._compiled = LRUCache(cache_size)
+        self._tags = {}
+        # resource id -> row, and row -> resource id and schedule code.
+        # distinct schedules are numbered so the slot sets hold ints
+        self._rows = {}
+        self._ids = []
+        self._code_of = []
+        self._free = []
+        self._codes = {}
+        self._schedules = {}
+        self._next_code = 0
+        # schedule code -> rows, and bitmaps of the rows of big schedules
+        self._members = {}
+        self._bitmaps = {}
+        self._unscheduled = set()
+        # resolved zone -> ZoneSlots
+        self._zones = {}
+        # answers by slot, dropped on every change
+        self._answers = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _compile(self, tag):
+        schedule = self._compiled.get(tag, _missing)
+        if schedule is _missing:
+            self.parses += 1
+            schedule = compile_schedule(self.parse(tag))
+            self._compiled.put(tag, schedule)
+        return schedule
+
+    def _index(self, code, schedule):
+        if schedule is None or not schedule.scheduled:
+            self._unscheduled.add(code)
+            return
+        zone = timezones.resolve(schedule.tz)
+        slots = self._zones.get(zone)
+        if slots is None:
+            slots = self._zones[zone] = ZoneSlots()
+        slots.codes.add(code)
+        for table, rows in zip(slots.tables(), week_slots(schedule)):
+            for i in rows:
+                table[i].add(code)
+
+    def _unindex(self, code, schedule):
+        if schedule is None or not schedule.scheduled:
+            self._unscheduled.discard(code)
+            return
+        zone = timezones.resolve(schedule.tz)
+        slots = self._zones[zone]
+        slots.codes.discard(code)
+        if not slots.codes:
+            del self._zones[zone]
+            return
+        for table, rows in zip(slots.tables(), week_slots(schedule)):
+            for i in rows:
+                table[i].discard(code)
+
+    def _attach(self, resource_id, schedule):
+        code = self._codes.get(schedule)
+        if code is None:
+            code = self._codes[schedule] = self._next_code
+            self._next_code += 1
+            self._schedules[code] = schedule
+            self._members[code] = set()
+            self._index(code, schedule)
+        if self._free:
+            row = self._free.pop()
+            self._ids[row] = resource_id
+            self._code_of[row] = code
+        else:
+            row = len(self._ids)
+            self._ids.append(resource_id)
+            self._code_of.append(code)
+        self._rows[resource_id] = row
+        self._members[code].add(row)
+        self._bitmaps.pop(code, None)
+        self._answers.clear()
+
+    def _detach(self, resource_id):
+        row = self._rows.pop(resource_id)
+        code = self._code_of[row]
+        self._ids[row] = self._code_of[row] = None
+        self._free.append(row)
+        members = self._members[code]
+        members.discard(row)
+        self._bitmaps.pop(code, None)
+        if not members:
+            del self._members[code]
+            schedule = self._schedules.pop(code)
+            del self._codes[schedule]
+            self._unindex(code, schedule)
+        self._answers.clear()
+
+    def update(self, resources):
+        """
+        adds resources or changes their tags. resources whose tag did not
+        change are skipped without parsing
+
+        args:
+            resources (iterable or dict):
+                (resource_id, tag_value) pairs
+        """
+        if isinstance(resources, dict):
+            resources = resources.iteritems()
+        for resource_id, tag in resources:
+            old = self._tags.get(resource_id, _missing)
+            if old == tag:
+                continue
+            if old is not _missing:
+                self._detach(resource_id)
+            self._tags[resource_id] = tag
+            self._attach(resource_id, self._compile(tag))
+
+    def remove(self, resource_ids):
+        for resource_id in resource_ids:
+            if self._tags.pop(resource_id, _missing) is not _missing:
+                self._detach(resource_id)
+
+    def apply(self, added=(), changed=(), removed=()):
+        """
+        applies one delta of the inventory feed, see ScheduleTracker.apply
+        """
+        self.remove(removed)
+        self.update(added)
+        self.update(changed)
+
+    def _union(self, codes):
+        # big schedules are or-ed in as whole bitmaps, the rows of the long
+        # tail are set in a single pass
+        size = len(self._ids)
+        big = size // BIG_SHARE
+        bits = 0
+        small = []
+        for code in codes:
+            members = self._members[code]
+            if len(members) > big:
+                cached = self._bitmaps.get(code)
+                if cached is None:
+                    cached = self._bitmaps[code] = bitmap(members, size)
+                bits |= cached
+            else:
+                small.append(members)
+        if small:
+            bits |= bitmap(chain.from_iterable(small), size)
+        return bits
+
+    def _slot(self, changes, tz, weekday, hour, state):
+        # the schedule codes of a slot and the key of its answer
+        if state not in (OFF, ON):
+            raise ValueError('invalid state %r' % (state,))
+        zone = timezones.resolve(tz)
+        i = slot(weekday, hour)
+        key = (changes, zone, i, state)
+        slots = self._zones.get(zone)
+        if slots is None:
+            return key, ()
+        if changes:
+            return key, slots.changes[state][i]
+        return key, slots.state(i, state)
+
+    def _answer(self, changes, tz, weekday, hour, state):
+        key, codes = self._slot(changes, tz, weekday, hour, state)
+        bits = self._answers.get(key)
+        if bits is None:
+            bits = self._answers[key] = self._union(codes)
+        return ResourceSet(self, bits)
+
+    def at(self, tz, weekday, hour, state=ON):
+        """
+        returns the resources in tz whose schedule is in state at the start
+        of a local weekday (0 = Monday) and hour
+
+        returns:
+            ResourceSet
+        """
+        return self._answer(False, tz, weekday, hour, state)
+
+    def changes(self, tz, weekday, hour, state=OFF):
+        """
+        returns the resources in tz whose schedule changes to state within a
+        local weekday (0 = Monday) and hour, 19:00 and 19:30 both count for
+        hour 19
+
+        returns:
+            ResourceSet
+        """
+        return self._answer(True, tz, weekday, hour, state)
+
+    def count(self, tz, weekday, hour, state=ON):
+        """
+        returns len(at(tz, weekday, hour, state)) without building the set
+        """
+        members = self._members
+        return sum(len(members[code])
+                   for code in self._slot(False, tz, weekday, hour, state)[1])
+
+    def at_time(self, when, state=ON):
+        """
+        returns the resources in state at a utc instant, each in its own
+        timezone. the local time is worked out once per timezone, and the
+        schedules changing state within the local hour, like 19:30, are
+        looked up at the minute
+
+        returns:
+            ResourceSet
+        """
+        on = state == ON
+        codes = []
+        for zone, slots in self._zones.iteritems():
+            weekday, hour, minute = timezones.local_time(when, zone)
+            found = self._slot(False, zone, weekday, hour, state)[1]
+            i = slot(weekday, hour)
+            changing = slots.changes[ON][i] | slots.changes[OFF][i]
+            if minute and changing:
+                found = set(found)
+                for code in changing:
+                    if self._schedules[code].is_on(weekday, hour, minute) == on:
+                        found.add(code)
+                    else:
+                        found.discard(code)
+            codes.extend(found)
+        return ResourceSet(self, self._union(codes))
+
+    def unscheduled(self):
+        """
+        returns the resources with no schedule or an invalid one
+        """
+        return ResourceSet(self, self._union(self._unscheduled))
+
+    def all(self):
+        """
+        returns every resource in the index
+        """
+        return ResourceSet(self, self._union(self._members))
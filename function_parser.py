@@ -1,26 +1,27 @@
-from itertools import cycle
-import re
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+from calendars import valid_name
+import instrument
+from timezones import tz_aliases, default_tz
+from tokenizer import tokenize, scan_items, iter_items, KEY, VALUE, DAY, \
+    RANGE, HOUR, MINUTE
 
 valid_days = ('M', 'T', 'W', 'H', 'F', 'S', 'U')
 valid_hours = tuple(h for h in xrange(1, 25))
-valid_keys = ("off", "on", "tz")
-
-tz_aliases = {
-    'pdt': 'America/Los_Angeles',
-    'pt': 'America/Los_Angeles',
-    'pst': 'America/Los_Angeles',
-    'est': 'America/New_York',
-    'edt': 'America/New_York',
-    'et': 'America/New_York',
-    'cst': 'America/Chicago',
-    'cdt': 'America/Chicago',
-    'ct': 'America/Chicago',
-    'mt': 'America/Denver',
-    'gmt': 'Europe/London',
-    'gt': 'Europe/London'
-}
-
-default_tz = 'et'
+valid_minutes = tuple(m for m in xrange(60))
+valid_keys = ("off", "on", "tz", "cal")
+
+#expanded day ranges, including circular ones like F-T, keyed by (start, end)
+day_ranges = dict(
+    ((a, b), tuple(valid_days[(i + n) % 7] for n in xrange((j - i) % 7 + 1)))
+    for i, a in enumerate(valid_days)
+    for j, b in enumerate(valid_days)
+    if a != b
+)
+single_days = dict((d, (d,)) for d in valid_days)
+
+#parsed schedules keyed by the raw tag string, invalid ones are cached as None
+cache = LRUCache(DEFAULT_CACHE_SIZE)
+_missing = object()
 
 
 def valid_day_range(days):
@@ -76,15 +77,8 @@ def parse_time(days, hour):
 
     #if a day range
     if not days in valid_days and len(days) == 3:
-        inrange = False
-        for d in cycle(valid_days):
-            if days[0] == d:
-                inrange = True
-            if inrange:
-                out.append({ "days": d, "hour": hour })
-            if days[2] == d and inrange:
-                inrange = False
-                break
+        for d in day_ranges[(days[0], days[2])]:
+            out.append({ "days": d, "hour": hour })
     #single day
     else:
         out.append({ "days": days, "hour": hour })
@@ -114,49 +108,126 @@ def parse_keys(item):
                     { "days": "U", "hour": 18 }
                     ]}
 
-            or {'tz': 'et'} if it is a timezone key
+            or {'tz': 'et'} if it is a timezone key, {'cal': 'us'} for a
+            calendar
 
             if it is malformed or there is a error then it will return None
     """
-    out = {}
-    tl = []
-    pair = item.split("=")
-    if len(pair) != 2: return None #must be only 1 '='
-    key, values = pair[0], pair[1]
-    #remove [] from the string
-    values = values.translate(None, "[]")
-    if key in ('tz'):
-        #defaut tz
-        out[key] = default_tz
-        if values in tz_aliases:
-            out[key] = values
-        return out
+    return _parse_item(tokenize(item))
+
+
+def _parse_item(tokens):
+    #builds the output of parse_keys from the tokens of a single item
+    item = _item_rules(tokens)
+    if item is None:
+        return None
+    key, value = item
+    if key == 'tz' or key == 'cal':
+        return {key: value}
+    return {key: _expand_rules(value)}
+
+
+def _expand_rules(rules):
+    #one dict per day, the format returned by parse_off_hours. the minute is
+    #only there for times off the hour like 19:30
+    out = []
+    for rule in rules:
+        if len(rule) == 2:
+            out.extend({ "days": d, "hour": rule[1] } for d in rule[0])
+        else:
+            out.extend({ "days": d, "hour": rule[1], "minute": rule[2] }
+                       for d in rule[0])
+    return out
+
+
+def _item_rules(tokens):
+    #returns (key, value) for the tokens of a single item where the value of
+    #off and on is a list of (days, hour) tuples, or (days, hour, minute) for
+    #a time off the hour, or None if it is malformed
+    if not tokens or tokens[0].kind is not KEY:
+        return None
+    key = tokens[0].value
+    if key == 'tz':
+        #a second '=' like tz=pt=x is malformed
+        if len(tokens) != 2 or tokens[1].kind is not VALUE:
+            return None
+        #brackets are allowed around the value, tz=[pt]
+        value = tokens[1].value.strip('[]')
+        if value in tz_aliases:
+            return key, value
+        #defaut tz for an unknown alias
+        return key, default_tz
+    elif key == 'cal':
+        #a calendar name, see calendars.py
+        if len(tokens) == 2 and tokens[1].kind is VALUE and \
+                valid_name(tokens[1].value):
+            return key, tokens[1].value
+        return None
     #if someone passes a bad key then return None
     elif key in ('off', 'on'):
-        #extract tuples. as long as the string is in the format
-        # (aaa) (aaa) (aaa) it should be fine
-        pattern = re.compile(r'\(([^)]*)\)')
-        values = pattern.findall(values)
-        out[key] = None #setup blank key
-        for time in values: #iterate through list of dates
-            time = time.split(",")
-            if len(time) != 2: return None #we should be receiving 2 items
-            #call parse_time. if it fails we will return None for malformed.
-            try:
-                pt = parse_time(time[0], int(time[1]))
-            except:
+        rules = []
+        days = None
+        for token in tokens[1:]:
+            kind = token.kind
+            if kind is HOUR:
+                hour = token.value
+                if not hour in valid_hours: return None
+                if days.kind is DAY:
+                    rules.append((single_days[days.value], hour))
+                else:
+                    #a range like M-M is not valid
+                    expanded = day_ranges.get(days.value)
+                    if expanded is None: return None
+                    rules.append((expanded, hour))
+            elif kind is MINUTE:
+                minute = token.value
+                #24:00 is the last valid time of a day
+                if not minute in valid_minutes or (minute and hour == 24):
+                    return None
+                if minute:
+                    rules[-1] += (minute,)
+            elif kind is DAY or kind is RANGE:
+                days = token
+            else:
+                #scan errors, or a second item passed to parse_keys
                 return None
-            #If we get an empty list then we should return None
-            if not len(pt): return None
-            #append the lists if we have more than one
-            tl = tl + pt
-        #set the key to the final list of times
-        out[key] = tl
-        return out
+        return key, rules
     else:
         return None
 
 
+def parse_rules(offhours):
+    """
+    parses a schedule like parse_off_hours, without expanding the days into
+    one dict per day. off and on are lists of (days, hour) tuples where days
+    is a tuple of the days in the range, or (days, hour, minute) for a time
+    like 19:30. results are not cached.
+
+        parse_rules("off=[(M-F,21),(U,18:30)];tz=pt")
+        {'off': [(('M', 'T', 'W', 'H', 'F'), 21), (('U',), 18, 30)], 'tz': 'pt'}
+
+    args:
+        offhours (str):
+            string denoting a desired offhours schedule
+    returns:
+        dict or None
+    """
+    return _collect_rules(iter_items(offhours))
+
+
+def _collect_rules(items):
+    output = {}
+    for item in items:
+        p = _item_rules(item)
+        if p is None:
+            return None
+        output[p[0]] = p[1]
+    #if no tz then set the default one
+    if not output.get('tz'):
+        output['tz'] = default_tz
+    return output
+
+
 def parse_off_hours(offhours):
     """
     main function whcich would be the starting point. it will parse out the
@@ -184,17 +255,49 @@ def parse_off_hours(offhours):
             string denoting a desired offhours schedule
     returns:
         dict or None
+
+    results are memoized in the module level cache, so callers share the
+    returned dict and should not modify it
     """
-    #create our base items
-    output = {}
-    items = offhours.split(';')
-    for item in items:
-        p = parse_keys(item)
-        if not p:
-            return None
-        else:
-            output.update(p)
-    #if no tz then set the default one
-    if not output.get('tz'):
-        output['tz'] = default_tz
+    if instrument.enabled:
+        return _parse_instrumented(offhours)
+    output = cache.get(offhours, _missing)
+    if output is not _missing:
+        return output
+    output = _parse_off_hours(offhours)
+    cache.put(offhours, output)
+    return output
+
+
+def _parse_off_hours(offhours):
+    return _expand_schedule(parse_rules(offhours))
+
+
+def _expand_schedule(rules):
+    if rules is None:
+        return None
+    for key in ('off', 'on'):
+        if key in rules:
+            rules[key] = _expand_rules(rules[key])
+    return rules
+
+
+def _parse_instrumented(offhours):
+    #parse_off_hours with each stage reported to the instrument sinks
+    output = cache.get(offhours, _missing)
+    if output is not _missing:
+        instrument.count('cache_hits', parser='function')
+        return output
+    instrument.count('cache_misses', parser='function')
+    instrument.count('parses', parser='function')
+    with instrument.timer('tokenize', parser='function'):
+        items = scan_items(offhours)
+    with instrument.timer('validate', parser='function'):
+        rules = _collect_rules(items)
+    with instrument.timer('expand', parser='function'):
+        output = _expand_schedule(rules)
+    if output is None:
+        instrument.count('rejections', parser='function',
+                         reason=instrument.rejection_reason(offhours))
+    cache.put(offhours, output)
     return output
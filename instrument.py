@@ -0,0 +1,176 @@
+"""
+opt-in instrumentation of the parse hot paths. disabled by default, in which
+case the parsers only check the module level enabled flag once per call.
+
+    >>> import instrument
+    >>> stats = instrument.MemorySink()
+    >>> instrument.enable(stats)
+    >>> function_parser.parse_off_hours('off=(M-F,19);on=(M-F,7)')
+    >>> print(instrument.prometheus_text(stats))
+
+stages timed by the parsers are 'tokenize' (scanning the tag), 'validate'
+(checking the items, and in the class flavor ScheduleParser.is_valid) and
+'expand' (turning day ranges into per day entries). counters are 'parses',
+'cache_hits', 'cache_misses' and 'rejections' labeled with the reason. every
+event is labeled with the parser flavor.
+"""
+import time
+
+# checked by the parsers, set through enable() and disable()
+enabled = False
+sinks = []
+
+INVALID_VALUE = 'invalid value'
+
+
+def enable(*new_sinks):
+    """
+    turns instrumentation on and sends the events to the given sinks, in
+    addition to any already enabled
+    """
+    global enabled
+    sinks.extend(new_sinks)
+    enabled = bool(sinks)
+
+
+def disable():
+    """
+    turns instrumentation off and drops every sink
+    """
+    global enabled
+    enabled = False
+    del sinks[:]
+
+
+def count(name, value=1, **labels):
+    for sink in sinks:
+        sink.count(name, value, labels)
+
+
+def observe(stage, seconds, **labels):
+    for sink in sinks:
+        sink.observe(stage, seconds, labels)
+
+
+class timer(object):
+    """
+    context manager that reports the time spent in the block as stage
+    """
+
+    __slots__ = ('stage', 'labels', 'start')
+
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.time() - self.start, **self.labels)
+
+
+def rejection_reason(tag, flavor='function'):
+    """
+    returns the reason of the first problem validation.errors() finds in a
+    rejected tag, the scan error or the check that failed such as 'invalid
+    hour', or INVALID_VALUE if it finds none
+    """
+    # validation imports the parsers, which import this module
+    import validation
+    problems = validation.errors(tag, flavor)
+    if problems:
+        return problems[0].reason
+    return INVALID_VALUE
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class MemorySink(object):
+    """
+    in memory aggregator. counters are summed and timers keep the number of
+    observations, the total and the slowest one, per name and labels
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+
+    def count(self, name, value, labels):
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, labels):
+        key = _key(stage, labels)
+        timing = self.timers.get(key)
+        if timing is None:
+            self.timers[key] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+    def counter(self, name, **labels):
+        return self.counters.get(_key(name, labels), 0)
+
+    def timing(self, stage, **labels):
+        """
+        returns (count, total seconds, max seconds) of a stage
+        """
+        return tuple(self.timers.get(_key(stage, labels), (0, 0.0, 0.0)))
+
+    def reset(self):
+        self.counters.clear()
+        self.timers.clear()
+
+
+class LoggingSink(object):
+    """
+    logs every event, meant for debugging a handful of parses
+    """
+
+    def __init__(self, logger=None, level=None):
+        # logging is only imported once a LoggingSink is made
+        import logging
+        self.logger = logger or logging.getLogger('offhours')
+        self.level = logging.DEBUG if level is None else level
+
+    def count(self, name, value, labels):
+        self.logger.log(self.level, 'count %s %s %s', name, value, labels)
+
+    def observe(self, stage, seconds, labels):
+        self.logger.log(self.level, 'stage %s %.6fs %s', stage, seconds, labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels)
+
+
+def prometheus_text(sink, prefix='offhours'):
+    """
+    dumps a MemorySink in the prometheus text exposition format, counters as
+    <prefix>_<name>_total and timers as <prefix>_<stage>_seconds summaries
+    """
+    lines = []
+    for name in sorted(set(n for n, _ in sink.counters)):
+        metric = '%s_%s_total' % (prefix, name)
+        lines.append('# TYPE %s counter' % metric)
+        for (n, labels), value in sorted(sink.counters.items()):
+            if n == name:
+                lines.append('%s%s %s' % (metric, _labels(labels), value))
+    for stage in sorted(set(s for s, _ in sink.timers)):
+        metric = '%s_%s_seconds' % (prefix, stage)
+        lines.append('# TYPE %s summary' % metric)
+        for (s, labels), (n, total, _) in sorted(sink.timers.items()):
+            if s == stage:
+                lines.append('%s_count%s %d' % (metric, _labels(labels), n))
+                lines.append('%s_sum%s %.9f' % (metric, _labels(labels), total))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,225 @@
+"""
+weekly on intervals of a compiled schedule, in minutes from monday 00:00
+local time. runs of on hours are merged and a run that crosses from sunday
+into monday is one interval, stored as its two halves so every interval
+lies within the week. point lookups and on/off time over any range are a
+bisect on the interval starts.
+
+    >>> week = intervals.week_intervals(compile_schedule(parse_off_hours(
+    ...     'off=(M-F,19);on=(M-F,7)')))
+    >>> week.off_minutes(0, intervals.MINUTES_PER_WEEK) / 60
+    108
+"""
+from bisect import bisect_right
+from datetime import datetime
+import re
+
+from cache import LRUCache
+from compiled import CompiledSchedule, MINUTES_PER_HOUR, MINUTES_PER_WEEK
+import timezones
+
+# any monday, local week minutes are counted from it
+EPOCH = datetime(2001, 1, 1)
+
+_runs = re.compile('1+').finditer
+
+# interval sets keyed by weekly pattern, shared by every schedule with it
+_weeks = LRUCache(1024)
+
+
+class WeekIntervals(object):
+    """
+    sorted, disjoint on intervals [start, end) of one week with the on
+    minutes of the week before each one
+
+    args:
+        runs (list):
+            (start, end) minute pairs of the on intervals, sorted
+    """
+
+    __slots__ = ('starts', 'ends', 'before', 'total')
+
+    def __init__(self, runs):
+        self.starts = [s for s, _ in runs]
+        self.ends = [e for _, e in runs]
+        self.before = []
+        total = 0
+        for start, end in runs:
+            self.before.append(total)
+            total += end - start
+        self.total = total
+
+    @classmethod
+    def from_mask(cls, mask):
+        # bit i of the mask is character i of the reversed binary string
+        bits = bin(mask)[:1:-1]
+        return cls([(m.start() * MINUTES_PER_HOUR, m.end() * MINUTES_PER_HOUR)
+                    for m in _runs(bits)])
+
+    @classmethod
+    def from_schedule(cls, schedule):
+        """
+        builds the intervals of a CompiledSchedule, from its mask alone when
+        every transition is on the hour
+        """
+        if schedule.edges is None:
+            return cls.from_mask(schedule.mask)
+        changes = schedule.changes()
+        if not changes:
+            return cls.from_mask(schedule.mask)
+        runs = []
+        ends = [m for m, _ in changes[1:]] + [changes[0][0] + MINUTES_PER_WEEK]
+        for (start, state), end in zip(changes, ends):
+            if state == 'on':
+                # a run wrapping into the next week is split at its end
+                if end > MINUTES_PER_WEEK:
+                    runs.append((0, end - MINUTES_PER_WEEK))
+                    end = MINUTES_PER_WEEK
+                runs.append((start, end))
+        runs.sort()
+        return cls(runs)
+
+    def intervals(self):
+        """
+        returns the merged on intervals as (start, end) minute pairs. an
+        interval wrapping into the next week ends after MINUTES_PER_WEEK
+        """
+        runs = zip(self.starts, self.ends)
+        if len(runs) > 1 and runs[0][0] == 0 and runs[-1][1] == MINUTES_PER_WEEK:
+            first = runs.pop(0)
+            runs[-1] = (runs[-1][0], MINUTES_PER_WEEK + first[1])
+        return runs
+
+    def is_on(self, minute):
+        """
+        returns True if the schedule is on at a minute of the week, minutes
+        outside 0 - MINUTES_PER_WEEK wrap around
+        """
+        minute %= MINUTES_PER_WEEK
+        i = bisect_right(self.starts, minute) - 1
+        return i >= 0 and minute < self.ends[i]
+
+    def _on_before(self, minute):
+        # on minutes from the start of the week up to minute (0 - week)
+        i = bisect_right(self.starts, minute) - 1
+        if i < 0:
+            return 0
+        return self.before[i] + min(minute, self.ends[i]) - self.starts[i]
+
+    def on_minutes(self, start, end):
+        """
+        returns the on minutes between two minute offsets from the start of
+        a week. the range can span any number of weeks
+        """
+        if end <= start:
+            return 0
+        weeks, start = divmod(start, MINUTES_PER_WEEK)
+        end -= weeks * MINUTES_PER_WEEK
+        full, end = divmod(end, MINUTES_PER_WEEK)
+        return full * self.total + self._on_before(end) - self._on_before(start)
+
+    def off_minutes(self, start, end):
+        return max(end - start, 0) - self.on_minutes(start, end)
+
+    def runs(self, start, end):
+        """
+        returns the on intervals between two minute offsets from the start
+        of a week as (start, end) pairs, clipped to the range and merged
+        across the ends of the weeks. the range can span any number of weeks
+        """
+        out = []
+        count = len(self.starts)
+        if end <= start or not count:
+            return out
+        week, offset = divmod(start, MINUTES_PER_WEEK)
+        base = week * MINUTES_PER_WEEK
+        # the first interval ending after start
+        i = bisect_right(self.ends, offset)
+        while base < end:
+            for j in xrange(i, count):
+                run_start = base + self.starts[j]
+                if run_start >= end:
+                    return out
+                run_start = max(run_start, start)
+                run_end = min(base + self.ends[j], end)
+                if out and out[-1][1] == run_start:
+                    out[-1] = (out[-1][0], run_end)
+                else:
+                    out.append((run_start, run_end))
+            base += MINUTES_PER_WEEK
+            i = 0
+        return out
+
+
+def week_intervals(schedule):
+    """
+    returns the cached WeekIntervals of a CompiledSchedule
+    """
+    week = _weeks.get(schedule.pattern)
+    if week is None:
+        week = WeekIntervals.from_schedule(schedule)
+        _weeks.put(schedule.pattern, week)
+    return week
+
+
+def local_minute(when):
+    """
+    returns the minutes from EPOCH to a naive local datetime
+    """
+    delta = when - EPOCH
+    return delta.days * 24 * MINUTES_PER_HOUR + delta.seconds // 60
+
+
+def _compiled(schedule):
+    if schedule is None or isinstance(schedule, CompiledSchedule):
+        return schedule
+    return CompiledSchedule.from_parsed(schedule)
+
+
+def is_off_at(schedule, when, tz=None):
+    """
+    returns True if a schedule is off at a utc instant
+
+    args:
+        schedule (CompiledSchedule or dict):
+            compiled schedule or parse result
+        when (datetime):
+            utc instant, naive datetimes are treated as utc
+        tz (str):
+            timezone to use instead of the schedule's
+    returns:
+        bool: False for an invalid (None) schedule
+    """
+    schedule = _compiled(schedule)
+    if schedule is None:
+        return False
+    local = timezones.to_local(when, tz or schedule.tz)
+    return not week_intervals(schedule).is_on(local_minute(local))
+
+
+def off_hours(schedule, start, end, tz=None):
+    """
+    returns the hours a schedule is off between two utc instants, such as a
+    billing week. both ends are converted to local wall clock time, so the
+    hour gained or lost at a dst change is not accounted for
+
+    args:
+        schedule (CompiledSchedule or dict):
+            compiled schedule or parse result
+        start (datetime):
+            utc start of the range, included
+        end (datetime):
+            utc end of the range, excluded
+        tz (str):
+            timezone to use instead of the schedule's
+    returns:
+        float: 0 for an invalid (None) schedule
+    """
+    schedule = _compiled(schedule)
+    if schedule is None:
+        return 0.0
+    tz = tz or schedule.tz
+    minutes = week_intervals(schedule).off_minutes(
+        local_minute(timezones.to_local(start, tz)),
+        local_minute(timezones.to_local(end, tz)))
+    return minutes / float(MINUTES_PER_HOUR)
@@ -0,0 +1,131 @@
+"""
+opt-in process pool mode for parsing and evaluating very large inventories.
+distinct tags are sharded by a stable hash and every shard goes to the same
+long lived worker process on each call, so each worker parses (and caches)
+its own subset across calls. workers only send back (mask, tz, edges, cal)
+tuples instead of the nested parse dicts to keep pickling cheap. results
+always come back in input order, whatever the number of processes.
+"""
+from multiprocessing import Pool, cpu_count
+import zlib
+
+from bulk import get_parser
+from compiled import CompiledSchedule, compile_schedule
+import evaluate
+
+# single process pools by shard, started on first use and kept between calls
+_pools = []
+
+# parse functions of a worker by flavor, with their caches
+_parsers = {}
+
+
+def shard_of(tag, shards):
+    """
+    returns the shard (0 - shards-1) of a tag string. crc32 is used instead
+    of hash() so the sharding is the same in every process and run, unicode
+    tags are hashed as utf-8
+    """
+    if isinstance(tag, unicode):
+        tag = tag.encode('utf-8')
+    return (zlib.crc32(tag) & 0xffffffff) % shards
+
+
+def _get_pools(processes):
+    while len(_pools) < processes:
+        _pools.append(Pool(1))
+    return _pools[:processes]
+
+
+def close_pools():
+    """
+    stops the worker processes kept between calls
+    """
+    while _pools:
+        pool = _pools.pop()
+        pool.close()
+        pool.join()
+
+
+def _parse_shard(args):
+    flavor, tags = args
+    parse = _parsers.get(flavor)
+    if parse is None:
+        parse = _parsers[flavor] = get_parser(flavor)
+    out = []
+    for tag in tags:
+        schedule = compile_schedule(parse(tag))
+        if schedule is None:
+            out.append((tag, None, None, None, None))
+        else:
+            out.append((tag, schedule.mask, schedule.tz, schedule.edges,
+                        schedule.cal))
+    return out
+
+
+def compile_parallel(tags, processes=None, flavor='function'):
+    """
+    parses and compiles tag strings across a process pool
+
+    args:
+        tags (iterable):
+            tag strings, duplicates are only parsed once
+        processes (int):
+            worker processes, defaults to the number of cpus. 1 parses in
+            this process without starting a pool. the workers are kept for
+            the next call, see close_pools
+        flavor (str):
+            'function' for parse_off_hours, 'class' for ScheduleParser.parse
+    returns:
+        list: a CompiledSchedule or None for each tag, in input order
+    """
+    tags = list(tags)
+    processes = processes or cpu_count()
+    shards = [[] for _ in xrange(processes)]
+    seen = set()
+    for tag in tags:
+        if tag not in seen:
+            seen.add(tag)
+            shards[shard_of(tag, processes)].append(tag)
+    if processes == 1:
+        results = [_parse_shard((flavor, shards[0]))]
+    else:
+        pending = [pool.apply_async(_parse_shard, ((flavor, shard),))
+                   for pool, shard in zip(_get_pools(processes), shards)
+                   if shard]
+        results = [result.get() for result in pending]
+    # identical schedules share one CompiledSchedule
+    interned = {}
+    compiled = {}
+    for result in results:
+        for tag, mask, tz, edges, cal in result:
+            if mask is None:
+                compiled[tag] = None
+            else:
+                schedule = CompiledSchedule(mask, tz, edges, cal)
+                schedule = interned.setdefault(schedule, schedule)
+                compiled[tag] = schedule
+    return [compiled[tag] for tag in tags]
+
+
+def evaluate_parallel(resources, when, processes=None, flavor='function'):
+    """
+    same as evaluate.evaluate with the parsing spread over a process pool
+
+    args:
+        resources (iterable):
+            (resource_id, tag_value) pairs
+        when (datetime):
+            utc instant to evaluate at
+        processes (int):
+            worker processes, defaults to the number of cpus
+        flavor (str):
+            'function' or 'class'
+    returns:
+        Decisions
+    """
+    resources = list(resources)
+    schedules = compile_parallel((tag for _, tag in resources), processes, flavor)
+    unique, codes = evaluate.distinct_schedules(schedules)
+    states = evaluate.schedule_states(unique, when)
+    return evaluate.fan_out([r[0] for r in resources], codes, states)
@@ -0,0 +1,175 @@
+"""
+closed form on/off hour projections over utc date ranges, for questions such
+as how many instance hours off-hours saved last quarter. the range is split
+where the utc offset of the schedule's timezone changes, and within each
+piece the on minutes are whole weeks times the weekly on minutes plus the
+two partial weeks, read from the schedule's WeekIntervals. the work depends
+on the number of distinct schedules and dst changes, not on the length of
+the range or the number of resources.
+"""
+from collections import namedtuple
+
+from compiled import CompiledSchedule
+import evaluate
+from function_parser import parse_off_hours
+from intervals import week_intervals, local_minute, MINUTES_PER_HOUR
+import timezones
+
+Projection = namedtuple('Projection',
+                        ('resources', 'hours', 'on_hours', 'saved_hours'))
+
+
+def offset_segments(tz, start, end):
+    """
+    splits a utc range at the utc offset changes of a timezone
+
+    args:
+        tz (str):
+            alias or IANA zone name
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+    returns:
+        list: (start minute, end minute, offset minutes) with the minutes
+        counted from intervals.EPOCH in utc
+    """
+    start = timezones.utc_naive(start)
+    end = timezones.utc_naive(end)
+    zone = timezones.resolve(tz)
+    changes = []
+    for year in xrange(start.year, end.year + 1):
+        table = timezones.offset_table(zone, year)
+        changes.extend(zip(table.starts, table.offsets))
+    segments = []
+    for i, (begin, offset) in enumerate(changes):
+        stop = changes[i + 1][0] if i + 1 < len(changes) else end
+        begin, stop = max(begin, start), min(stop, end)
+        if begin < stop:
+            segments.append((local_minute(begin), local_minute(stop),
+                             int(offset.total_seconds()) // 60))
+    return segments
+
+
+def _on_minutes(schedule, segments):
+    week = week_intervals(schedule)
+    return sum(week.on_minutes(begin + offset, stop + offset)
+               for begin, stop, offset in segments)
+
+
+def on_hours(schedule, start, end, tz=None):
+    """
+    returns the hours a schedule is on between two utc instants, with the
+    hour lost or gained at each dst change accounted for. a resource with an
+    invalid (None) or no schedule is on the whole time
+
+    args:
+        schedule (CompiledSchedule or dict):
+            compiled schedule or parse result
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+        tz (str):
+            timezone to use instead of the schedule's
+    returns:
+        float
+    """
+    if schedule is not None and not isinstance(schedule, CompiledSchedule):
+        schedule = CompiledSchedule.from_parsed(schedule)
+    if schedule is None or not schedule.scheduled:
+        return _hours(start, end)
+    segments = offset_segments(tz or schedule.tz, start, end)
+    return _on_minutes(schedule, segments) / float(MINUTES_PER_HOUR)
+
+
+def _hours(start, end):
+    minutes = local_minute(timezones.utc_naive(end)) - \
+        local_minute(timezones.utc_naive(start))
+    return max(minutes, 0) / float(MINUTES_PER_HOUR)
+
+
+def project_counts(counts, start, end, parse=parse_off_hours):
+    """
+    projects a fleet given as resource counts per tag
+
+    args:
+        counts (dict):
+            tag string -> number of resources with that tag
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+    returns:
+        tuple: (total Projection, dict of CompiledSchedule (None for the
+        invalid tags) -> Projection)
+    """
+    compiled = evaluate.compile_tags(counts, parse)
+    resources = {}
+    for tag, count in counts.iteritems():
+        schedule = compiled[tag]
+        resources[schedule] = resources.get(schedule, 0) + count
+    return project_schedules(resources, start, end)
+
+
+def project_schedules(resources, start, end):
+    """
+    projects a fleet given as resource counts per compiled schedule
+
+    args:
+        resources (dict):
+            CompiledSchedule (None for an invalid tag) -> resource count
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+    returns:
+        tuple: (total Projection, dict of CompiledSchedule -> Projection)
+    """
+    hours = _hours(start, end)
+    segments = {}
+    per_schedule = {}
+    for schedule, count in resources.iteritems():
+        if schedule is None or not schedule.scheduled:
+            on = hours
+        else:
+            zone = timezones.resolve(schedule.tz)
+            if zone not in segments:
+                segments[zone] = offset_segments(zone, start, end)
+            on = _on_minutes(schedule, segments[zone]) / \
+                float(MINUTES_PER_HOUR)
+        per_schedule[schedule] = Projection(
+            count, hours * count, on * count, (hours - on) * count)
+    total = Projection(*[sum(p[i] for p in per_schedule.itervalues())
+                         for i in xrange(len(Projection._fields))])
+    return total, per_schedule
+
+
+def project(resources, start, end, parse=parse_off_hours):
+    """
+    projects the instance hours, on hours and hours saved by off-hours of a
+    fleet over a utc range. each distinct schedule is projected once and
+    multiplied by its resource count
+
+        total, per_schedule = project(resources, datetime(2016, 1, 1),
+                                      datetime(2016, 4, 1))
+        total.saved_hours
+
+    args:
+        resources (iterable):
+            (resource_id, tag_value) pairs
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+    returns:
+        tuple: (total Projection, dict of CompiledSchedule -> Projection)
+    """
+    counts = {}
+    for _, tag in resources:
+        counts[tag] = counts.get(tag, 0) + 1
+    return project_counts(counts, start, end, parse)
@@ -0,0 +1,172 @@
+from collections import namedtuple
+
+from cache import LRUCache
+from class_parser import ScheduleParser
+from compiled import CompiledSchedule, slot, DAY_INDEX, MINUTES_PER_HOUR
+import function_parser
+
+# distinct schedules (and rules) to keep interned, an evicted one is simply
+# rebuilt as a new object the next time it is seen
+INTERN_SIZE = 65536
+
+_rules = LRUCache(INTERN_SIZE)
+_schedules = LRUCache(INTERN_SIZE)
+_tags = LRUCache(INTERN_SIZE)
+_missing = object()
+# keys with a field of their own in Schedule
+_KEYS = frozenset(('off', 'on', 'tz', 'cal'))
+_class_parser = ScheduleParser()
+
+
+class Rule(namedtuple('Rule', ('days', 'hour', 'minute'))):
+    """
+    immutable (days, hour, minute) rule. days is a tuple of day letters, so
+    an M-F rule is one object instead of five dicts. minute is 0 for a rule
+    on the hour
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, days, hour, minute=0):
+        return super(Rule, cls).__new__(cls, days, hour, minute)
+
+    def _entry(self, days):
+        # parse result dict, with the minute only for times off the hour
+        if self.minute:
+            return {'days': days, 'hour': self.hour, 'minute': self.minute}
+        return {'days': days, 'hour': self.hour}
+
+
+class Schedule(namedtuple('Schedule', ('off', 'on', 'tz', 'cal', 'extra'))):
+    """
+    immutable, hashable parsed schedule. off and on are tuples of Rules, or
+    None when the key was not in the tag, and cal is the name of the
+    exception calendar or None. extra holds the sorted (key, value) pairs of
+    any other keys, which ScheduleParser keeps in its result. identical
+    schedules are interned by intern_schedule so a fleet shares one object
+    per distinct schedule
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, off, on, tz, cal=None, extra=()):
+        return super(Schedule, cls).__new__(cls, off, on, tz, cal, extra)
+
+    def to_dict(self, flavor='function'):
+        """
+        returns the schedule in the dict format of parse_off_hours
+        (flavor='function', one entry per day) or ScheduleParser.parse
+        (flavor='class', one entry per rule with a list of days)
+        """
+        out = dict(self.extra)
+        out['tz'] = self.tz
+        if self.cal is not None:
+            out['cal'] = self.cal
+        for key in ('off', 'on'):
+            rules = getattr(self, key)
+            if rules is None:
+                continue
+            if flavor == 'function':
+                out[key] = [r._entry(d) for r in rules for d in r.days]
+            else:
+                out[key] = [r._entry(list(r.days)) for r in rules]
+        return out
+
+    def compile(self):
+        """
+        returns the CompiledSchedule bitmask of the schedule
+        """
+        events = {}
+        for state in ('on', 'off'):
+            for rule in getattr(self, state) or ():
+                for day in rule.days:
+                    events[slot(DAY_INDEX[day], rule.hour) * MINUTES_PER_HOUR +
+                           rule.minute] = state
+        return CompiledSchedule.from_events(events, self.tz, self.cal)
+
+
+def intern_rule(days, hour, minute=0):
+    """
+    returns the shared Rule for (days, hour, minute)
+    """
+    key = (tuple(days), hour, minute)
+    rule = _rules.get(key)
+    if rule is None:
+        rule = Rule(*key)
+        _rules.put(key, rule)
+    return rule
+
+
+def intern_schedule(schedule):
+    """
+    returns the shared instance of a Schedule equal to schedule
+    """
+    shared = _schedules.get(schedule)
+    if shared is None:
+        _schedules.put(schedule, schedule)
+        shared = schedule
+    return shared
+
+
+def _rules_of(entries):
+    if entries is None:
+        return None
+    return tuple(intern_rule(*entry) for entry in entries)
+
+
+def from_parsed(parsed):
+    """
+    builds an interned Schedule from the output of parse_off_hours or
+    ScheduleParser.parse. returns None for an invalid (None) schedule
+    """
+    if parsed is None:
+        return None
+    rules = {}
+    for key in ('off', 'on'):
+        entries = parsed.get(key)
+        if entries is not None:
+            rules[key] = [
+                ((e['days'],) if isinstance(e['days'], basestring) else e['days'],
+                 e['hour'], e.get('minute', 0))
+                for e in entries]
+    extra = tuple(sorted(item for item in parsed.iteritems()
+                         if item[0] not in _KEYS))
+    return _build(rules.get('off'), rules.get('on'), parsed.get('tz'),
+                  parsed.get('cal'), extra)
+
+
+def _build(off, on, tz, cal=None, extra=()):
+    return intern_schedule(
+        Schedule(_rules_of(off), _rules_of(on), tz, cal, extra))
+
+
+def parse(tag, flavor='function'):
+    """
+    parses a tag straight into an interned Schedule
+
+    with flavor='function' the tag is parsed with the parse_off_hours rules
+    without building the per day dicts. with flavor='class' it goes through
+    ScheduleParser.parse.
+
+    args:
+        tag (str):
+            schedule tag value
+        flavor (str):
+            'function' or 'class'
+    returns:
+        Schedule or None
+    """
+    key = (flavor, tag)
+    schedule = _tags.get(key, _missing)
+    if schedule is not _missing:
+        return schedule
+    schedule = None
+    if flavor == 'class':
+        schedule = from_parsed(_class_parser.parse(tag))
+    else:
+        rules = function_parser.parse_rules(tag)
+        if rules is not None:
+            schedule = _build(rules.get('off'), rules.get('on'), rules['tz'],
+                              rules.get('cal'))
+    _tags.put(key, schedule)
+    return schedule
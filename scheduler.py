@@ -0,0 +1,184 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import heapq
+
+from cache import LRUCache
+from compiled import CompiledSchedule, MINUTES_PER_WEEK
+import timezones
+
+# transition tables keyed by weekly pattern, shared by every schedule with
+# that pattern whatever its timezone
+_tables = LRUCache(1024)
+_minute = timedelta(minutes=1)
+
+
+class TransitionTable(object):
+    """
+    sorted minutes of the week (0 - 10079) at which a compiled schedule
+    changes state, with the state it changes to. only real changes are kept,
+    an off at a time when the schedule is already off is not a transition.
+
+    args:
+        changes (list):
+            (minute of the week, state) pairs of CompiledSchedule.changes()
+    """
+
+    __slots__ = ('slots', 'states')
+
+    def __init__(self, changes):
+        self.slots = [minute for minute, _ in changes]
+        self.states = [state for _, state in changes]
+
+    def next_after(self, minute):
+        """
+        returns (minutes from the start of the week, state) of the first
+        transition after minute. the minutes are >= MINUTES_PER_WEEK when the
+        transition wraps into the next week. returns None if the schedule
+        never changes.
+        """
+        if not self.slots:
+            return None
+        i = bisect_right(self.slots, minute)
+        if i == len(self.slots):
+            return self.slots[0] + MINUTES_PER_WEEK, self.states[0]
+        return self.slots[i], self.states[i]
+
+
+def transition_table(schedule):
+    """
+    returns the cached TransitionTable for a CompiledSchedule
+    """
+    table = _tables.get(schedule.pattern)
+    if table is None:
+        table = TransitionTable(schedule.changes())
+        _tables.put(schedule.pattern, table)
+    return table
+
+
+def _compiled(schedule):
+    if schedule is None or isinstance(schedule, CompiledSchedule):
+        return schedule
+    return CompiledSchedule.from_parsed(schedule)
+
+
+def next_transition(schedule, when, tz=None):
+    """
+    returns when a schedule next changes state after a point in time
+
+    args:
+        schedule (dict or CompiledSchedule):
+            output of parse_off_hours or ScheduleParser.parse, or compiled
+        when (datetime):
+            utc instant, naive datetimes are treated as utc
+        tz (str):
+            timezone alias or name, defaults to the schedule's tz
+    returns:
+        tuple or None: (naive utc datetime, 'on' or 'off') of the next
+        transition, None if the schedule is invalid or never changes
+    """
+    schedule = _compiled(schedule)
+    if schedule is None:
+        return None
+    if tz is None:
+        tz = schedule.tz
+    when = timezones.utc_naive(when)
+    table = transition_table(schedule)
+    if not table.slots:
+        return None
+    while True:
+        # wall clock transitions map one to one onto utc while the offset
+        # holds, so only look for one before the offset next changes
+        offset, end = timezones.offset_span(when, tz)
+        local = when + offset
+        week_start = datetime(local.year, local.month, local.day) - \
+            timedelta(days=local.weekday())
+        minute = (local.weekday() * 24 + local.hour) * 60 + local.minute
+        nxt, state = table.next_after(minute)
+        utc = week_start + timedelta(minutes=nxt) - offset
+        if utc < end:
+            return utc, state
+        # the wall clock jumps at the change, skipping or repeating the
+        # transitions in between. like evaluate, only the states either side
+        # of the jump count, and a jump that leaves the state alone is not a
+        # transition
+        before = end - _minute + offset
+        after = end + timezones.utc_offset(end, tz)
+        state = schedule.state_at(after.weekday(), after.hour, after.minute)
+        if state != schedule.state_at(
+                before.weekday(), before.hour, before.minute):
+            return end, state
+        when = end
+
+
+class FleetScheduler(object):
+    """
+    keeps each resource's next transition in a heap, so a wake up only
+    touches the resources that are due instead of the whole fleet.
+
+    args:
+        when (datetime):
+            utc instant the scheduler starts from
+    """
+
+    def __init__(self, when):
+        self.now = timezones.utc_naive(when)
+        self._heap = []
+        self._schedules = {}
+        self._seq = 0
+
+    def add(self, resource_id, schedule, tz=None):
+        """
+        adds or replaces a resource. schedule is a parse result or a
+        CompiledSchedule. invalid schedules are ignored and ones that never
+        change state never come due
+        """
+        self.remove(resource_id)
+        schedule = _compiled(schedule)
+        if schedule is None:
+            return
+        self._seq += 1
+        self._schedules[resource_id] = (schedule, tz, self._seq)
+        self._push(resource_id, self.now)
+
+    def remove(self, resource_id):
+        # heap entries of removed resources are dropped when they come up
+        self._schedules.pop(resource_id, None)
+
+    def _push(self, resource_id, after):
+        schedule, tz, seq = self._schedules[resource_id]
+        nxt = next_transition(schedule, after, tz)
+        if nxt is not None:
+            heapq.heappush(self._heap, (nxt[0], seq, resource_id, nxt[1]))
+
+    def next_wakeup(self):
+        """
+        returns the utc time of the earliest pending transition or None
+        """
+        while self._heap:
+            due, seq, resource_id = self._heap[0][:3]
+            entry = self._schedules.get(resource_id)
+            if entry is not None and entry[2] == seq:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def due(self, when):
+        """
+        returns the (resource_id, state) transitions due at or before when,
+        in time order, and schedules each resource's following transition
+        """
+        when = timezones.utc_naive(when)
+        out = []
+        heap = self._heap
+        while heap and heap[0][0] <= when:
+            due, seq, resource_id, state = heapq.heappop(heap)
+            entry = self._schedules.get(resource_id)
+            if entry is None or entry[2] != seq:
+                continue
+            out.append((resource_id, state))
+            self._push(resource_id, due)
+        self.now = when
+        return out
+
+    def __len__(self):
+        return len(self._schedules)
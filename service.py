@@ -0,0 +1,249 @@
+"""
+schedule lookup service. one process keeps the warm parse caches and other
+agents query it over a local unix socket or tcp port instead of each keeping
+their own.
+
+the protocol is one json object per line. requests can be pipelined, the
+replies come back in the same order on the connection:
+
+    {"id": 1, "op": "parse", "flavor": "function", "tags": ["off=(M-F,19);on=(M-F,7)"]}
+    {"id": 1, "result": [{"off": [...], "on": [...], "tz": "et"}]}
+
+    {"id": 2, "op": "evaluate", "when": "2016-01-04T13:00:00", "resources": [["i-1", "tz=pt"]]}
+    {"id": 2, "result": {"stop": [], "start": [], "noop": ["i-1"]}}
+
+    {"id": 3, "op": "stats"}
+    {"id": 3, "result": {"function": {"hits": 1, "misses": 1, ...}, "class": {...}}}
+
+errors are returned as {"id": ..., "error": "..."}. run a server with:
+    python service.py --unix /tmp/offhours.sock
+    python service.py --port 7480
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import socket
+import SocketServer
+import threading
+from Queue import Queue, Empty
+
+from bulk import get_parser, FLAVORS
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+import evaluate
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+class ServiceError(Exception):
+    """
+    raised by the client when the service returns an error for a request
+    """
+
+
+class Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            reply = server.handle_line(line)
+            self.wfile.write(json.dumps(reply))
+            self.wfile.write('\n')
+            self.wfile.flush()
+
+
+class ServiceMixin(object):
+    """
+    request handling shared by the tcp and unix socket servers. the parse
+    functions (and their caches) are shared by every connection
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_parsers(self, cache_size):
+        self.caches = dict((f, LRUCache(cache_size)) for f in FLAVORS)
+        self.parsers = dict((f, get_parser(f, cache=self.caches[f]))
+                            for f in FLAVORS)
+
+    def handle_line(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            return {'id': request_id, 'result': self.dispatch(request)}
+        except Exception as e:
+            return {'id': request_id, 'error': '%s: %s' % (type(e).__name__, e)}
+
+    def dispatch(self, request):
+        op = request.get('op')
+        if op == 'stats':
+            return dict((f, c.stats()) for f, c in self.caches.items())
+        parse = self.parsers[request.get('flavor', 'function')]
+        if op == 'parse':
+            return [parse(tag) for tag in request['tags']]
+        elif op == 'evaluate':
+            when = datetime.strptime(request['when'], TIME_FORMAT)
+            decisions = evaluate.evaluate(request['resources'], when, parse)
+            return dict((k, sorted(v)) for k, v in decisions._asdict().items())
+        raise ValueError('unknown op %r' % op)
+
+
+class TCPScheduleServer(ServiceMixin, SocketServer.ThreadingMixIn,
+                        SocketServer.TCPServer):
+
+    def __init__(self, address, cache_size=DEFAULT_CACHE_SIZE):
+        SocketServer.TCPServer.__init__(self, address, Handler)
+        self.setup_parsers(cache_size)
+
+
+class UnixScheduleServer(ServiceMixin, SocketServer.ThreadingMixIn,
+                         SocketServer.UnixStreamServer):
+
+    def __init__(self, address, cache_size=DEFAULT_CACHE_SIZE):
+        SocketServer.UnixStreamServer.__init__(self, address, Handler)
+        self.setup_parsers(cache_size)
+
+
+def make_server(address, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    returns a server bound to address, a (host, port) tuple for tcp or a path
+    for a unix socket. call serve_forever() on it to start serving
+
+    args:
+        address (tuple or str):
+            where to listen
+        cache_size (int or None):
+            distinct tags cached per flavor
+    """
+    if isinstance(address, basestring):
+        return UnixScheduleServer(address, cache_size)
+    return TCPScheduleServer(address, cache_size)
+
+
+class Connection(object):
+
+    def __init__(self, address):
+        family = socket.AF_UNIX if isinstance(address, basestring) \
+            else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+
+    def pipeline(self, requests):
+        for request in requests:
+            self.wfile.write(json.dumps(request))
+            self.wfile.write('\n')
+        self.wfile.flush()
+        return [json.loads(self.rfile.readline()) for _ in requests]
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+
+class ScheduleClient(object):
+    """
+    client for the schedule service with a pool of reusable connections, so
+    it can be shared between threads
+
+    args:
+        address (tuple or str):
+            (host, port) of a tcp server or the path of a unix socket
+        pool_size (int):
+            maximum number of idle connections kept open
+    """
+
+    def __init__(self, address, pool_size=4):
+        self.address = address
+        self._idle = Queue(pool_size)
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def pipeline(self, requests):
+        """
+        sends requests on one connection without waiting for each reply and
+        returns the raw replies in order
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            conn = Connection(self.address)
+        try:
+            replies = conn.pipeline(requests)
+        except Exception:
+            conn.close()
+            raise
+        if self._idle.full():
+            conn.close()
+        else:
+            self._idle.put_nowait(conn)
+        return replies
+
+    def call(self, op, **kwargs):
+        kwargs['op'] = op
+        kwargs['id'] = self._next_id()
+        reply = self.pipeline([kwargs])[0]
+        if 'error' in reply:
+            raise ServiceError(reply['error'])
+        return reply['result']
+
+    def parse(self, tags, flavor='function'):
+        """
+        returns the parse result of each tag, as parse_off_hours or
+        ScheduleParser.parse would
+        """
+        return self.call('parse', tags=list(tags), flavor=flavor)
+
+    def stats(self):
+        """
+        returns the hit/miss counters of the service's caches per flavor
+        """
+        return self.call('stats')
+
+    def evaluate(self, resources, when, flavor='function'):
+        """
+        same as evaluate.evaluate, run by the service
+        """
+        result = self.call('evaluate', resources=list(resources), flavor=flavor,
+                           when=when.strftime(TIME_FORMAT))
+        return evaluate.Decisions(
+            set(result['stop']), set(result['start']), set(result['noop']))
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='offhours schedule service')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--unix', help='path of the unix socket to listen on')
+    group.add_argument('--port', type=int, help='tcp port to listen on')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args(argv)
+    address = args.unix or (args.host, args.port)
+    server = make_server(address, args.cache_size)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if args.unix:
+            os.unlink(args.unix)
+
+
+if __name__ == '__main__':
+    main()
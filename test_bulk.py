@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from datetime import datetime
+
+from benchmarks.corpus import generate
+import bulk
+from compiled import CompiledSchedule
+import diskcache
+import evaluate
+import parallel
+
+
+class BulkTest(unittest.TestCase):
+
+    jsonl = '\n'.join([
+        '{"id": "i-1", "schedule": "off=(M-F,19);on=(M-F,7)"}',
+        '',
+        '{"id": "i-2", "schedule": "off=(Z,19);on=(M-F,7)"}',
+        '{"id": "i-3"}',
+        '{"id": "i-4", "schedule": "off=(M-F,19);on=(M-F,7)"}',
+    ])
+
+    def test_parse_records(self):
+        out = list(bulk.parse_records(bulk.read_records(StringIO(self.jsonl))))
+        self.assertEquals(['i-1', 'i-2', 'i-3', 'i-4'], [r['id'] for r in out])
+        self.assertEquals([True, False, False, True], [r['valid'] for r in out])
+        self.assertEquals([None, bulk.INVALID_SCHEDULE, bulk.MISSING_FIELD, None],
+                          [r['error'] for r in out])
+        self.assertEquals('M', out[0]['parsed']['off'][0]['days'])
+        # identical tags are parsed once
+        self.assertTrue(out[0]['parsed'] is out[3]['parsed'])
+
+    def test_bad_lines(self):
+        src = StringIO('\n'.join([
+            '{"id": "i-1", "schedule": "tz=pt"}',
+            '{"id": "i-2", "schedule": ',
+            '',
+            '["i-3"]',
+            '{"id": "i-4", "schedule": 19}',
+            '{"id": "i-5", "schedule": null}',
+            '{"id": "i-6", "schedule": ["tz=pt"]}',
+            '{"id": "i-7", "schedule": "tz=et"}',
+        ]))
+        out = list(bulk.parse_records(bulk.read_records(src)))
+        self.assertEquals([True, False, False, False, False, False, True],
+                          [r['valid'] for r in out])
+        self.assertEquals({'line': 2, 'error': bulk.INVALID_JSON, 'valid': False,
+                           'parsed': None}, out[1])
+        self.assertEquals({'line': 4, 'error': bulk.INVALID_RECORD,
+                           'valid': False, 'parsed': None}, out[2])
+        self.assertEquals([bulk.INVALID_TAG, bulk.MISSING_FIELD, bulk.INVALID_TAG],
+                          [r['error'] for r in out[3:6]])
+        self.assertEquals(['i-4', 'i-5', 'i-6', 'i-7'], [r['id'] for r in out[3:]])
+
+    def test_class_flavor(self):
+        out = list(bulk.parse_records(bulk.read_records(StringIO(self.jsonl)),
+                                      flavor='class'))
+        self.assertEquals(['M', 'T', 'W', 'H', 'F'], out[0]['parsed']['off'][0]['days'])
+        self.assertRaises(ValueError, bulk.get_parser, 'foo')
+
+    def test_is_lazy(self):
+        def records():
+            yield {'schedule': 'tz=pt'}
+            raise AssertionError('read too far')
+        out = bulk.parse_records(records())
+        self.assertEquals({'tz': 'pt'}, next(out)['parsed'])
+
+    def test_csv_round_trip(self):
+        src = StringIO('id,schedule\ni-1,"off=(M-F,19);on=(M-F,7)"\ni-2,junk\n')
+        dst = StringIO()
+        count = bulk.write_records(
+            bulk.parse_records(bulk.read_records(src, 'csv')), dst, 'csv')
+        self.assertEquals(2, count)
+        rows = list(bulk.read_records(StringIO(dst.getvalue()), 'csv'))
+        self.assertEquals('True', rows[0]['valid'])
+        self.assertEquals('et', json.loads(rows[0]['parsed'])['tz'])
+        self.assertEquals(bulk.INVALID_SCHEDULE, rows[1]['error'])
+
+    def test_csv_header(self):
+        # the header does not depend on the first record being valid
+        src = StringIO('not json\n{"id": "i-1", "schedule": "tz=pt"}\n')
+        dst = StringIO()
+        bulk.write_records(bulk.parse_records(bulk.read_records(src)), dst,
+                           'csv', ['schedule'])
+        rows = list(bulk.read_records(StringIO(dst.getvalue()), 'csv'))
+        self.assertEquals(['', 'tz=pt'], [r['schedule'] for r in rows])
+        self.assertEquals([bulk.INVALID_JSON, ''], [r['error'] for r in rows])
+        self.assertEquals([{'line': 1}, {'id': 'i-1'}],
+                          [json.loads(r['extra']) for r in rows])
+
+    def test_cli(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmp, 'in.jsonl')
+            dst = os.path.join(tmp, 'out.csv')
+            with open(src, 'w') as f:
+                f.write(self.jsonl)
+            bulk.main([src, '-o', dst, '--output-format', 'csv'])
+            with open(dst) as f:
+                rows = list(bulk.read_records(f, 'csv'))
+            self.assertEquals(4, len(rows))
+        finally:
+            shutil.rmtree(tmp)
+
+
+class ParallelTest(unittest.TestCase):
+
+    def tearDown(self):
+        parallel.close_pools()
+
+    def test_compile_parallel(self):
+        tags = generate(300, seed=2)
+        inline = parallel.compile_parallel(tags, 1)
+        pooled = parallel.compile_parallel(tags, 3)
+        self.assertEquals(inline, pooled)
+        self.assertEquals([evaluate.compile_schedule(evaluate.parse_off_hours(t))
+                           for t in tags], pooled)
+        # identical schedules come back as one shared object
+        first = pooled[tags.index('off=(M-F,19);on=(M-F,7)')]
+        self.assertTrue(all(s is first for t, s in zip(tags, pooled)
+                            if t == 'off=(M-F,19);on=(M-F,7)'))
+
+    def test_shard_of_is_stable(self):
+        self.assertEquals(parallel.shard_of('tz=pt', 7), parallel.shard_of('tz=pt', 7))
+        self.assertTrue(0 <= parallel.shard_of('tz=pt', 7) < 7)
+        # unicode tags shard like their utf-8 bytes
+        self.assertEquals(parallel.shard_of('tz=pt', 7), parallel.shard_of(u'tz=pt', 7))
+        self.assertEquals(parallel.shard_of('cal=f\xc3\xaate', 7),
+                          parallel.shard_of(u'cal=f\xeate', 7))
+
+    def test_pools_are_kept(self):
+        tags = generate(100, seed=3) + [u'off=(M-F,19);on=(M-F,7);tz=\xe9t']
+        first = parallel.compile_parallel(tags, 2)
+        pools = list(parallel._pools)
+        self.assertEquals(2, len(pools))
+        self.assertEquals(first, parallel.compile_parallel(tags, 2))
+        self.assertEquals(pools, parallel._pools)
+        parallel.close_pools()
+        self.assertEquals([], parallel._pools)
+
+    def test_evaluate_parallel(self):
+        resources = list(enumerate(generate(300, seed=2)))
+        when = datetime(2016, 1, 4, 13)
+        self.assertEquals(evaluate.evaluate(resources, when),
+                          parallel.evaluate_parallel(resources, when, 2))
+        self.assertEquals(
+            evaluate.evaluate(resources, when, bulk.get_parser('class')),
+            parallel.evaluate_parallel(resources, when, 2, flavor='class'))
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'offhours.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_build_and_load(self):
+        tags = generate(300, seed=4) + [u'off=(M-F,19);on=(M-F,7);tz=pt',
+                                        'off=(M-F,19:30);on=(M-F,7:15);tz=pt',
+                                        'off=(M-F,18:05);on=(M-F,7:15)',
+                                        'off=(M-F,19);on=(M-F,7);cal=us',
+                                        'off=(M,7:30);on=(M,8);cal=eu;tz=gmt']
+        self.assertEquals(len(set(tags)), diskcache.build(self.path, tags))
+        store = diskcache.load(self.path)
+        self.assertEquals(len(set(tags)), len(store))
+        for tag in tags:
+            self.assertEquals(evaluate.compile_schedule(evaluate.parse_off_hours(tag)),
+                              store.compile(tag))
+        self.assertEquals(0, store.misses)
+        self.assertEquals('missing', store.get('tz=gmt', 'missing'))
+        self.assertEquals([], os.listdir(self.tmp)[1:])
+
+    def test_save_merges_pending(self):
+        store = diskcache.load(self.path)
+        self.assertEquals(0, len(store))
+        resources = [('i-1', 'off=(M-F,19);on=(M-F,7)'), ('i-2', 'junk')]
+        when = datetime(2016, 1, 4, 13)
+        self.assertEquals(evaluate.evaluate(resources, when),
+                          evaluate.evaluate(resources, when, store=store))
+        self.assertEquals(2, store.save())
+        store.compile('tz=pt')
+        self.assertEquals(3, store.save())
+        reloaded = diskcache.load(self.path)
+        self.assertEquals(3, len(reloaded))
+        self.assertEquals(None, reloaded.get('junk', 'missing'))
+        self.assertEquals('pt', reloaded.get('tz=pt').tz)
+
+    def test_extensions(self):
+        # one extension per distinct timezone, calendar and edges, and more
+        # of them than a u16 index holds
+        edges = {0: ((30, False),)}
+        entries = dict((key, CompiledSchedule(1, 'pt', edges))
+                       for key in xrange(1, 1001))
+        diskcache.write(self.path, entries)
+        store = diskcache.load(self.path)
+        self.assertEquals(1, len(store._extended))
+        self.assertEquals(entries, store.entries())
+        entries = dict((key, CompiledSchedule(1, 'pt', None, 'c%d' % key))
+                       for key in xrange(1, (1 << 16) + 2))
+        self.assertEquals(len(entries), diskcache.write(self.path, entries))
+        store = diskcache.load(self.path)
+        self.assertEquals(len(entries), len(store._extended))
+        self.assertEquals('c65537', store._decode(store._slot(65537)).cal)
+
+    def test_outdated_files_are_ignored(self):
+        diskcache.build(self.path, ['tz=pt'])
+        self.assertEquals(0, len(diskcache.load(self.path, 'class')))
+        with open(self.path, 'r+b') as f:
+            f.truncate(40)
+        self.assertEquals(0, len(diskcache.load(self.path)))
+        with open(self.path, 'wb') as f:
+            f.write('junk')
+        self.assertEquals(0, len(diskcache.load(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
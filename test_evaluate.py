@@ -0,0 +1,716 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from StringIO import StringIO
+
+import evaluate
+from compiled import compile_schedule
+import function_parser
+import scheduler
+import timezones
+import tracker
+import intervals
+import projection
+import dispatcher
+import timeline
+import fleetindex
+import calendars
+import canonical
+import schedule
+import validation
+from benchmarks.corpus import generate
+from class_parser import ScheduleParser
+
+
+class TimezonesTest(unittest.TestCase):
+
+    def test_resolve(self):
+        self.assertEquals('America/Los_Angeles', timezones.resolve('pt'))
+        self.assertEquals('America/Los_Angeles', timezones.resolve('PST'))
+        self.assertEquals('America/New_York', timezones.resolve('foo'))
+        self.assertEquals('America/New_York', timezones.resolve(None))
+        self.assertEquals('Europe/London', timezones.resolve('Europe/London'))
+
+    def test_local_slot(self):
+        # 2016-01-04 is a Monday, outside of dst
+        self.assertEquals((0, 4), timezones.local_slot(datetime(2016, 1, 4, 12), 'pt'))
+        self.assertEquals((6, 23), timezones.local_slot(datetime(2016, 1, 4, 4), 'et'))
+
+    def test_dst(self):
+        # us dst 2016 runs from march 13th to november 6th
+        self.assertEquals(datetime(2016, 7, 4, 12),
+                          timezones.to_local(datetime(2016, 7, 4, 16), 'et'))
+        self.assertEquals(datetime(2016, 3, 13, 1, 59),
+                          timezones.to_local(datetime(2016, 3, 13, 6, 59), 'et'))
+        self.assertEquals(datetime(2016, 3, 13, 3),
+                          timezones.to_local(datetime(2016, 3, 13, 7), 'et'))
+        self.assertEquals(datetime(2016, 11, 6, 1),
+                          timezones.to_local(datetime(2016, 11, 6, 6), 'et'))
+        # uk summer time 2016 runs from march 27th to october 30th
+        self.assertEquals(datetime(2016, 7, 4, 13),
+                          timezones.to_local(datetime(2016, 7, 4, 12), 'gmt'))
+        self.assertEquals(datetime(2016, 10, 30, 1),
+                          timezones.to_local(datetime(2016, 10, 30, 1), 'gmt'))
+
+    def test_to_utc(self):
+        self.assertEquals(datetime(2016, 7, 4, 16),
+                          timezones.to_utc(datetime(2016, 7, 4, 12), 'et'))
+        self.assertEquals(datetime(2016, 1, 4, 17),
+                          timezones.to_utc(datetime(2016, 1, 4, 9), 'pt'))
+        # ambiguous and skipped wall clock times are standard time
+        self.assertEquals(datetime(2016, 11, 6, 6, 30),
+                          timezones.to_utc(datetime(2016, 11, 6, 1, 30), 'et'))
+        self.assertEquals(datetime(2016, 3, 13, 7, 30),
+                          timezones.to_utc(datetime(2016, 3, 13, 2, 30), 'et'))
+
+    def test_tables_cached(self):
+        timezones.preload(['pt', 'pst', 'et'], (2015, 2017))
+        self.assertTrue(('America/Los_Angeles', 2016) in timezones._tables)
+        table = timezones.offset_table('America/Los_Angeles', 2016)
+        self.assertTrue(table is timezones.offset_table('America/Los_Angeles', 2016))
+        self.assertEquals(3, len(table.starts))
+
+
+class EvaluateTest(unittest.TestCase):
+
+    resources = [
+        ('i-1', 'off=(M-F,19);on=(M-F,7)'),
+        ('i-2', 'off=(M-F,19);on=(M-F,7);tz=pt'),
+        ('i-3', 'off=(M-F,19);on=(M-F,7)'),
+        ('i-4', 'tz=pt'),
+        ('i-5', 'off=(Z,19);on=(M-F,7)'),
+    ]
+
+    def test_evaluate(self):
+        # monday 08:00 eastern, 05:00 pacific
+        d = evaluate.evaluate(self.resources, datetime(2016, 1, 4, 13))
+        self.assertEquals(set(['i-2']), d.stop)
+        self.assertEquals(set(['i-1', 'i-3']), d.start)
+        self.assertEquals(set(['i-4', 'i-5']), d.noop)
+
+    def test_evaluate_class_parser(self):
+        d = evaluate.evaluate(self.resources, datetime(2016, 1, 4, 16),
+                              parse=ScheduleParser().parse)
+        self.assertEquals(set(), d.stop)
+        self.assertEquals(set(['i-1', 'i-2', 'i-3']), d.start)
+
+    def test_evaluate_without_numpy(self):
+        numpy, evaluate.numpy = evaluate.numpy, None
+        try:
+            d = evaluate.evaluate(self.resources, datetime(2016, 1, 9, 13))
+        finally:
+            evaluate.numpy = numpy
+        self.assertEquals(set(['i-1', 'i-2', 'i-3']), d.stop)
+        self.assertEquals(set(), d.start)
+
+    def test_compile_tags_dedupes(self):
+        calls = []
+
+        def parse(tag):
+            calls.append(tag)
+            return None
+        evaluate.compile_tags(['a', 'b', 'a', 'a'], parse)
+        self.assertEquals(['a', 'b'], calls)
+
+
+class MinuteScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parsed = function_parser.parse_off_hours(
+            'off=(M-F,19:30);on=(M-F,7:45)')
+
+    def test_evaluate(self):
+        resources = [('i-1', 'off=(M-F,19:30);on=(M-F,7:45)'),
+                     ('i-2', 'off=(M-F,19);on=(M-F,7)')]
+        # monday 19:29 and 19:31 eastern
+        self.assertEquals(set(['i-1']), evaluate.evaluate(
+            resources, datetime(2016, 1, 5, 0, 29)).start)
+        self.assertEquals(set(['i-1', 'i-2']), evaluate.evaluate(
+            resources, datetime(2016, 1, 5, 0, 31)).stop)
+
+    def test_next_transition(self):
+        self.assertEquals(
+            (datetime(2016, 1, 5, 0, 30), 'off'),
+            scheduler.next_transition(self.parsed, datetime(2016, 1, 4, 13)))
+        self.assertEquals(
+            (datetime(2016, 1, 5, 12, 45), 'on'),
+            scheduler.next_transition(self.parsed, datetime(2016, 1, 5, 0, 30)))
+
+    def test_intervals_match_minute_lookups(self):
+        schedule = compile_schedule(function_parser.parse_off_hours(
+            'off=[(M-F,19:30),(U,23:59)];on=[(T-F,7:45),(U,23:15)]'))
+        week = intervals.week_intervals(schedule)
+        on = 0
+        for minute in xrange(intervals.MINUTES_PER_WEEK):
+            hour, offset = divmod(minute, 60)
+            state = schedule.is_on(hour // 24, hour % 24, offset)
+            self.assertEquals(state, week.is_on(minute))
+            on += state
+        self.assertEquals(on, week.total)
+        self.assertEquals(on, schedule.on_minutes())
+
+    def test_projection(self):
+        start, end = datetime(2016, 1, 4, 5), datetime(2016, 1, 11, 5)
+        self.assertEquals(5 * 11.75, projection.on_hours(self.parsed, start, end))
+        self.assertEquals(168 - 5 * 11.75,
+                          intervals.off_hours(self.parsed, start, end))
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_transition_table(self):
+        table = scheduler.transition_table(compile_schedule(
+            function_parser.parse_off_hours('off=[(M-F,19),(S,19)];on=(M-F,7)')))
+        # saturday's off is redundant, the schedule is already off
+        self.assertEquals(10, len(table.slots))
+        # minutes of the week
+        self.assertEquals((7 * 60, 'on'), table.next_after(0))
+        self.assertEquals(((7 + 168) * 60, 'on'),
+                          table.next_after((4 * 24 + 19) * 60))
+
+    def test_next_transition(self):
+        parsed = function_parser.parse_off_hours('off=(M-F,19);on=(M-F,7)')
+        # monday 08:00 eastern
+        self.assertEquals(
+            (datetime(2016, 1, 5, 0), 'off'),
+            scheduler.next_transition(parsed, datetime(2016, 1, 4, 13))
+        )
+        # friday 19:00 eastern is a transition, the next one is monday
+        self.assertEquals(
+            (datetime(2016, 1, 11, 12), 'on'),
+            scheduler.next_transition(parsed, datetime(2016, 1, 9, 0))
+        )
+        self.assertEquals(
+            (datetime(2016, 1, 4, 15), 'on'),
+            scheduler.next_transition(ScheduleParser().parse(
+                'off=(M-F,19);on=(M-F,7)'), datetime(2016, 1, 4, 13), tz='pt')
+        )
+        self.assertEquals(None, scheduler.next_transition(
+            function_parser.parse_off_hours('tz=pt'), datetime(2016, 1, 4)))
+        self.assertEquals(None, scheduler.next_transition(None, datetime(2016, 1, 4)))
+
+    def test_dst_transitions(self):
+        # 02:00 does not happen on 2025-03-09 in chicago, the clock jumps to
+        # 03:00 and the schedule is on either side of the jump
+        fleet = scheduler.FleetScheduler(datetime(2025, 3, 8))
+        fleet.add('r', function_parser.parse_off_hours('off=(U,2);on=(U,3);tz=ct'))
+        self.assertEquals([], fleet.due(datetime(2025, 3, 9, 12)))
+        self.assertEquals(datetime(2025, 3, 16, 7), fleet.next_wakeup())
+        # 01:00 - 02:00 happens twice on 2025-11-02, so does the 01:30 off
+        tag = 'off=(U,1:30);on=(U,5);tz=ct'
+        parsed = function_parser.parse_off_hours(tag)
+        when, seen = datetime(2025, 11, 2), []
+        for _ in xrange(4):
+            when, state = scheduler.next_transition(parsed, when)
+            seen.append((when, state))
+            # evaluate agrees at the instant the scheduler wakes up
+            self.assertEquals(set(['r']) if state == 'on' else set(),
+                              evaluate.evaluate([('r', tag)], when).start)
+        self.assertEquals([(datetime(2025, 11, 2, 6, 30), 'off'),
+                           (datetime(2025, 11, 2, 7), 'on'),
+                           (datetime(2025, 11, 2, 7, 30), 'off'),
+                           (datetime(2025, 11, 2, 11), 'on')], seen)
+
+    def test_fleet_scheduler(self):
+        fleet = scheduler.FleetScheduler(datetime(2016, 1, 4, 11))
+        fleet.add('i-1', function_parser.parse_off_hours('off=(M-F,19);on=(M-F,7)'))
+        fleet.add('i-2', function_parser.parse_off_hours('off=(M-F,19);on=(M-F,7);tz=pt'))
+        fleet.add('i-3', function_parser.parse_off_hours('tz=pt'))
+        fleet.add('i-4', None)
+        self.assertEquals(3, len(fleet))
+        self.assertEquals(datetime(2016, 1, 4, 12), fleet.next_wakeup())
+        self.assertEquals([], fleet.due(datetime(2016, 1, 4, 11, 30)))
+        self.assertEquals([('i-1', 'on'), ('i-2', 'on')],
+                          fleet.due(datetime(2016, 1, 4, 16)))
+        fleet.remove('i-2')
+        self.assertEquals([('i-1', 'off')], fleet.due(datetime(2016, 1, 5, 4)))
+        self.assertEquals(datetime(2016, 1, 5, 12), fleet.next_wakeup())
+
+
+class TrackerTest(unittest.TestCase):
+
+    def test_apply(self):
+        work = 'off=(M-F,19);on=(M-F,7)'
+        t = tracker.ScheduleTracker(datetime(2016, 1, 4, 13))
+        t.apply(added={'i-1': work, 'i-2': work, 'i-3': 'tz=pt', 'i-4': 'junk'})
+        self.assertEquals(evaluate.evaluate(
+            [('i-1', work), ('i-2', work), ('i-3', 'tz=pt'), ('i-4', 'junk')],
+            datetime(2016, 1, 4, 13)), t.decisions())
+        self.assertEquals(3, t.parses)
+        t.apply(changed=[('i-2', 'off=(M-F,7);on=(M-F,19)'), ('i-1', work)],
+                removed=['i-3', 'i-5'])
+        self.assertEquals(4, t.parses)
+        self.assertEquals(set(['i-1']), t.start)
+        self.assertEquals(set(['i-2']), t.stop)
+        self.assertEquals(set(['i-4']), t.noop)
+        self.assertEquals(3, len(t))
+
+    def test_advance(self):
+        t = tracker.ScheduleTracker(datetime(2016, 1, 4, 13))
+        t.update([('i-1', 'off=(M-F,19);on=(M-F,7)'), ('i-2', 'tz=pt')])
+        # monday 19:00 eastern
+        self.assertEquals(1, t.advance(datetime(2016, 1, 5, 0)))
+        self.assertEquals(set(['i-1']), t.stop)
+        self.assertEquals(0, t.advance(datetime(2016, 1, 5, 1)))
+        t.remove(['i-1'])
+        self.assertEquals(set(), t.stop)
+        self.assertEquals(set(['i-2']), t.noop)
+
+    def test_fingerprints(self):
+        # spellings of one schedule, down to the timezone alias, share a state
+        tags = ['off=(M-F,19);on=(M-F,7);tz=pt', 'off=[(M-F,19)];on=(M-F,7);tz=pst',
+                'off=[(M,19),(T-F,19)];on=(M-F,7);tz=pdt']
+        t = tracker.ScheduleTracker(datetime(2016, 1, 4, 20))
+        t.update(('i-%d' % i, tag) for i, tag in enumerate(tags))
+        self.assertEquals(1, len(t._members))
+        self.assertEquals(set(['i-0', 'i-1', 'i-2']), t.start)
+        self.assertEquals(3, t.advance(datetime(2016, 1, 5, 3)))
+        t.remove(['i-0', 'i-1'])
+        self.assertEquals(set(['i-2']), t.stop)
+        schedules = [compile_schedule(function_parser.parse_off_hours(tag))
+                     for tag in tags + ['junk']]
+        unique, codes = evaluate.distinct_schedules(schedules)
+        self.assertEquals([0, 0, 0, 1], codes)
+        self.assertEquals([schedules[0], None], unique)
+
+
+class FleetIndexTest(unittest.TestCase):
+
+    def test_queries(self):
+        index = fleetindex.FleetIndex()
+        index.update([('i-1', 'off=(M-F,19);on=(M-F,7);tz=pt'),
+                      ('i-2', 'off=(F,19:30);on=(M,7);tz=pst'),
+                      ('i-3', 'off=(M-F,19);on=(M-F,7)'),
+                      ('i-4', 'junk')])
+        self.assertEquals(set(['i-1', 'i-2']),
+                          set(index.changes('pt', 4, 19, 'off')))
+        self.assertEquals(set(['i-3']), set(index.at('et', 0, 10)))
+        self.assertEquals(set(['i-1', 'i-2']),
+                          set(index.at('America/Los_Angeles', 0, 10)))
+        self.assertEquals(2, index.count('pt', 0, 10))
+        self.assertEquals(set(), set(index.at('pt', 6, 10)))
+        self.assertEquals(set(['i-1', 'i-2']), set(index.at('pt', 6, 10, 'off')))
+        self.assertEquals(2, index.count('pt', 6, 10, 'off'))
+        self.assertEquals(set(['i-4']), set(index.unscheduled()))
+        # friday 19:00 pacific, i-2 only goes off at 19:30
+        self.assertEquals(set(['i-1']), set(
+            index.changes('pt', 4, 19, 'off') & index.at('pt', 4, 19, 'off')))
+        up = index.at_time(datetime(2016, 1, 4, 18))
+        self.assertEquals(set(['i-1', 'i-2', 'i-3']), set(up))
+        self.assertEquals(set(['i-4']), set(index.all() - up))
+        self.assertTrue('i-3' in up and 'i-4' not in up)
+        self.assertRaises(ValueError, index.at, 'pt', 0, 10, 'up')
+
+    def test_at_time_minutes(self):
+        index = fleetindex.FleetIndex()
+        resources = [('i-1', 'off=(M-F,19:30);on=(M-F,7:15);tz=et'),
+                     ('i-2', 'off=(M-F,19);on=(M-F,7)')]
+        index.update(resources)
+        # monday 07:10, 07:20, 19:20 and 19:45 eastern
+        for when, up in ((datetime(2016, 1, 4, 12, 10), ['i-2']),
+                         (datetime(2016, 1, 4, 12, 20), ['i-1', 'i-2']),
+                         (datetime(2016, 1, 5, 0, 20), ['i-1']),
+                         (datetime(2016, 1, 5, 0, 45), [])):
+            self.assertEquals(set(up), set(index.at_time(when)), when)
+            self.assertEquals(set(['i-1', 'i-2']) - set(up),
+                              set(index.at_time(when, 'off')), when)
+            self.assertEquals(set(up), evaluate.evaluate(resources, when).start)
+
+    def test_apply(self):
+        index = fleetindex.FleetIndex()
+        work = 'off=(M-F,19);on=(M-F,7)'
+        index.apply(added={'i-1': work, 'i-2': work, 'i-3': 'tz=pt'})
+        self.assertEquals(2, index.count('et', 0, 10))
+        index.apply(changed=[('i-2', 'off=(S,1);on=(S,2)'), ('i-1', work)],
+                    removed=['i-3', 'i-5'])
+        self.assertEquals(3, index.parses)
+        self.assertEquals(set(['i-1']), set(index.changes('et', 0, 19)))
+        self.assertEquals(set(['i-2']), set(index.changes('et', 5, 1, 'off')))
+        index.update([('i-6', work)])
+        self.assertEquals(set(['i-1', 'i-6']), set(index.changes('et', 0, 19)))
+        self.assertEquals(set(['i-1', 'i-2', 'i-6']), set(index.all()))
+        self.assertEquals(3, len(index))
+        index.remove(['i-1', 'i-2', 'i-6'])
+        self.assertEquals(0, len(index.all()))
+        self.assertEquals({}, index._zones)
+
+    def test_matches_scan(self):
+        resources = [('i-%d' % i, tag)
+                     for i, tag in enumerate(generate(2000, seed=4))]
+        index = fleetindex.FleetIndex()
+        index.update(resources)
+        index.remove(['i-%d' % i for i in xrange(0, 2000, 7)])
+        live = dict(resources)
+        for i in xrange(0, 2000, 7):
+            del live['i-%d' % i]
+        for weekday, hour in ((0, 7), (4, 19), (6, 10)):
+            expected = set()
+            for resource_id, tag in live.iteritems():
+                schedule = compile_schedule(function_parser.parse_off_hours(tag))
+                if schedule is not None and schedule.scheduled and \
+                        timezones.resolve(schedule.tz) == \
+                        timezones.resolve('pt') and \
+                        schedule.is_on(weekday, hour):
+                    expected.add(resource_id)
+            self.assertEquals(expected, set(index.at('pt', weekday, hour)))
+            self.assertEquals(len(expected), index.count('pt', weekday, hour))
+
+
+class IntervalsTest(unittest.TestCase):
+
+    def test_week_intervals(self):
+        week = intervals.week_intervals(compile_schedule(
+            function_parser.parse_off_hours('off=(F,22);on=(M,6)')))
+        # on from monday 06:00 to friday 22:00
+        self.assertEquals([(6 * 60, (4 * 24 + 22) * 60)], week.intervals())
+        week = intervals.week_intervals(compile_schedule(
+            function_parser.parse_off_hours('off=(M,6);on=(F,22)')))
+        # on over the weekend, across the end of the week
+        self.assertEquals([((4 * 24 + 22) * 60, (7 * 24 + 6) * 60)],
+                          week.intervals())
+        self.assertTrue(week.is_on(0))
+        self.assertTrue(week.is_on(-1))
+        self.assertFalse(week.is_on(6 * 60))
+        self.assertEquals(8 * 60, week.on_minutes(-2 * 60, 6 * 60))
+        self.assertEquals(3 * week.total + 60, week.on_minutes(
+            5 * 60, 3 * intervals.MINUTES_PER_WEEK + 6 * 60))
+
+    def test_matches_mask(self):
+        for tag in set(generate(300, seed=6)):
+            schedule = compile_schedule(function_parser.parse_off_hours(tag))
+            if schedule is None:
+                continue
+            week = intervals.week_intervals(schedule)
+            on = 0
+            for hour in xrange(168):
+                self.assertEquals(schedule.is_on(hour // 24, hour % 24),
+                                  week.is_on(hour * 60 + 30))
+                on += schedule.is_on(hour // 24, hour % 24)
+                self.assertEquals(on * 60, week.on_minutes(0, (hour + 1) * 60))
+
+    def test_circular_ranges_agree(self):
+        for tag in ('off=(F-M,19);on=(F-M,7)', 'off=(S-T,5);on=(U-H,9)'):
+            self.assertEquals(
+                compile_schedule(function_parser.parse_off_hours(tag)),
+                compile_schedule(ScheduleParser().parse(tag)))
+
+    def test_off_hours(self):
+        parsed = function_parser.parse_off_hours('off=(M-F,19);on=(M-F,7)')
+        # monday to monday, eastern
+        self.assertEquals(108.0, intervals.off_hours(
+            parsed, datetime(2016, 1, 4, 5), datetime(2016, 1, 11, 5)))
+        self.assertEquals(2.0, intervals.off_hours(
+            parsed, datetime(2016, 1, 4, 10), datetime(2016, 1, 4, 14)))
+        self.assertEquals(0.0, intervals.off_hours(
+            None, datetime(2016, 1, 4), datetime(2016, 1, 11)))
+        self.assertTrue(intervals.is_off_at(parsed, datetime(2016, 1, 4, 11)))
+        self.assertFalse(intervals.is_off_at(parsed, datetime(2016, 1, 4, 12)))
+        self.assertTrue(intervals.is_off_at(parsed, datetime(2016, 1, 4, 12),
+                                            tz='pt'))
+
+
+class ProjectionTest(unittest.TestCase):
+
+    def brute_force(self, schedule, start, end):
+        on = 0
+        while start < end:
+            on += schedule.is_on(*timezones.local_slot(start, schedule.tz))
+            start += timedelta(hours=1)
+        return on
+
+    def test_on_hours_matches_hourly_evaluation(self):
+        ranges = ((datetime(2016, 1, 1), datetime(2017, 1, 1)),
+                  # across the spring forward of both us and eu rules
+                  (datetime(2016, 3, 1, 5), datetime(2016, 3, 30, 7)),
+                  (datetime(2015, 10, 20), datetime(2016, 1, 5)))
+        for tag in ('off=(M-F,19);on=(M-F,7)', 'off=(U,2);on=(U,3);tz=pt',
+                    'off=(S,1);on=(U,3);tz=gmt'):
+            schedule = compile_schedule(function_parser.parse_off_hours(tag))
+            for start, end in ranges:
+                self.assertEquals(self.brute_force(schedule, start, end),
+                                  projection.on_hours(schedule, start, end), tag)
+
+    def test_offset_segments(self):
+        segments = projection.offset_segments(
+            'et', datetime(2016, 3, 1), datetime(2016, 4, 1))
+        self.assertEquals([-300, -240], [s[2] for s in segments])
+        self.assertEquals(segments[0][1], segments[1][0])
+
+    def test_project(self):
+        work = 'off=(M-F,19);on=(M-F,7)'
+        resources = [('i-1', work), ('i-2', work), ('i-3', 'junk'),
+                     ('i-4', 'off=[(M-F,19)];on=(M-F,7)')]
+        start, end = datetime(2016, 1, 4, 5), datetime(2016, 1, 11, 5)
+        total, per_schedule = projection.project(resources, start, end)
+        self.assertEquals(projection.Projection(4, 672.0, 348.0, 324.0), total)
+        self.assertEquals(projection.Projection(3, 504.0, 180.0, 324.0),
+                          per_schedule[compile_schedule(
+                              function_parser.parse_off_hours(work))])
+        self.assertEquals(168.0, per_schedule[None].on_hours)
+
+
+class TimelineTest(unittest.TestCase):
+
+    def test_week_runs(self):
+        week = intervals.week_intervals(compile_schedule(
+            function_parser.parse_off_hours('off=(M,6);on=(U,20)')))
+        w = intervals.MINUTES_PER_WEEK
+        # sunday 20:00 to monday 06:00 is one run across the week boundary
+        self.assertEquals([(0, 360), (w - 240, w + 360), (2 * w - 240, 2 * w)],
+                          week.runs(0, 2 * w))
+        self.assertEquals([(w + 100, w + 360)], week.runs(w + 100, w + 500))
+        self.assertEquals([], week.runs(500, 500))
+
+    def test_timeline(self):
+        line = timeline.timeline(
+            function_parser.parse_off_hours('off=(M-F,19:30);on=(M-F,7);tz=pt'),
+            datetime(2016, 1, 8), datetime(2016, 1, 12))
+        # thursday 16:00 to monday 16:00 pacific
+        self.assertEquals([
+            (datetime(2016, 1, 8), datetime(2016, 1, 8, 3, 30), 'on'),
+            (datetime(2016, 1, 8, 3, 30), datetime(2016, 1, 8, 15), 'off'),
+            (datetime(2016, 1, 8, 15), datetime(2016, 1, 9, 3, 30), 'on'),
+            (datetime(2016, 1, 9, 3, 30), datetime(2016, 1, 11, 15), 'off'),
+            (datetime(2016, 1, 11, 15), datetime(2016, 1, 12), 'on')],
+            line.intervals())
+        self.assertEquals([(datetime(2016, 1, 8), datetime(2016, 1, 9), 'on')],
+                          timeline.timeline(None, datetime(2016, 1, 8),
+                                            datetime(2016, 1, 9)).intervals())
+
+    def test_matches_projection(self):
+        # march 2016 holds the spring forward of both us and eu rules
+        start, end = datetime(2016, 3, 1, 5), datetime(2016, 4, 1)
+        for tag in set(generate(300, seed=2)):
+            schedule = compile_schedule(function_parser.parse_off_hours(tag))
+            line = timeline.timeline(schedule, start, end)
+            self.assertEquals(projection.on_hours(schedule, start, end),
+                              line.on_minutes() / 60.0, tag)
+            runs = line.intervals()
+            self.assertEquals((start, end), (runs[0][0], runs[-1][1]))
+            for before, after in zip(runs, runs[1:]):
+                self.assertEquals(before[1], after[0])
+                self.assertNotEquals(before[2], after[2])
+
+    def test_export_csv(self):
+        work = 'off=(M-F,19);on=(M-F,7)'
+        resources = [('i-1', work), ('i-2', 'junk'),
+                     ('i-3', 'off=[(M-F,19)];on=(M-F,7);tz=et')]
+        start, end = datetime(2016, 1, 4), datetime(2016, 1, 6)
+        lines = list(timeline.fleet_timelines(resources, start, end))
+        self.assertTrue(lines[0][1] is lines[2][1])
+        out = StringIO()
+        self.assertEquals(9, timeline.export(resources, start, end, out, 'csv'))
+        rows = out.getvalue().splitlines()
+        self.assertEquals('resource_id,start,end,state', rows[0])
+        self.assertEquals('i-1,2016-01-04T12:00:00Z,2016-01-05T00:00:00Z,on',
+                          rows[2])
+        self.assertEquals('i-2,2016-01-04T00:00:00Z,2016-01-06T00:00:00Z,on',
+                          rows[5])
+        if timeline.get_pyarrow() is None:
+            self.assertRaises(ValueError, timeline.export, resources, start,
+                              end, out, 'parquet')
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.decisions = evaluate.Decisions(
+            set('i-%d' % i for i in xrange(120)),
+            set('j-%d' % i for i in xrange(10)), set(['k-1']))
+        self.groups = dict(('i-%d' % i, ('us-east-1', str(i % 2)))
+                           for i in xrange(120))
+
+    def test_plan(self):
+        batches = dispatcher.plan(self.decisions, self.groups, max_batch=50)
+        self.assertEquals([('start', None, 10), ('stop', ('us-east-1', '0'), 50),
+                           ('stop', ('us-east-1', '0'), 10),
+                           ('stop', ('us-east-1', '1'), 50),
+                           ('stop', ('us-east-1', '1'), 10)],
+                          [(b.action, b.group, len(b.ids)) for b in batches])
+        spread = dispatcher.plan(self.decisions, self.groups, window=600)
+        delays = [b.delay for b in spread]
+        self.assertEquals(sorted(delays), delays)
+        self.assertTrue(0 <= delays[0] and delays[-1] < 600)
+        self.assertEquals(spread, dispatcher.plan(self.decisions, self.groups,
+                                                  window=600))
+        self.assertEquals(dispatcher.spread('i-1', 600), dispatcher.spread(u'i-1', 600))
+        self.assertEquals(dispatcher.spread('vm-\xc3\xa9', 600),
+                          dispatcher.spread(u'vm-\xe9', 600))
+
+    def test_dispatch(self):
+        backend = dispatcher.FakeBackend(latency=0.01)
+        result = dispatcher.Dispatcher(backend, workers=2).dispatch(
+            self.decisions, self.groups)
+        self.assertEquals(self.decisions.stop, result.done['stop'])
+        self.assertEquals(self.decisions.start, result.done['start'])
+        self.assertEquals({}, result.failed)
+        self.assertEquals(5, result.calls)
+        # two workers, though the calls need not overlap
+        self.assertTrue(1 <= backend.peak <= 2, backend.peak)
+        self.assertEquals('start', backend.states['j-1'])
+        self.assertFalse('k-1' in backend.states)
+
+    def test_retries(self):
+        delays = []
+        backend = dispatcher.FakeBackend(throttle=0.5, seed=3)
+        result = dispatcher.Dispatcher(backend, workers=1, retries=20,
+                                       sleep=delays.append, seed=1).dispatch(
+            self.decisions, self.groups)
+        self.assertEquals({}, result.failed)
+        self.assertEquals(130, len(backend.states))
+        self.assertTrue(result.retries > 0)
+        self.assertEquals(result.retries, len(delays))
+        self.assertEquals(5 + result.retries, result.calls)
+
+    def test_failures(self):
+        backend = dispatcher.FakeBackend(max_batch=20)
+        result = dispatcher.Dispatcher(backend, max_batch=50).dispatch(
+            self.decisions, self.groups)
+        self.assertEquals(100, len(result.failed))
+        self.assertEquals('at most 20 ids per call', result.failed['i-0'])
+        backend = dispatcher.FakeBackend(throttle=1.0)
+        result = dispatcher.Dispatcher(backend, retries=2,
+                                       sleep=lambda s: None).dispatch(
+            self.decisions, self.groups)
+        self.assertEquals(130, len(result.failed))
+        self.assertEquals(15, result.calls)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        bucket = dispatcher.TokenBucket(10, burst=2, clock=lambda: now[0],
+                                        sleep=sleep)
+        for _ in xrange(12):
+            bucket.acquire()
+        # two calls from the burst, then one every 0.1s
+        self.assertAlmostEquals(1.0, now[0])
+        self.assertEquals(10, len(sleeps))
+
+    def test_backoff(self):
+        rng = random.Random(0)
+        for attempt in xrange(10):
+            delay = dispatcher.backoff(attempt, 0.5, 4.0, rng)
+            self.assertTrue(0 <= delay <= min(4.0, 0.5 * 2 ** attempt))
+
+
+class CalendarTest(unittest.TestCase):
+
+    def setUp(self):
+        # monday jan 4th is a holiday, a maintenance window keeps resources
+        # on tuesday night
+        calendars.register('holidays', ['2016-01-04'])
+        calendars.register('maint', [{'start': '2016-01-05T21:00',
+                                      'end': '2016-01-06T01:30',
+                                      'state': 'on'}])
+
+    def tearDown(self):
+        calendars.clear()
+
+    def test_index(self):
+        calendar = calendars.Calendar.from_entries('x', [
+            {'start': '2016-01-02T10:00', 'end': '2016-01-03T12:00',
+             'state': 'on'},
+            '2016-01-03',
+            {'start': '2016-01-03T20:00', 'end': '2016-01-05'},
+            '2016-01-10',
+        ])
+        # off wins where it overlaps on, touching off intervals are merged
+        self.assertEquals([
+            (datetime(2016, 1, 2, 10), datetime(2016, 1, 3), 'on'),
+            (datetime(2016, 1, 3), datetime(2016, 1, 5), 'off'),
+            (datetime(2016, 1, 10), datetime(2016, 1, 11), 'off'),
+        ], calendar.intervals())
+        self.assertEquals(None, calendar.state_at(datetime(2016, 1, 2, 9)))
+        self.assertEquals('on', calendar.state_at(datetime(2016, 1, 2, 23)))
+        self.assertEquals('off', calendar.state_at(datetime(2016, 1, 3, 11)))
+        self.assertEquals(None, calendar.state_at(datetime(2016, 1, 5)))
+        self.assertRaises(ValueError, calendars.register, 'a b', [])
+
+    def test_parse(self):
+        tag = 'off=(M-F,19);on=(M-F,7);cal=holidays'
+        self.assertEquals('holidays', function_parser.parse_off_hours(tag)['cal'])
+        self.assertEquals('holidays', ScheduleParser().parse(tag)['cal'])
+        self.assertEquals('holidays', compile_schedule(
+            function_parser.parse_off_hours(tag)).cal)
+        self.assertEquals(compile_schedule(function_parser.parse_off_hours(tag)),
+                          schedule.parse(tag).compile())
+        self.assertEquals(function_parser.parse_off_hours(tag),
+                          schedule.parse(tag).to_dict())
+        for bad in ('off=(M-F,19);on=(M-F,7);cal=', 'cal=a b', 'cal=[x]'):
+            self.assertEquals(None, function_parser.parse_off_hours(bad), bad)
+            self.assertEquals(None, ScheduleParser().parse(bad), bad)
+        self.assertEquals('off=(M-F,19);on=(M-F,7);tz=et;cal=holidays',
+                          canonical.canonical(tag))
+        self.assertEquals('tz=pt;cal=maint', canonical.canonical('cal=maint;tz=pst'))
+        self.assertNotEquals(canonical.fingerprint(tag),
+                             canonical.fingerprint('off=(M-F,19);on=(M-F,7)'))
+
+    def test_validation(self):
+        self.assertFalse(validation.fast_reject('off=(M,19);on=(M,7);cal=us'))
+        self.assertEquals(
+            [validation.ParseError(24, 'a b', validation.INVALID_CALENDAR)],
+            validation.errors('off=(M,19);on=(M,7);cal=a b'))
+        self.assertEquals(
+            [validation.ParseError(4, 'a b', validation.INVALID_CALENDAR)],
+            validation.errors('cal=a b', 'class'))
+
+    def test_evaluate(self):
+        resources = [
+            ('i-1', 'off=(M-F,19);on=(M-F,7);cal=holidays'),
+            ('i-2', 'off=(M-F,19);on=(M-F,7);tz=pt;cal=holidays'),
+            ('i-3', 'off=(M-F,19);on=(M-F,7)'),
+            ('i-4', 'off=(M-F,19);on=(M-F,7);cal=maint'),
+            ('i-5', 'cal=holidays'),
+            ('i-6', 'off=(M-F,19);on=(M-F,7);cal=unknown'),
+            ('i-7', 'cal=holidays;tz=pt'),
+        ]
+        # monday 12:00 eastern
+        d = evaluate.evaluate(resources, datetime(2016, 1, 4, 17))
+        self.assertEquals(set(['i-1', 'i-2', 'i-5', 'i-7']), d.stop)
+        self.assertEquals(set(['i-3', 'i-4', 'i-6']), d.start)
+        # tuesday 00:30 eastern is still monday 21:30 in pacific time
+        # and a tag with only a calendar does nothing outside of it
+        d = evaluate.evaluate(resources, datetime(2016, 1, 5, 5, 30))
+        self.assertEquals(set(), d.start)
+        self.assertTrue('i-5' in d.noop)
+        self.assertTrue('i-7' in d.stop)
+        # tuesday 22:00 eastern, inside the maintenance window
+        d = evaluate.evaluate(resources, datetime(2016, 1, 6, 3))
+        self.assertEquals(set(['i-4']), d.start)
+        self.assertEquals(set(['i-5', 'i-7']), d.noop)
+        self.assertEquals(
+            [evaluate.NOOP, evaluate.STOP],
+            evaluate.schedule_states(
+                [compile_schedule(function_parser.parse_off_hours(tag))
+                 for tag in ('cal=maint', 'tz=pt;cal=holidays')],
+                datetime(2016, 1, 4, 17)))
+
+    def test_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'calendars.json')
+            with open(path, 'w') as f:
+                json.dump({'us': ['2016-12-26']}, f)
+            self.assertEquals(['us'], calendars.load(path))
+            us = calendars.get_calendar('us')
+            self.assertEquals(['us'], calendars.load(path))
+            self.assertTrue(us is calendars.get_calendar('us'))
+            with open(path, 'w') as f:
+                json.dump({'us': ['2016-12-26', '2017-01-02'], 'eu': []}, f)
+            os.utime(path, (0, 0))
+            self.assertEquals(['eu', 'us'], calendars.load(path))
+            self.assertEquals(2, len(calendars.get_calendar('us')))
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
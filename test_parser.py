@@ -1,6 +1,14 @@
 import unittest
 import function_parser as p
 from class_parser import ScheduleParser, DEFAULT_TZ, VALID_HOURS, VALID_DAYS
+from compiled import compile_schedule
+from cache import LRUCache
+import tokenizer as t
+from benchmarks import corpus, bench_import
+import schedule
+import instrument
+import validation as v
+import canonical
 
 
 class ScheduleParserTest(unittest.TestCase):
@@ -50,6 +58,16 @@ class ScheduleParserTest(unittest.TestCase):
         )
         self.assertEquals('pst', s['tz'])
 
+    def test_parses_circular_range(self):
+        s = self.parser.parse('off=(F-M,19);on=(S-U,7)')
+        self.assertEquals(
+            [{ 'days': ['F', 'S', 'U', 'M'], 'hour': 19 }],
+            s['off']
+        )
+        self.assertEquals(['S', 'U'], s['on'][0]['days'])
+        self.assertEquals(['H', 'F', 'S', 'U', 'M', 'T'],
+                          self.parser.expand_day_range('H-T'))
+
     def test_invalid_hour(self):
         s = self.parser.parse('off=(M-F,asdf);on=(M-F,asdf)')
         self.assertEquals(None, s)
@@ -183,6 +201,8 @@ class ParserTest(unittest.TestCase):
         self.assertEquals({'tz': 'pt'}, p.parse_keys("tz=pt"))
         self.assertEquals({'tz': 'et'}, p.parse_keys("tz="))
         self.assertEquals({'tz': 'et'}, p.parse_keys("tz=foo"))
+        self.assertEquals(None, p.parse_keys("tz=pt=x"))
+        self.assertEquals(None, p.parse_off_hours("off=(M-F,19);on=(M-F,7);tz=pt=x"))
 
     def test_parse_off_hours(self):
         self.assertEquals(
@@ -290,5 +310,554 @@ class ParserTest(unittest.TestCase):
         )
 
 
+class CompiledScheduleTest(unittest.TestCase):
+
+    def test_state_at(self):
+        c = compile_schedule(p.parse_off_hours("off=(M-F,19);on=(M-F,7)"))
+        self.assertEquals('off', c.state_at(0, 6))
+        self.assertEquals('on', c.state_at(0, 7))
+        self.assertEquals('on', c.state_at(4, 18))
+        self.assertEquals('off', c.state_at(4, 19))
+        # off from friday evening carries over the weekend
+        self.assertEquals('off', c.state_at(5, 12))
+        self.assertEquals('off', c.state_at(6, 23))
+        self.assertEquals(5 * 12, c.on_hours())
+
+    def test_both_parsers_compile_equal(self):
+        tag = 'off=[(M-F,19),(S,9)];on=[(M-F,7),(S,8)];tz=pt'
+        a = compile_schedule(p.parse_off_hours(tag))
+        b = compile_schedule(ScheduleParser().parse(tag))
+        self.assertEquals(a, b)
+        self.assertEquals(hash(a), hash(b))
+        self.assertEquals('on', a.state_at(5, 8))
+        self.assertEquals('off', a.state_at(5, 9))
+
+    def test_hour_24_is_next_midnight(self):
+        c = compile_schedule(p.parse_off_hours("off=(F,24);on=(M,7)"))
+        self.assertEquals('on', c.state_at(4, 23))
+        self.assertEquals('off', c.state_at(5, 0))
+
+    def test_unscheduled(self):
+        c = compile_schedule(p.parse_off_hours("tz=pt"))
+        self.assertFalse(c.scheduled)
+        self.assertEquals('on', c.state_at(3, 3))
+        self.assertEquals(None, compile_schedule(None))
+
+    def test_off_wins_same_slot(self):
+        c = compile_schedule(p.parse_off_hours("off=(M,7);on=(M,7)"))
+        self.assertEquals('off', c.state_at(0, 7))
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction_order(self):
+        c = LRUCache(2)
+        c['a'] = 1
+        c['b'] = 2
+        self.assertEquals(1, c.get('a'))
+        c['c'] = 3
+        self.assertFalse('b' in c)
+        self.assertTrue('a' in c)
+        self.assertTrue('c' in c)
+        self.assertEquals(
+            {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 0, 'evictions': 1},
+            c.stats()
+        )
+
+    def test_missing_key(self):
+        c = LRUCache(2)
+        self.assertEquals(None, c.get('x'))
+        self.assertRaises(KeyError, lambda: c['x'])
+        self.assertEquals(2, c.misses)
+        self.assertRaises(ValueError, LRUCache, 0)
+
+    def test_parser_caches(self):
+        cache = LRUCache(8)
+        parser = ScheduleParser(cache=cache)
+        first = parser.parse('off=(M-F,19);on=(M-F,7)')
+        self.assertTrue(first is parser.parse('off=(M-F,19);on=(M-F,7)'))
+        self.assertEquals(None, parser.parse('off=(Z,19);on=(M-F,7)'))
+        self.assertEquals(None, parser.parse('off=(Z,19);on=(M-F,7)'))
+        self.assertEquals(2, cache.hits)
+        self.assertEquals(2, cache.misses)
+
+    def test_per_instance_cache(self):
+        a = ScheduleParser(per_instance=True)
+        b = ScheduleParser(per_instance=True)
+        self.assertFalse(a.cache is b.cache)
+        self.assertTrue(ScheduleParser().cache is ScheduleParser.cache)
+
+    def test_function_parser_cache(self):
+        p.cache.clear()
+        first = p.parse_off_hours("off=(M-F,19);on=(M-F,7);tz=pt")
+        self.assertTrue(first is p.parse_off_hours("off=(M-F,19);on=(M-F,7);tz=pt"))
+        self.assertEquals(1, p.cache.hits)
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEquals(
+            [
+                (t.KEY, 'off', 0),
+                (t.RANGE, ('M', 'F'), 6),
+                (t.HOUR, 21, 10),
+                (t.DAY, 'U', 15),
+                (t.HOUR, 18, 17),
+                (t.SEP, ';', 21),
+                (t.KEY, 'tz', 22),
+                (t.VALUE, 'pt', 25)
+            ],
+            t.tokenize('off=[(M-F,21),(U,18)];tz=pt')
+        )
+
+    def test_error_positions(self):
+        self.assertEquals((t.ERROR, t.INVALID_DAY, 5), t.tokenize('off=(Z,19)')[-1])
+        self.assertEquals((t.ERROR, t.EXPECTED_HOUR, 7), t.tokenize('off=(M,x)')[-1])
+        self.assertEquals((t.ERROR, t.EXPECTED_CLOSE, 12),
+                          t.tokenize('off=[(M-F,21,123)]')[-1])
+        self.assertEquals((t.ERROR, t.EXPECTED_BRACKET, 10),
+                          t.tokenize('off=[(M,9)')[-1])
+        self.assertEquals((t.ERROR, t.UNEXPECTED_EQUALS, 5), t.tokenize('tz=pt=x')[-1])
+        # a second "=" makes a malformed on/off item whatever its value
+        self.assertEquals((t.ERROR, t.UNEXPECTED_EQUALS, 4), t.tokenize('on=a=b')[-1])
+        self.assertEquals((t.ERROR, t.UNEXPECTED_EQUALS, 6), t.tokenize('off=19=x')[-1])
+        self.assertEquals((t.ERROR, t.MISSING_EQUALS, 6), t.tokenize('tz=pt;junk')[-1])
+
+    def test_resumes_after_error(self):
+        items = t.scan_items('off=(Z,19);tz=pt')
+        self.assertEquals(2, len(items))
+        self.assertEquals([(t.KEY, 'tz', 11), (t.VALUE, 'pt', 14)], items[1])
+        self.assertEquals([(t.DAY, 'U', 1), (t.HOUR, 9, 3)], t.tokenize_hours('(U,9)'))
+
+    def test_scan_memo(self):
+        # the same value at another position gets its own tokens
+        first = t.scan_items('off=(M,7);on=(M,7)')
+        self.assertEquals([(t.KEY, 'on', 10), (t.DAY, 'M', 14), (t.HOUR, 7, 16)],
+                          first[1])
+        self.assertEquals(first, t.scan_items('off=(M,7);on=(M,7)'))
+        self.assertEquals((t.ERROR, t.EXPECTED_OPEN, 4),
+                          t.scan_items('off=M,7')[0][-1])
+        self.assertEquals((t.RANGE, ('M', 'F'), 4),
+                          t.scan_items('off=M-F,7', bare=True)[0][1])
+        t._scans.clear()
+        self.assertEquals(first, t.scan_items('off=(M,7);on=(M,7)'))
+
+    def test_blanks(self):
+        self.assertEquals([(t.RANGE, ('M', 'F'), 1), (t.HOUR, 19, 6),
+                           (t.DAY, 'U', 13), (t.HOUR, 18, 16)],
+                          t.tokenize_hours('(M-F, 19 ), (U,\t18) '))
+        self.assertEquals((t.ERROR, t.INVALID_DAY, 1), t.tokenize_hours('( M,9)')[-1])
+        # only the class flavor takes a first group without parentheses
+        self.assertEquals((t.ERROR, t.EXPECTED_OPEN, 0), t.tokenize_hours('M-F,19')[-1])
+        self.assertEquals([(t.RANGE, ('M', 'F'), 0), (t.HOUR, 19, 4),
+                           (t.DAY, 'U', 8), (t.HOUR, 18, 10)],
+                          t.tokenize_hours('M-F,19,(U,18)', bare=True))
+        self.assertEquals((t.ERROR, t.EXPECTED_OPEN, 7),
+                          t.tokenize_hours('M-F,19,U,18', bare=True)[-1])
+
+    def test_parsers_accept_blanks(self):
+        expected = p.parse_off_hours('off=[(M-F,19),(U,18)];on=(M-F,7)')
+        for tag in ('off=[(M-F, 19),(U, 18)];on=(M-F, 7)',
+                    'off=[(M-F,19 ), (U,18 )] ;on=(M-F,\t7) '):
+            self.assertEquals(expected, p.parse_off_hours(tag), tag)
+        expected = ScheduleParser().parse('off=[(M-F,19),(U,18)];on=(M-F,7)')
+        for tag in ('off=[(M-F, 19),(U, 18)];on=(M-F, 7)',
+                    'off=M-F,19,(U,18);on=M-F,7', 'off=[M-F,19,(U,18)];on=(M-F,7) '):
+            self.assertEquals(expected, ScheduleParser().parse(tag), tag)
+        self.assertEquals(None, p.parse_off_hours('off=M-F,19;on=M-F,7'))
+
+    def test_parsers_share_tokenizer_semantics(self):
+        self.assertEquals(None, p.parse_off_hours('off=(M,9)junk;on=(M,7)'))
+        self.assertEquals(None, ScheduleParser().parse('off=(M,9)junk;on=(M,7)'))
+        # pieces that are not key=value are skipped by the class parser
+        self.assertEquals(
+            {'off': [{'days': ['M'], 'hour': 9}], 'on': [{'days': ['M'], 'hour': 7}],
+             'tz': 'et'},
+            ScheduleParser().parse('off=(M,9);on=(M,7);junk')
+        )
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def test_compat_dicts(self):
+        # ScheduleParser keeps keys it does not know
+        tags = ['off=(M-F,19);on=(M-F,7);owner=ops', 'owner=ops;tz=pt;team=a']
+        for tag in corpus.generate(300, seed=5) + tags:
+            s = schedule.parse(tag)
+            expected = p._parse_off_hours(tag)
+            self.assertEquals(expected, s and s.to_dict())
+            c = schedule.parse(tag, 'class')
+            expected = ScheduleParser().parse(tag)
+            self.assertEquals(expected, c and c.to_dict('class'))
+
+    def test_interned(self):
+        a = schedule.parse('off=(M-F,19);on=(M-F,7)')
+        b = schedule.parse('off=(M-F,19);on=(M-F,7);tz=et')
+        self.assertTrue(a is b)
+        self.assertTrue(a.off[0] is schedule.intern_rule('MTWHF', 19))
+        self.assertTrue(a is schedule.parse('off=(M-F,19);on=(M-F,7)', 'class'))
+        self.assertEquals(hash(a), hash(b))
+        self.assertRaises(AttributeError, setattr, a, 'tz', 'pt')
+        self.assertEquals(None, schedule.parse('off=(Z,19)'))
+        self.assertEquals(None, schedule.parse('off=(Z,19)'))
+
+    def test_compile(self):
+        tag = 'off=[(M-F,19),(S,9)];on=[(M-F,7),(S,8)];tz=pt'
+        self.assertEquals(compile_schedule(p.parse_off_hours(tag)),
+                          schedule.parse(tag).compile())
+        self.assertEquals(compile_schedule(p.parse_off_hours(tag)),
+                          schedule.parse(tag, 'class').compile())
+
+    def test_parse_rules(self):
+        self.assertEquals(
+            {'off': [(('M', 'T', 'W', 'H', 'F'), 21), (('U',), 18)], 'tz': 'pt'},
+            p.parse_rules("off=[(M-F,21),(U,18)];tz=pt")
+        )
+
+
+class CorpusTest(unittest.TestCase):
+
+    def test_seeded(self):
+        self.assertEquals(corpus.generate(200, seed=3), corpus.generate(200, seed=3))
+        self.assertNotEquals(corpus.generate(200, seed=3), corpus.generate(200, seed=4))
+
+    def test_mix(self):
+        tags = corpus.generate(2000, seed=1, popular=0.5, malformed=0.2)
+        popular = sum(1 for tag in tags if tag in corpus.POPULAR)
+        invalid = sum(1 for tag in tags if p.parse_off_hours(tag) is None)
+        self.assertTrue(900 < popular < 1100)
+        self.assertTrue(300 < invalid < 500)
+        for tag in corpus.generate(200, seed=1, popular=0, malformed=0):
+            self.assertNotEquals(None, p.parse_off_hours(tag))
+            self.assertNotEquals(None, ScheduleParser().parse(tag))
+
+
+class InstrumentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = instrument.MemorySink()
+        instrument.enable(self.stats)
+
+    def tearDown(self):
+        instrument.disable()
+
+    def test_function_parser(self):
+        p.cache.clear()
+        p.parse_off_hours('off=(M-F,19);on=(M-F,7)')
+        p.parse_off_hours('off=(M-F,19);on=(M-F,7)')
+        p.parse_off_hours('off=(M-F,19')
+        p.parse_off_hours('off=(M-M,19)')
+        # the reason is the check that rejected the tag, not the first
+        # scan error
+        p.parse_off_hours('off=(M,25);on=(M,7);tz=pt=x')
+        self.assertEquals(4, self.stats.counter('parses', parser='function'))
+        self.assertEquals(1, self.stats.counter('cache_hits', parser='function'))
+        self.assertEquals(1, self.stats.counter(
+            'rejections', parser='function', reason=t.EXPECTED_CLOSE))
+        self.assertEquals(1, self.stats.counter(
+            'rejections', parser='function', reason=v.INVALID_RANGE))
+        self.assertEquals(1, self.stats.counter(
+            'rejections', parser='function', reason=v.INVALID_HOUR))
+        for stage in ('tokenize', 'validate', 'expand'):
+            self.assertEquals(4, self.stats.timing(stage, parser='function')[0])
+
+    def test_class_parser(self):
+        parser = ScheduleParser(per_instance=True)
+        parser.parse('off=(M-F,19);on=(M-F,7)')
+        parser.parse('off=(M-F,19)')
+        # ScheduleParser skips the malformed tz, the hour is what fails
+        parser.parse('tz=pt=x;off=(M,24);on=(M,7)')
+        self.assertEquals(3, self.stats.counter('cache_misses', parser='class'))
+        self.assertEquals(1, self.stats.counter(
+            'rejections', parser='class', reason=v.MISSING_KEY))
+        self.assertEquals(1, self.stats.counter(
+            'rejections', parser='class', reason=v.INVALID_HOUR))
+        self.assertEquals(3, self.stats.timing('validate', parser='class')[0])
+
+    def test_disabled(self):
+        instrument.disable()
+        self.assertFalse(instrument.enabled)
+        p.parse_off_hours('off=(M-F,19);on=(M-F,7)')
+        self.assertEquals({}, self.stats.counters)
+
+    def test_prometheus_text(self):
+        self.stats.count('rejections', 2, {'reason': 'expected ")"'})
+        self.stats.observe('tokenize', 0.5, {'parser': 'class'})
+        self.assertEquals(
+            '# TYPE offhours_rejections_total counter\n'
+            'offhours_rejections_total{reason="expected \\")\\""} 2\n'
+            '# TYPE offhours_tokenize_seconds summary\n'
+            'offhours_tokenize_seconds_count{parser="class"} 1\n'
+            'offhours_tokenize_seconds_sum{parser="class"} 0.500000000\n',
+            instrument.prometheus_text(self.stats))
+
+
+class ValidationTest(unittest.TestCase):
+
+    def test_errors(self):
+        self.assertEquals([], v.errors('off=(M-F,19);on=(M-F,7);tz=pt'))
+        self.assertEquals([
+            v.ParseError(9, '25', v.INVALID_HOUR),
+            v.ParseError(19, 'X', t.INVALID_DAY)
+        ], v.errors('off=(M-F,25);on=(M-X,7)'))
+        self.assertEquals([v.ParseError(5, 'M-M', v.INVALID_RANGE)],
+                          v.errors('off=(M-M,19)'))
+        self.assertEquals([v.ParseError(0, 'foo', v.UNKNOWN_KEY),
+                           v.ParseError(8, 'o', t.MISSING_EQUALS)],
+                          v.errors('foo=bar;on'))
+        self.assertEquals([v.ParseError(11, '', t.EXPECTED_CLOSE)],
+                          v.errors('off=(M-F,19'))
+
+    def test_class_errors(self):
+        self.assertEquals([], v.errors('foo=bar;tz=pst', 'class'))
+        self.assertEquals([v.ParseError(0, 'off', v.MISSING_KEY)],
+                          v.errors('off=(M-F,19)', 'class'))
+        self.assertEquals([
+            v.ParseError(9, '24', v.INVALID_HOUR),
+            v.ParseError(17, 'on', v.EMPTY_HOURS)
+        ], v.errors('off=(F-M,24);on=;on=', 'class'))
+
+    def test_fast_reject(self):
+        for tag in ('', 'off', 'off=(M,1)=', 'of=(M,1)', 'off=(M,1);foo=1',
+                    'off=(M,1x)', 'off=(M,25)', 'off=(M,0)', 'off=(M,24:30)',
+                    'off=(M-M,1)', 'off=(Z,1);tz=pt', 'off=(M,1);tz=pt;fo=1',
+                    'off=[(M,1)', 'off=(M,1', 'off=(M,1,2)', 'off=(M,1),',
+                    u'off=(M,\u0663)'):
+            self.assertTrue(v.fast_reject(tag), tag)
+        for tag in ('off=(M-F,19);on=(M-F,7)', 'tz=a b', 'off=(M, 1)',
+                    'off=(M,007);on=(M,07:30)', 'off=;on=[]', 'tz=(M,0)',
+                    u'off=(M,1);tz=\xe9'):
+            self.assertFalse(v.fast_reject(tag), tag)
+
+    def test_corpus(self):
+        parser = ScheduleParser(per_instance=True)
+        for tag in corpus.generate(3000, seed=5, popular=0.1, malformed=0.8):
+            valid = p._parse_off_hours(tag) is not None
+            self.assertEquals(valid, not v.errors(tag), tag)
+            self.assertEquals(valid, v.is_valid(tag), tag)
+            if v.fast_reject(tag):
+                self.assertFalse(valid, tag)
+            valid = parser.parse(tag) is not None
+            self.assertEquals(valid, not v.errors(tag, 'class'), tag)
+
+
+    EDGE_TAGS = (
+        '', ';', '=', 'tz=', 'cal=', 'off=', 'on=', 'off=;on=', 'tz=pt=x',
+        'off=(M-F,19);on=(M-F,7);tz=pt=x', 'off=(M-F,19);on=(M-F,7);tz=foo',
+        'off=(M-F,19);on=(M-F,7);tz=[pt]', 'off=(M-F,19);on=(M-F,7);cal=a=b',
+        'off=(M-F,19);on=(M-F,7);cal=bad name', 'off=(M-F, 19) ;on=(M-F,\t7) ',
+        'off=( M-F,19);on=(M-F,7)', 'off=M-F,19;on=M-F,7', 'off=[M-F,19];on=(M,7)',
+        'off=M-F,19,(U,18);on=(M-F,7)', 'off=M-F,19,U,18;on=(M-F,7)',
+        'off=(M-F,19), (U,18);on=(M-F,7)', 'off=(M-F,19)x;on=(M-F,7)',
+        'off=(M-M,19);on=(M,7)', 'off=(M,24:30);on=(M,7)', 'off=(M,0);on=(M,7)',
+        'off=(M,19:5);on=(M,7)', 'off=(M,19);on=(M,7);off=(T,19)',
+        'off=(M,19);;on=(M,7)', 'off=(M,19);on=(M,7);', 'tz=pt;junk',
+        'off=(M,19);on=(M,7);foo=bar', 'off=[(M,19)', 'off=(M,19)]',
+        'off=(M-F,19);on=(M-F,7);on=a=b', 'off=(M-F,19);on=(M-F,7);off=19=x',
+        'off=(M-F,19);on=(M-F,7);on=(M,7)=b', 'off=(M,007);on=(M,07:30)',
+        'off=(M,0:30);on=(M,7)', 'off=(M,19);on=(M,7);tz=(M,0)',
+    )
+
+    def test_agreement(self):
+        # fast_reject only rules out what the parser rejects, and is_valid,
+        # the parse result and errors() always agree
+        parser = ScheduleParser(per_instance=True)
+        tags = corpus.generate(2000, seed=11, popular=0.1, malformed=0.6)
+        for tag in list(self.EDGE_TAGS) + tags:
+            parsed = p.parse_off_hours(tag)
+            if v.fast_reject(tag):
+                self.assertEquals(None, parsed, tag)
+            self.assertEquals(v.is_valid(tag), parsed is not None, tag)
+            self.assertEquals(parsed is not None, v.errors(tag) == [], tag)
+            parsed = parser.parse(tag)
+            self.assertEquals(v.is_valid(tag, 'class'), parsed is not None, tag)
+            self.assertEquals(parsed is not None, v.errors(tag, 'class') == [],
+                              tag)
+
+
+class CanonicalTest(unittest.TestCase):
+
+    def test_canonical(self):
+        for tag in ('off=(M-F,19);on=(M-F,7)', 'off=[(M-F,19)];on=[(M,7),(T-F,7)]',
+                    'on=(M-F,7);off=[(M,19),(T-F,19),(S,19)];tz=est'):
+            self.assertEquals('off=(M-F,19);on=(M-F,7);tz=et',
+                              canonical.canonical(tag))
+        self.assertEquals('off=[(M-F,21),(U,18)];on=[(M-F,6),(U,10)];tz=pt',
+                          canonical.canonical(
+                              'off=[(U,18),(M-F,21)];on=[(U,10),(M-F,6)];tz=pdt'))
+        self.assertEquals('tz=et', canonical.canonical('tz=est'))
+        self.assertEquals('tz=et', canonical.canonical('', 'class'))
+        self.assertEquals(None, canonical.canonical('off=(M-F,19)', 'class'))
+        # midnight is hour 24 of the day before in the function flavor
+        self.assertEquals('off=(T,0);on=(M,7);tz=et',
+                          canonical.canonical('off=(T,0);on=(M,7)', 'class'))
+        self.assertEquals('off=(M,24);on=(M,7);tz=et',
+                          canonical.canonical('off=(M,24);on=(M,7)'))
+        # always off
+        self.assertEquals('off=(U,24);on=(U,24);tz=et',
+                          canonical.canonical('off=(W,5);on=(W,5)'))
+
+    def test_round_trip(self):
+        for flavor, parse in (('function', p._parse_off_hours),
+                              ('class', ScheduleParser(per_instance=True).parse)):
+            for tag in set(corpus.generate(500, seed=3, popular=0.1)):
+                canon = canonical.canonical(tag, flavor)
+                if canon is None:
+                    self.assertEquals(None, parse(tag))
+                    continue
+                self.assertEquals(compile_schedule(parse(tag)).mask,
+                                  compile_schedule(parse(canon)).mask)
+                self.assertEquals(canon, canonical.canonical(canon, flavor))
+                self.assertEquals(canonical.fingerprint(tag, flavor),
+                                  canonical.fingerprint(canon, flavor))
+
+    def test_fingerprint(self):
+        fp = canonical.fingerprint('off=(M-F,19);on=(M-F,7);tz=pt')
+        self.assertEquals(16, len(fp))
+        self.assertEquals(fp, canonical.fingerprint(
+            'off=[(M,19),(T-F,19)];on=(M-F,7);tz=pst', 'class'))
+        self.assertNotEquals(fp, canonical.fingerprint('off=(M-F,19);on=(M-F,7)'))
+        self.assertEquals(None, canonical.fingerprint('junk'))
+        # saturday 3:30 is already off and changes nothing
+        tag = 'off=[(M-F,19),(S,3:30)];on=(M-F,7)'
+        self.assertEquals(canonical.fingerprint('off=(M-F,19);on=(M-F,7)'),
+                          canonical.fingerprint(tag))
+        self.assertEquals(canonical.fingerprint(tag),
+                          canonical.fingerprint(canonical.canonical(tag)))
+        self.assertEquals(compile_schedule(p.parse_off_hours(tag)),
+                          compile_schedule(p.parse_off_hours('off=(M-F,19);on=(M-F,7)')))
+
+    def test_fingerprint_cache(self):
+        cache = canonical.FingerprintCache()
+        a = cache.get('off=(M-F,19);on=(M-F,7)')
+        self.assertTrue(a is cache.get('off=[(M,19),(T-F,19)];on=(M-F,7);tz=et'))
+        self.assertEquals(None, cache.get('junk'))
+        self.assertEquals({'spellings': 3, 'schedules': 1}, cache.stats())
+
+    def test_cardinality(self):
+        report = canonical.cardinality(
+            ['off=(M-F,19);on=(M-F,7)'] * 3 + ['off=[(M-F,19)];on=(M-F,7)', 'junk',
+                                               'tz=pt'], top=1)
+        self.assertEquals(6, report['resources'])
+        self.assertEquals(1, report['invalid'])
+        self.assertEquals(4, report['spellings'])
+        self.assertEquals(2, report['schedules'])
+        self.assertEquals([{
+            'fingerprint': canonical.fingerprint('off=(M-F,19);on=(M-F,7)'),
+            'canonical': 'off=(M-F,19);on=(M-F,7);tz=et',
+            'resources': 4,
+            'spellings': 2
+        }], report['top'])
+
+
+class MinuteTest(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEquals([(t.DAY, 'U', 1), (t.HOUR, 9, 3), (t.MINUTE, 5, 5)],
+                          t.tokenize_hours('(U,9:05)'))
+        self.assertEquals((t.ERROR, t.EXPECTED_MINUTE, 9),
+                          t.tokenize('off=(M,9:5)')[-1])
+        self.assertEquals((t.ERROR, t.EXPECTED_MINUTE, 9),
+                          t.tokenize('off=(M,9:)')[-1])
+
+    def test_function_parser(self):
+        self.assertEquals({
+            'off': [{'days': 'S', 'hour': 19, 'minute': 30},
+                    {'days': 'U', 'hour': 19, 'minute': 30}],
+            'on': [{'days': 'M', 'hour': 7}],
+            'tz': 'et'
+        }, p.parse_off_hours('off=(S-U,19:30);on=(M,7:00)'))
+        self.assertEquals({'off': [(('M',), 19, 30), (('T',), 20)], 'tz': 'et'},
+                          p.parse_rules('off=[(M,19:30),(T,20)]'))
+        self.assertNotEquals(None, p.parse_off_hours('off=(M,24:00);on=(T,8)'))
+        for tag in ('off=(M,19:60);on=(T,8)', 'off=(M,24:30);on=(T,8)',
+                    'off=(M,19:3);on=(T,8)', 'off=(M,19:300);on=(T,8)'):
+            self.assertEquals(None, p.parse_off_hours(tag), tag)
+
+    def test_class_parser(self):
+        parser = ScheduleParser()
+        self.assertEquals({
+            'off': [{'days': ['M', 'T', 'W', 'H', 'F'], 'hour': 19, 'minute': 30}],
+            'on': [{'days': ['M', 'T', 'W', 'H', 'F'], 'hour': 7}],
+            'tz': 'et'
+        }, parser.parse('off=(M-F,19:30);on=(M-F,7:00)'))
+        self.assertEquals(None, parser.parse('off=(M-F,19:75);on=(M-F,7)'))
+
+    def test_compiled(self):
+        c = compile_schedule(p.parse_off_hours('off=(M-F,19:30);on=(M-F,7:45)'))
+        on = dict((d * 24 + 7, ((45, True),)) for d in xrange(5))
+        off = dict((d * 24 + 19, ((30, False),)) for d in xrange(5))
+        self.assertEquals(dict(on, **off), c.edges)
+        self.assertEquals('on', c.state_at(0, 19))
+        self.assertEquals('on', c.state_at(0, 19, 29))
+        self.assertEquals('off', c.state_at(0, 19, 30))
+        self.assertEquals('off', c.state_at(1, 7, 44))
+        self.assertEquals('on', c.state_at(1, 7, 45))
+        self.assertEquals(5 * 11.75, c.on_hours())
+        self.assertEquals([(7 * 60 + 45, 'on'), (19 * 60 + 30, 'off')],
+                          c.changes()[:2])
+        # hour schedules keep the plain mask
+        self.assertEquals(None, compile_schedule(
+            p.parse_off_hours('off=(M-F,19:00);on=(M-F,7)')).edges)
+        self.assertEquals(
+            compile_schedule(p.parse_off_hours('off=(M-F,19:30);on=(M-F,7:45)')),
+            compile_schedule(ScheduleParser().parse(
+                'off=(M-F,19:30);on=[(M-F,7:45)]')))
+
+    def test_off_wins_within_an_hour(self):
+        c = compile_schedule(p.parse_off_hours(
+            'off=(U,23:30);on=[(U,8),(U,23:30)]'))
+        self.assertEquals('on', c.state_at(6, 23, 29))
+        self.assertEquals('off', c.state_at(6, 23, 30))
+        self.assertEquals('off', c.state_at(0, 0))
+
+    def test_schedule(self):
+        s = schedule.parse('off=(M-F,19:30);on=(M-F,7)')
+        self.assertEquals(30, s.off[0].minute)
+        self.assertEquals(0, s.on[0].minute)
+        self.assertEquals(p.parse_off_hours('off=(M-F,19:30);on=(M-F,7)'),
+                          s.to_dict())
+        self.assertEquals(
+            compile_schedule(p.parse_off_hours('off=(M-F,19:30);on=(M-F,7)')),
+            s.compile())
+
+    def test_validation(self):
+        self.assertEquals([
+            v.ParseError(10, '60', v.INVALID_MINUTE),
+            v.ParseError(23, '15', v.INVALID_MINUTE),
+        ], v.errors('off=(M,19:60);on=(M,24:15)'))
+        self.assertFalse(v.fast_reject('off=(M,19:30);on=(M,7)'))
+
+    def test_canonical(self):
+        self.assertEquals('off=[(M-H,19:30),(F,24)];on=(M-F,7:05);tz=et',
+                          canonical.canonical(
+                              'off=[(M-H,19:30),(F,24:00)];on=(M-F,7:05)'))
+        self.assertEquals(
+            canonical.fingerprint('off=(M-F,19:30);on=(M-F,7)'),
+            canonical.fingerprint('off=[(M-F,19:30)];on=(M,7),(T-F,7:00)'))
+        self.assertNotEquals(
+            canonical.fingerprint('off=(M-F,19:30);on=(M-F,7)'),
+            canonical.fingerprint('off=(M-F,19);on=(M-F,7)'))
+
+
+class ImportTest(unittest.TestCase):
+
+    # generous for a busy machine, bench_import reports ~6ms
+    BUDGET = 0.05
+
+    def test_core_path_is_light(self):
+        for module in ('function_parser', 'class_parser', 'schedule',
+                       'validation', 'evaluate'):
+            loaded = bench_import.import_cost(module)[1]
+            self.assertEquals(
+                [], [m for m in bench_import.HEAVY if m in loaded], module)
+
+    def test_import_time(self):
+        best = min(bench_import.import_cost('function_parser')[0]
+                   for _ in xrange(3))
+        self.assertLess(best, self.BUDGET)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+import evaluate
+import function_parser
+import service
+
+
+class ServiceTest(unittest.TestCase):
+
+    def serve(self, address):
+        server = service.make_server(address)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_tcp(self):
+        server = self.serve(('127.0.0.1', 0))
+        client = service.ScheduleClient(server.server_address)
+        self.addCleanup(client.close)
+        tags = ['off=(M-F,19);on=(M-F,7);tz=pt', 'off=(Z,19)']
+        self.assertEquals([function_parser.parse_off_hours(t) for t in tags],
+                          client.parse(tags))
+        self.assertEquals(['M', 'T', 'W', 'H', 'F'],
+                          client.parse(tags[:1], 'class')[0]['off'][0]['days'])
+        resources = [('i-1', tags[0]), ('i-2', tags[1]), ('i-3', 'off=(M-F,19);on=(M-F,7)')]
+        when = datetime(2016, 1, 4, 13)
+        self.assertEquals(evaluate.evaluate(resources, when),
+                          client.evaluate(resources, when))
+        # the shared cache is warm for a second client
+        other = service.ScheduleClient(server.server_address)
+        self.addCleanup(other.close)
+        hits = client.stats()['function']['hits']
+        other.parse(tags)
+        self.assertEquals(hits + 2, other.stats()['function']['hits'])
+
+    def test_pipeline_and_errors(self):
+        server = self.serve(('127.0.0.1', 0))
+        client = service.ScheduleClient(server.server_address, pool_size=1)
+        self.addCleanup(client.close)
+        replies = client.pipeline([
+            {'id': 1, 'op': 'parse', 'tags': ['tz=pt']},
+            {'id': 2, 'op': 'nope'},
+            {'id': 3, 'op': 'parse', 'tags': ['tz=ct']},
+        ])
+        self.assertEquals([1, 2, 3], [r['id'] for r in replies])
+        self.assertEquals([{'tz': 'pt'}], replies[0]['result'])
+        self.assertTrue('unknown op' in replies[1]['error'])
+        self.assertEquals([{'tz': 'ct'}], replies[2]['result'])
+        self.assertRaises(service.ServiceError, client.call, 'nope')
+
+    def test_unix_socket(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'offhours.sock')
+        self.serve(path)
+        client = service.ScheduleClient(path)
+        self.addCleanup(client.close)
+        self.assertEquals([{'tz': 'pt'}], client.parse(['tz=pt']))
+
+
+if __name__ == '__main__':
+    unittest.main()
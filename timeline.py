@@ -0,0 +1,344 @@
+"""
+run length encoded on/off timelines over utc date ranges, for audits and
+chargeback. the timeline of each distinct weekly pattern and timezone is
+worked out once from its WeekIntervals, split where the utc offset changes
+like the projections, and shared by every resource with that schedule. an
+export streams one row per resource and run, so hourly rows are never built:
+
+    python timeline.py tags.jsonl --start 2016-01-01 --end 2016-02-01 \\
+        --id-field id -o timeline.parquet
+
+output is parquet when pyarrow is installed and csv otherwise, with the
+columns resource_id, start, end and state. like the projections, timelines
+follow the weekly rules, exception calendars are not applied.
+"""
+import argparse
+import csv
+from datetime import datetime, timedelta
+import sys
+
+from compiled import CompiledSchedule
+from function_parser import parse_off_hours
+from intervals import EPOCH, local_minute, week_intervals
+from projection import offset_segments
+import timezones
+
+_missing = object()
+
+# imported on the first parquet export rather than with the module, None when
+# it is not installed
+pyarrow = _missing
+
+OFF, ON = 'off', 'on'
+FORMATS = ('parquet', 'csv')
+COLUMNS = ('resource_id', 'start', 'end', 'state')
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# rows per parquet row group
+BATCH_SIZE = 65536
+
+# seconds from the unix epoch to intervals.EPOCH
+_epoch_seconds = (EPOCH - datetime(1970, 1, 1)).days * 86400
+
+
+def get_pyarrow():
+    """
+    returns the pyarrow module, or None if it is not installed. the import is
+    attempted once, on first use
+    """
+    global pyarrow
+    if pyarrow is _missing:
+        try:
+            import pyarrow as module
+            from pyarrow import parquet
+        except ImportError:
+            module = None
+        pyarrow = module
+    return pyarrow
+
+
+class Timeline(object):
+    """
+    consecutive (start, end, state) runs covering a utc range, with start and
+    end in minutes from intervals.EPOCH. adjacent runs always differ in state
+    """
+
+    __slots__ = ('starts', 'ends', 'states', '_rows', '_columns')
+
+    def __init__(self, runs):
+        self.starts = [start for start, _, _ in runs]
+        self.ends = [end for _, end, _ in runs]
+        self.states = [state for _, _, state in runs]
+        self._rows = None
+        self._columns = None
+
+    def intervals(self):
+        """
+        returns the runs as (start, end, state) with naive utc datetimes
+        """
+        return [(EPOCH + timedelta(minutes=start),
+                 EPOCH + timedelta(minutes=end), state)
+                for start, end, state in zip(self.starts, self.ends,
+                                             self.states)]
+
+    def on_minutes(self):
+        return sum(end - start for start, end, state in
+                   zip(self.starts, self.ends, self.states) if state == ON)
+
+    def rows(self):
+        # csv columns after the resource id, formatted once per timeline
+        if self._rows is None:
+            self._rows = [(start.strftime(TIME_FORMAT),
+                           end.strftime(TIME_FORMAT), state)
+                          for start, end, state in self.intervals()]
+        return self._rows
+
+    def columns(self):
+        # parquet columns after the resource id, in unix seconds
+        if self._columns is None:
+            self._columns = (
+                [_epoch_seconds + start * 60 for start in self.starts],
+                [_epoch_seconds + end * 60 for end in self.ends],
+                self.states)
+        return self._columns
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return 'Timeline(%d runs)' % len(self)
+
+
+def build(week, segments, first, last):
+    """
+    returns the Timeline of a WeekIntervals over the utc minutes
+    [first, last), split into offset_segments
+    """
+    runs = []
+
+    def add(start, end, state):
+        if runs and runs[-1][2] == state:
+            runs[-1] = (runs[-1][0], end, state)
+        else:
+            runs.append((start, end, state))
+
+    position = first
+    for begin, stop, offset in segments:
+        for start, end in week.runs(begin + offset, stop + offset):
+            start -= offset
+            if start > position:
+                add(position, start, OFF)
+            add(start, end - offset, ON)
+            position = end - offset
+    if position < last:
+        add(position, last, OFF)
+    return Timeline(runs)
+
+
+def _bounds(start, end):
+    return (local_minute(timezones.utc_naive(start)),
+            local_minute(timezones.utc_naive(end)))
+
+
+def timeline(schedule, start, end, tz=None):
+    """
+    returns the Timeline of a schedule between two utc instants. a resource
+    with an invalid (None) or no schedule is on the whole time
+
+    args:
+        schedule (CompiledSchedule or dict):
+            compiled schedule or parse result
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+        tz (str):
+            timezone to use instead of the schedule's
+    returns:
+        Timeline
+    """
+    if schedule is not None and not isinstance(schedule, CompiledSchedule):
+        schedule = CompiledSchedule.from_parsed(schedule)
+    first, last = _bounds(start, end)
+    if schedule is None or not schedule.scheduled:
+        return Timeline([(first, last, ON)] if first < last else [])
+    return build(week_intervals(schedule),
+                 offset_segments(tz or schedule.tz, start, end), first, last)
+
+
+def fleet_timelines(resources, start, end, parse=parse_off_hours):
+    """
+    yields (resource_id, Timeline) for each resource in input order. every
+    distinct tag is parsed once and every distinct weekly pattern and
+    timezone gets one Timeline, shared by all of its resources
+
+    args:
+        resources (iterable):
+            (resource_id, tag_value) pairs
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+    """
+    first, last = _bounds(start, end)
+    always_on = Timeline([(first, last, ON)] if first < last else [])
+    by_tag = {}
+    shared = {}
+    segments = {}
+    for resource_id, tag in resources:
+        line = by_tag.get(tag)
+        if line is None:
+            schedule = CompiledSchedule.from_parsed(parse(tag))
+            if schedule is None or not schedule.scheduled:
+                line = always_on
+            else:
+                zone = timezones.resolve(schedule.tz)
+                key = (schedule.pattern, zone)
+                line = shared.get(key)
+                if line is None:
+                    if zone not in segments:
+                        segments[zone] = offset_segments(zone, start, end)
+                    line = shared[key] = build(week_intervals(schedule),
+                                               segments[zone], first, last)
+            by_tag[tag] = line
+        yield resource_id, line
+
+
+def write_csv(timelines, fileobj):
+    """
+    writes (resource_id, Timeline) pairs as csv rows, one per run
+
+    returns:
+        int: number of rows written
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(COLUMNS)
+    count = 0
+    for resource_id, line in timelines:
+        writer.writerows([(resource_id,) + row for row in line.rows()])
+        count += len(line)
+    return count
+
+
+def write_parquet(timelines, where, batch_size=BATCH_SIZE):
+    """
+    writes (resource_id, Timeline) pairs to a parquet file, one row per run
+    and one row group per batch_size rows or so
+
+    returns:
+        int: number of rows written
+    """
+    pa = get_pyarrow()
+    if pa is None:
+        raise ValueError('parquet output needs pyarrow')
+    schema = pa.schema([('resource_id', pa.string()),
+                        ('start', pa.timestamp('s', tz='UTC')),
+                        ('end', pa.timestamp('s', tz='UTC')),
+                        ('state', pa.string())])
+    writer = pa.parquet.ParquetWriter(where, schema)
+    columns = ([], [], [], [])
+    count = 0
+
+    def flush():
+        arrays = [pa.array(column, type=field.type)
+                  for column, field in zip(columns, schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, COLUMNS))
+        for column in columns:
+            del column[:]
+
+    try:
+        for resource_id, line in timelines:
+            starts, ends, states = line.columns()
+            columns[0].extend([resource_id] * len(starts))
+            columns[1].extend(starts)
+            columns[2].extend(ends)
+            columns[3].extend(states)
+            count += len(starts)
+            if len(columns[0]) >= batch_size:
+                flush()
+        if columns[0]:
+            flush()
+    finally:
+        writer.close()
+    return count
+
+
+def export(resources, start, end, output, fmt=None, parse=parse_off_hours,
+           batch_size=BATCH_SIZE):
+    """
+    streams the timelines of a fleet over a utc range
+
+    args:
+        resources (iterable):
+            (resource_id, tag_value) pairs
+        start (datetime):
+            utc start, included
+        end (datetime):
+            utc end, excluded
+        output (str or file):
+            path or file object to write to
+        fmt (str):
+            'parquet' or 'csv', defaults to parquet when pyarrow is installed
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+        batch_size (int):
+            rows per parquet row group
+    returns:
+        int: number of rows written
+    """
+    if fmt is None:
+        fmt = 'parquet' if get_pyarrow() is not None else 'csv'
+    timelines = fleet_timelines(resources, start, end, parse)
+    if fmt == 'parquet':
+        return write_parquet(timelines, output, batch_size)
+    elif fmt == 'csv':
+        if isinstance(output, basestring):
+            with open(output, 'wb') as f:
+                return write_csv(timelines, f)
+        return write_csv(timelines, output)
+    raise ValueError('unknown format %r, expected one of %s' % (fmt, FORMATS))
+
+
+def main(argv=None):
+    import bulk
+    import calendars
+    parser = argparse.ArgumentParser(description='fleet timeline export')
+    parser.add_argument('input', help="jsonl or csv file, '-' for stdin")
+    parser.add_argument('--format', choices=bulk.FORMATS, default='jsonl',
+                        help='input format')
+    parser.add_argument('--start', required=True, type=calendars.parse_time,
+                        help='utc start, an iso date or date and time')
+    parser.add_argument('--end', required=True, type=calendars.parse_time,
+                        help='utc end, excluded')
+    parser.add_argument('--field', default='schedule',
+                        help='field holding the schedule tag')
+    parser.add_argument('--id-field', default='id',
+                        help='field holding the resource id')
+    parser.add_argument('--flavor', choices=bulk.FLAVORS, default='function')
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file, '-' (the default) for stdout")
+    parser.add_argument('--output-format', choices=FORMATS,
+                        help='parquet when pyarrow is installed, else csv')
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else args.output
+    try:
+        records = bulk.read_records(infile, args.format)
+        # records without a string tag, and lines that did not decode, are
+        # skipped
+        resources = ((r.get(args.id_field), r.get(args.field))
+                     for r in records
+                     if isinstance(r.get(args.field), basestring))
+        count = export(resources, args.start, args.end, output,
+                       args.output_format, bulk.get_parser(args.flavor))
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    sys.stderr.write('%d rows\n' % count)
+
+
+if __name__ == '__main__':
+    main()
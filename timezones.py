@@ -0,0 +1,285 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+tz_aliases = {
+    'pdt': 'America/Los_Angeles',
+    'pt': 'America/Los_Angeles',
+    'pst': 'America/Los_Angeles',
+    'est': 'America/New_York',
+    'edt': 'America/New_York',
+    'et': 'America/New_York',
+    'cst': 'America/Chicago',
+    'cdt': 'America/Chicago',
+    'ct': 'America/Chicago',
+    'mt': 'America/Denver',
+    'gmt': 'Europe/London',
+    'gt': 'Europe/London'
+}
+
+default_tz = 'et'
+
+# standard (non daylight saving) utc offsets in hours and the dst rule of the
+# zones that can be converted without pytz
+standard_offsets = {
+    'America/Los_Angeles': -8,
+    'America/New_York': -5,
+    'America/Chicago': -6,
+    'America/Denver': -7,
+    'Europe/London': 0,
+    'UTC': 0
+}
+dst_rules = {
+    'America/Los_Angeles': 'us',
+    'America/New_York': 'us',
+    'America/Chicago': 'us',
+    'America/Denver': 'us',
+    'Europe/London': 'eu'
+}
+
+# years to build offset tables for up front with preload(), tables for other
+# years are built the first time they are needed
+this_year = datetime.utcnow().year
+window = (this_year - 1, this_year + 2)
+
+_resolved = {}
+_tables = {}
+_pytz = []
+_hour = timedelta(hours=1)
+
+
+def get_pytz():
+    """
+    returns the pytz module, or None if it is not installed. the import is
+    attempted once, on first use
+    """
+    if not _pytz:
+        try:
+            import pytz
+        except ImportError:
+            pytz = None
+        _pytz.append(pytz)
+    return _pytz[0]
+
+
+def resolve(tz):
+    """
+    returns the IANA zone name for a timezone alias such as 'pt'. full zone
+    names are returned as they are, unknown values fall back to the default tz.
+    each value is only resolved once.
+
+    args:
+        tz (str):
+            alias from tz_aliases or an IANA zone name
+    returns:
+        str: IANA zone name
+    """
+    zone = _resolved.get(tz)
+    if zone is None:
+        zone = _resolved[tz] = _resolve(tz)
+    return zone
+
+
+def _resolve(tz):
+    if tz:
+        zone = tz_aliases.get(tz.lower())
+        if zone:
+            return zone
+        if tz in standard_offsets:
+            return tz
+        pytz = get_pytz()
+        if pytz is not None and tz in pytz.all_timezones_set:
+            return tz
+    return tz_aliases[default_tz]
+
+
+class OffsetTable(object):
+    """
+    utc offsets of a zone over one year: the utc instants at which the offset
+    changes, starting with new year, and the offset from each one on
+    """
+
+    __slots__ = ('starts', 'offsets')
+
+    def __init__(self, starts, offsets):
+        self.starts = starts
+        self.offsets = offsets
+
+    def offset_at(self, when):
+        return self.offsets[bisect_right(self.starts, when) - 1]
+
+
+def _nth_sunday(year, month, n):
+    # n-th sunday of a month, or the last one for n = -1
+    if n > 0:
+        first = datetime(year, month, 1)
+        return first + timedelta(days=(6 - first.weekday()) % 7 + 7 * (n - 1))
+    last = datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() + 1) % 7)
+
+
+def _rule_changes(zone, year):
+    # (utc instant, offset) changes of a zone with a built in dst rule
+    std = timedelta(hours=standard_offsets[zone])
+    rule = dst_rules.get(zone)
+    if rule == 'us':
+        # second sunday in march to the first sunday in november, 2am local
+        return [
+            (_nth_sunday(year, 3, 2) + timedelta(hours=2) - std, std + _hour),
+            (_nth_sunday(year, 11, 1) + _hour - std, std)
+        ]
+    elif rule == 'eu':
+        # last sunday in march to the last sunday in october, 1am utc
+        return [
+            (_nth_sunday(year, 3, -1) + _hour, std + _hour),
+            (_nth_sunday(year, 10, -1) + _hour, std)
+        ]
+    return []
+
+
+def _pytz_changes(zone, start, end):
+    # (utc instant, offset) at start and at every change before end
+    tz = get_pytz().timezone(zone)
+    times = getattr(tz, '_utc_transition_times', None)
+    if not times:
+        return [(start, tz.utcoffset(start))]
+    infos = tz._transition_info
+    i = max(bisect_right(times, start) - 1, 0)
+    changes = [(start, infos[i][0])]
+    for i in xrange(i + 1, len(times)):
+        if times[i] >= end:
+            break
+        changes.append((times[i], infos[i][0]))
+    return changes
+
+
+def offset_table(zone, year):
+    """
+    returns the cached OffsetTable of a resolved zone for a year. tables come
+    from pytz when it is installed, otherwise from the built in dst rules
+
+    args:
+        zone (str):
+            IANA zone name as returned by resolve
+        year (int):
+            utc year
+    returns:
+        OffsetTable
+    """
+    table = _tables.get((zone, year))
+    if table is None:
+        start = datetime(year, 1, 1)
+        if get_pytz() is None:
+            changes = [(start, timedelta(hours=standard_offsets[zone]))]
+            changes.extend(_rule_changes(zone, year))
+        else:
+            changes = _pytz_changes(zone, start, datetime(year + 1, 1, 1))
+        table = OffsetTable([c[0] for c in changes], [c[1] for c in changes])
+        _tables[(zone, year)] = table
+    return table
+
+
+def preload(tzs=None, years=None):
+    """
+    builds the offset tables for a set of timezones over a window of years so
+    later conversions are only a lookup
+
+    args:
+        tzs (iterable):
+            aliases or zone names, defaults to every alias
+        years (tuple):
+            (first, last + 1) year, defaults to the module level window
+    """
+    first, end = years or window
+    for zone in set(resolve(tz) for tz in (tzs or tz_aliases)):
+        for year in xrange(first, end):
+            offset_table(zone, year)
+
+
+def utc_naive(when):
+    """
+    returns a naive utc datetime for an aware datetime, naive ones are
+    assumed to already be utc
+    """
+    if when.tzinfo is not None:
+        return (when - when.utcoffset()).replace(tzinfo=None)
+    return when
+
+
+def utc_offset(when, tz):
+    """
+    returns the utc offset of tz at a utc instant as a timedelta
+    """
+    when = utc_naive(when)
+    return offset_table(resolve(tz), when.year).offset_at(when)
+
+
+def offset_span(when, tz):
+    """
+    returns (offset, end), the utc offset of tz at a utc instant and the utc
+    instant that offset stops applying. end is at most the start of the next
+    utc year, where the offset may carry on unchanged
+    """
+    when = utc_naive(when)
+    table = offset_table(resolve(tz), when.year)
+    i = bisect_right(table.starts, when)
+    if i < len(table.starts):
+        return table.offsets[i - 1], table.starts[i]
+    return table.offsets[i - 1], datetime(when.year + 1, 1, 1)
+
+
+def to_local(when, tz):
+    """
+    converts a utc datetime to the wall clock time in tz. naive datetimes are
+    assumed to be utc.
+
+    args:
+        when (datetime):
+            instant to convert
+        tz (str):
+            alias or IANA zone name
+    returns:
+        datetime: naive local datetime
+    """
+    when = utc_naive(when)
+    return when + offset_table(resolve(tz), when.year).offset_at(when)
+
+
+def to_utc(local, tz):
+    """
+    converts a naive wall clock time in tz to a naive utc datetime. wall
+    clock times that are ambiguous or skipped by a dst change are treated as
+    standard time.
+
+    args:
+        local (datetime):
+            naive local datetime
+        tz (str):
+            alias or IANA zone name
+    returns:
+        datetime: naive utc datetime
+    """
+    zone = resolve(tz)
+    # the offsets in effect a day either side, standard time first
+    candidates = sorted(set(
+        utc_offset(local + timedelta(days=d), zone) for d in (-1, 1)))
+    for offset in candidates:
+        utc = local - offset
+        if utc_offset(utc, zone) == offset:
+            return utc
+    return local - candidates[0]
+
+
+def local_slot(when, tz):
+    """
+    returns the (weekday, hour) in tz for a utc datetime
+    """
+    local = to_local(when, tz)
+    return local.weekday(), local.hour
+
+
+def local_time(when, tz):
+    """
+    returns the (weekday, hour, minute) in tz for a utc datetime
+    """
+    local = to_local(when, tz)
+    return local.weekday(), local.hour, local.minute
@@ -0,0 +1,250 @@
+from collections import namedtuple
+
+# bumped whenever a change to the grammar or the parsers can change the
+# result of a tag, so persisted results of an older version are not reused
+GRAMMAR_VERSION = 6
+
+# token kinds
+KEY = 'KEY'        # key of a key=value item, value is the key string
+VALUE = 'VALUE'    # raw value of a non on/off key, e.g. the tz
+DAY = 'DAY'        # single day, value is the day letter
+RANGE = 'RANGE'    # day range, value is a (start, end) tuple of day letters
+HOUR = 'HOUR'      # hour of a (days,hour) group, value is an int
+MINUTE = 'MINUTE'  # minutes of an hour written as h:mm, value is an int
+SEP = 'SEP'        # ';' between items
+ERROR = 'ERROR'    # scan error, value is the reason
+
+# error reasons
+MISSING_EQUALS = 'missing "="'
+UNEXPECTED_EQUALS = 'unexpected "="'
+INVALID_DAY = 'invalid day'
+EXPECTED_OPEN = 'expected "("'
+EXPECTED_COMMA = 'expected ","'
+EXPECTED_CLOSE = 'expected ")"'
+EXPECTED_BRACKET = 'expected "]"'
+EXPECTED_HOUR = 'expected hour'
+EXPECTED_MINUTE = 'expected two digit minutes'
+UNEXPECTED_CHARACTER = 'unexpected character'
+
+DAYS = frozenset('MTWHFSU')
+DIGITS = frozenset('0123456789')
+BLANKS = frozenset(' \t')
+TIME_KEYS = frozenset(('on', 'off'))
+
+Token = namedtuple('Token', ('kind', 'value', 'pos'))
+
+# builds a Token without going through the python level namedtuple __new__
+_new = tuple.__new__
+
+# number of scanned on/off values to remember, see _scan_value
+SCAN_CACHE_SIZE = 4096
+_scans = {}
+
+
+def tokenize(text):
+    """
+    scans a whole schedule tag in a single pass, for example:
+        "off=[(M-F,21),(U,18)];tz=pt"
+    and returns the tokens:
+        KEY off, RANGE (M, F), HOUR 21, DAY U, HOUR 18, SEP, KEY tz, VALUE pt
+
+    scanning never raises. a malformed item produces an ERROR token holding
+    the reason and the position of the offending character, and scanning
+    resumes at the next ';' so callers can decide whether to skip the item
+    or reject the whole tag.
+
+    args:
+        text (str):
+            schedule tag value
+    returns:
+        list: Token tuples of (kind, value, pos)
+    """
+    tokens = []
+    pos = 0
+    for item in scan_items(text):
+        if tokens:
+            pos = text.index(';', pos)
+            tokens.append(_new(Token, (SEP, ';', pos)))
+            pos += 1
+        tokens.extend(item)
+    return tokens
+
+
+def scan_items(text, bare=False):
+    """
+    same scan as tokenize, with the tokens grouped per ';' separated item
+    instead of being split by SEP tokens. this is what the parsers use.
+
+    args:
+        text (str):
+            schedule tag value
+        bare (bool):
+            allow the first (days,hour) group of an on/off value without its
+            parentheses, "off=M-F,19", as ScheduleParser always has
+    returns:
+        list: one list of tokens per item
+    """
+    return list(iter_items(text, bare))
+
+
+def iter_items(text, bare=False):
+    """
+    lazy scan_items, each item is only scanned when it is asked for so a
+    parser can stop at the first item it rejects
+    """
+    end = len(text)
+    pos = 0
+    while True:
+        tokens = []
+        semi = text.find(';', pos)
+        if semi < 0:
+            semi = end
+        eq = text.find('=', pos, semi)
+        if eq < 0:
+            tokens.append(_new(Token, (ERROR, MISSING_EQUALS, pos)))
+        else:
+            key = text[pos:eq]
+            tokens.append(_new(Token, (KEY, key, pos)))
+            if key in TIME_KEYS:
+                tokens.extend(_scan_value(text, eq + 1, semi, bare))
+            else:
+                extra = text.find('=', eq + 1, semi)
+                if extra >= 0:
+                    tokens.append(_new(Token, (ERROR, UNEXPECTED_EQUALS, extra)))
+                else:
+                    tokens.append(_new(Token, (VALUE, text[eq + 1:semi], eq + 1)))
+        yield tokens
+        if semi == end:
+            return
+        pos = semi + 1
+
+
+def _scan_value(text, start, end, bare):
+    # the tokens of an on/off value, remembered by value and position since
+    # a fleet repeats a handful of values. a plain dict emptied when full,
+    # the lock of an LRUCache costs as much as the scan
+    key = (text[start:end], start, bare)
+    tokens = _scans.get(key)
+    if tokens is None:
+        tokens = []
+        _scan_hours(text, start, end, tokens, bare)
+        if tokens and tokens[-1].kind is ERROR:
+            # on=a=b is a malformed key=value item before it is a malformed
+            # value, like tz=pt=x
+            extra = text.find('=', start, end)
+            if extra >= 0:
+                tokens[-1] = _new(Token, (ERROR, UNEXPECTED_EQUALS, extra))
+        tokens = tuple(tokens)
+        if len(_scans) >= SCAN_CACHE_SIZE:
+            _scans.clear()
+        _scans[key] = tokens
+    return tokens
+
+
+def tokenize_hours(text, bare=False):
+    """
+    scans only the value of an on/off key such as "[(M-F,21),(U,18)]"
+
+    args:
+        text (str):
+            on/off value
+        bare (bool):
+            allow the first group without its parentheses, see scan_items
+    returns:
+        list: DAY/RANGE, HOUR and ERROR tokens
+    """
+    tokens = []
+    _scan_hours(text, 0, len(text), tokens, bare)
+    return tokens
+
+
+def split_items(tokens):
+    """
+    yields the tokens of each ';' separated item of a tokenize result
+    """
+    start = 0
+    for i, token in enumerate(tokens):
+        if token.kind is SEP:
+            yield tokens[start:i]
+            start = i + 1
+    yield tokens[start:]
+
+
+def _scan_hours(text, i, end, tokens, bare=False):
+    # scans "[(D,H),(D-D,H)]" between i and end, the brackets are optional.
+    # blanks are allowed around the hour and after the value, and with bare
+    # the first group can leave out its parentheses, "M-F,19,(U,18)". stops
+    # at the first error after recording an ERROR token
+    append = tokens.append
+    i = _skip_blanks(text, i, end)
+    bracket = i < end and text[i] == '['
+    if bracket:
+        i = _skip_blanks(text, i + 1, end)
+    # an empty list is left for the parsers to reject
+    if i < end and text[i] != ']':
+        while True:
+            paren = i < end and text[i] == '('
+            if paren:
+                i += 1
+            elif not bare:
+                return _error(text, i, end, EXPECTED_OPEN, append)
+            bare = False
+            if i >= end or text[i] not in DAYS:
+                return _error(text, i, end, INVALID_DAY, append)
+            start = i
+            i += 1
+            if i < end and text[i] == '-':
+                i += 1
+                if i >= end or text[i] not in DAYS:
+                    return _error(text, i, end, INVALID_DAY, append)
+                append(_new(Token, (RANGE, (text[start], text[i]), start)))
+                i += 1
+            else:
+                append(_new(Token, (DAY, text[start], start)))
+            if i >= end or text[i] != ',':
+                return _error(text, i, end, EXPECTED_COMMA, append)
+            i = _skip_blanks(text, i + 1, end)
+            start = i
+            hour = 0
+            while i < end and text[i] in DIGITS:
+                hour = hour * 10 + ord(text[i]) - 48
+                i += 1
+            if i == start:
+                return _error(text, i, end, EXPECTED_HOUR, append)
+            append(_new(Token, (HOUR, hour, start)))
+            # minutes are optional and always two digits, (M-F,19:30)
+            if i < end and text[i] == ':':
+                i += 1
+                if i + 2 > end or text[i] not in DIGITS or \
+                        text[i + 1] not in DIGITS:
+                    return _error(text, i, end, EXPECTED_MINUTE, append)
+                append(_new(Token, (MINUTE, int(text[i:i + 2]), i)))
+                i += 2
+            i = _skip_blanks(text, i, end)
+            if paren:
+                if i >= end or text[i] != ')':
+                    return _error(text, i, end, EXPECTED_CLOSE, append)
+                i = _skip_blanks(text, i + 1, end)
+            if i < end and text[i] == ',':
+                i = _skip_blanks(text, i + 1, end)
+                continue
+            break
+    if bracket:
+        if i < end and text[i] == ']':
+            i = _skip_blanks(text, i + 1, end)
+        else:
+            return _error(text, i, end, EXPECTED_BRACKET, append)
+    if i < end:
+        return _error(text, i, end, UNEXPECTED_CHARACTER, append)
+
+
+def _skip_blanks(text, i, end):
+    while i < end and text[i] in BLANKS:
+        i += 1
+    return i
+
+
+def _error(text, pos, end, reason, append):
+    if pos < end and text[pos] == '=':
+        reason = UNEXPECTED_EQUALS
+    append(_new(Token, (ERROR, reason, pos)))
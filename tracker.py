@@ -0,0 +1,158 @@
+from cache import LRUCache, DEFAULT_CACHE_SIZE
+from canonical import fingerprint_key
+from compiled import compile_schedule
+import evaluate
+from evaluate import NOOP, START, STOP, Decisions
+from function_parser import parse_off_hours
+
+_missing = object()
+
+
+class ScheduleTracker(object):
+    """
+    keeps the last tag and compiled schedule of every resource and the sets
+    of resources to stop and start, and updates them from a feed of added,
+    changed and removed resources. only changed tags are parsed, so the cost
+    of a sweep follows the churn instead of the fleet size. resources are
+    grouped by schedule fingerprint, so every spelling of a schedule shares
+    one state and one evaluation per advance.
+
+    args:
+        when (datetime):
+            utc instant the states are evaluated at
+        parse (callable):
+            parse_off_hours or ScheduleParser().parse
+        cache_size (int):
+            distinct tags to keep compiled
+    """
+
+    def __init__(self, when, parse=parse_off_hours, cache_size=DEFAULT_CACHE_SIZE):
+        self.when = when
+        self.parse = parse
+        self.parses = 0
+        self._compiled = LRUCache(cache_size)
+        self._tags = {}
+        # resource id -> fingerprint key, and by key the first compiled
+        # schedule seen, the resource ids and their state
+        self._key_of = {}
+        self._schedules = {}
+        self._members = {}
+        self._state = {}
+        self._sets = {STOP: set(), START: set(), NOOP: set()}
+
+    @property
+    def stop(self):
+        return self._sets[STOP]
+
+    @property
+    def start(self):
+        return self._sets[START]
+
+    @property
+    def noop(self):
+        return self._sets[NOOP]
+
+    def decisions(self):
+        """
+        returns a copy of the current sets as evaluate.Decisions
+        """
+        return Decisions(set(self.stop), set(self.start), set(self.noop))
+
+    def __len__(self):
+        return len(self._tags)
+
+    def _compile(self, tag):
+        # (fingerprint key, CompiledSchedule) of a tag
+        compiled = self._compiled.get(tag, _missing)
+        if compiled is _missing:
+            self.parses += 1
+            schedule = compile_schedule(self.parse(tag))
+            compiled = fingerprint_key(schedule), schedule
+            self._compiled.put(tag, compiled)
+        return compiled
+
+    def _detach(self, resource_id):
+        key = self._key_of.pop(resource_id)
+        members = self._members[key]
+        members.discard(resource_id)
+        self._sets[self._state[key]].discard(resource_id)
+        if not members:
+            del self._members[key]
+            del self._state[key]
+            del self._schedules[key]
+
+    def _attach(self, resource_id, compiled):
+        key, schedule = compiled
+        self._key_of[resource_id] = key
+        members = self._members.get(key)
+        if members is None:
+            members = self._members[key] = set()
+            self._schedules[key] = schedule
+            self._state[key] = evaluate.schedule_states(
+                [schedule], self.when)[0]
+        members.add(resource_id)
+        self._sets[self._state[key]].add(resource_id)
+
+    def update(self, resources):
+        """
+        adds resources or changes their tags. resources whose tag did not
+        change are skipped without parsing
+
+        args:
+            resources (iterable or dict):
+                (resource_id, tag_value) pairs
+        """
+        if isinstance(resources, dict):
+            resources = resources.iteritems()
+        for resource_id, tag in resources:
+            old = self._tags.get(resource_id, _missing)
+            if old == tag:
+                continue
+            if old is not _missing:
+                self._detach(resource_id)
+            self._tags[resource_id] = tag
+            self._attach(resource_id, self._compile(tag))
+
+    def remove(self, resource_ids):
+        for resource_id in resource_ids:
+            if self._tags.pop(resource_id, _missing) is not _missing:
+                self._detach(resource_id)
+
+    def apply(self, added=(), changed=(), removed=()):
+        """
+        applies one delta of the inventory feed
+
+        args:
+            added (iterable or dict):
+                (resource_id, tag_value) of new resources
+            changed (iterable or dict):
+                (resource_id, tag_value) of resources whose tag changed
+            removed (iterable):
+                ids of resources that are gone
+        """
+        self.remove(removed)
+        self.update(added)
+        self.update(changed)
+
+    def advance(self, when):
+        """
+        re-evaluates every distinct schedule at when and moves the resources
+        of the schedules whose state changed
+
+        returns:
+            int: number of resources that changed set
+        """
+        self.when = when
+        keys = list(self._members)
+        states = evaluate.schedule_states([self._schedules[k] for k in keys],
+                                          when)
+        moved = 0
+        for key, state in zip(keys, states):
+            old = self._state[key]
+            if old != state:
+                members = self._members[key]
+                self._sets[old].difference_update(members)
+                self._sets[state].update(members)
+                self._state[key] = state
+                moved += len(members)
+        return moved
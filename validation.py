@@ -0,0 +1,210 @@
+"""
+validation mode for schedule tags. instead of collapsing every failure into
+None, errors() returns one ParseError per problem with the position and text
+of the offending token and the reason, without raising:
+
+    >>> errors('off=(M-F,25);on=(M-X,7)')
+    [ParseError(pos=9, token='25', reason='invalid hour'),
+     ParseError(pos=19, token='X', reason='invalid day')]
+
+fast_reject() is a pre-check built on str.count, str.translate and set
+lookups that rules out the obviously invalid tags (missing or extra '=',
+unknown keys, bad days or hours, unclosed groups) before they reach the
+parser.
+"""
+from collections import namedtuple
+import string
+
+from calendars import valid_name
+from class_parser import ScheduleParser, VALID_HOURS, VALID_MINUTES
+import function_parser
+from tokenizer import iter_items, KEY, DAY, RANGE, HOUR, MINUTE, ERROR, \
+    UNEXPECTED_EQUALS
+
+ParseError = namedtuple('ParseError', ('pos', 'token', 'reason'))
+
+# reasons found after scanning, the scan errors use the tokenizer reasons
+UNKNOWN_KEY = 'unknown key'
+INVALID_HOUR = 'invalid hour'
+INVALID_MINUTE = 'invalid minute'
+INVALID_RANGE = 'invalid day range'
+EMPTY_HOURS = 'no (days,hour) groups'
+MISSING_KEY = 'on and off go together'
+INVALID_CALENDAR = 'invalid calendar name'
+
+KEY_PREFIXES = ('off=', 'on=', 'tz=', 'cal=')
+FREE_KEYS = ('tz=', 'cal=')
+
+# the words left of an on/off item once its punctuation is taken out: the
+# key, days, ranges, hours and h:mm times parse_off_hours takes
+WORDS = frozenset(
+    ['', 'off', 'on'] + list(function_parser.valid_days) +
+    ['%s-%s' % days for days in function_parser.day_ranges] +
+    [str(h) for h in function_parser.valid_hours] +
+    ['%d:%02d' % (h, m) for h in function_parser.valid_hours
+     for m in function_parser.valid_minutes if h < 24 or not m])
+_PUNCTUATION = string.maketrans('()[];= \t', ',' * 8)
+
+_class_parser = ScheduleParser()
+
+
+def fast_reject(tag):
+    """
+    returns True when the tag is certainly rejected by parse_off_hours. a
+    False result does not mean the tag is valid, only that it needs parsing.
+    the class flavor skips unknown keys and accepts any tz, so there is no
+    pre-check for it
+
+    args:
+        tag (str):
+            schedule tag value
+    returns:
+        bool
+    """
+    # every ';' separated item is key=value with exactly one '='
+    separators = tag.count(';')
+    if tag.count('=') != separators + 1:
+        return True
+    if not tag.startswith(KEY_PREFIXES):
+        return True
+    # tz and cal values can hold anything, the other items follow the grammar
+    # checked below, which also rules out unknown keys
+    hours = tag
+    if 'tz=' in tag or 'cal=' in tag:
+        hours = ';'.join([item for item in tag.split(';')
+                          if not item.startswith(FREE_KEYS)])
+    if isinstance(hours, unicode):
+        try:
+            hours = hours.encode('ascii')
+        except UnicodeError:
+            return True
+    # no word but days, hours and times, with leading zeros as in 007 allowed
+    for word in set(hours.translate(_PUNCTUATION).split(',')) - WORDS:
+        word = word.lstrip('0')
+        if not word or word not in WORDS:
+            return True
+    if ' ' in hours or '\t' in hours:
+        # blanks can go in a few places, leave those tags to the parser
+        return False
+    # every group is (days,hour) with its parentheses closed, one ',' inside
+    # and one between groups
+    groups = hours.count('(')
+    return hours.count(')') != groups or \
+        hours.count('[') != hours.count(']') or \
+        hours.count(',') != groups + hours.count('),(')
+
+
+def is_valid(tag, flavor='function'):
+    """
+    returns True if the tag parses, rejecting the obvious cases without
+    parsing them
+    """
+    if flavor == 'class':
+        return _class_parser.parse(tag) is not None
+    return not fast_reject(tag) and \
+        function_parser.parse_off_hours(tag) is not None
+
+
+def errors(tag, flavor='function'):
+    """
+    returns the problems that make parse_off_hours (flavor='function') or
+    ScheduleParser.parse (flavor='class') reject a tag. the scan stops at the
+    first error of an item, so each item reports at most one scan error
+
+    args:
+        tag (str):
+            schedule tag value
+        flavor (str):
+            'function' or 'class'
+    returns:
+        list: ParseError tuples in tag order, empty if the tag is valid
+    """
+    if flavor == 'class':
+        return _class_errors(tag)
+    out = []
+    for item in iter_items(tag):
+        first = item[0]
+        if first.kind is ERROR:
+            out.append(_scan_error(tag, first))
+        elif first.value in ('off', 'on'):
+            out.extend(_hour_errors(tag, item[1:], _function_days,
+                                    function_parser.valid_hours))
+        elif first.value == 'cal':
+            out.extend(_calendar_errors(tag, item))
+        elif first.value != 'tz':
+            out.append(ParseError(first.pos, first.value, UNKNOWN_KEY))
+        elif item[-1].kind is ERROR:
+            # tz=pt=x, an unknown alias falls back to the default timezone
+            out.append(_scan_error(tag, item[-1]))
+    return out
+
+
+def _class_errors(tag):
+    # ScheduleParser skips malformed items and keeps the last of repeated
+    # keys, so only the last on, off and cal items count
+    found = {}
+    for item in iter_items(tag, bare=True):
+        first = item[0]
+        if first.kind is not KEY or item[-1].value == UNEXPECTED_EQUALS:
+            continue
+        if first.value in ('off', 'on'):
+            problems = _hour_errors(tag, item[1:], _class_days, VALID_HOURS)
+            if len(item) == 1:
+                problems.append(ParseError(first.pos, first.value, EMPTY_HOURS))
+            found[first.value] = first, problems
+        elif first.value == 'cal':
+            found['cal'] = first, _calendar_errors(tag, item)
+    out = found['cal'][1] if 'cal' in found else []
+    for key, other in (('off', 'on'), ('on', 'off')):
+        if key in found:
+            first, problems = found[key]
+            out.extend(problems)
+            if other not in found:
+                out.append(ParseError(first.pos, first.value, MISSING_KEY))
+    return sorted(out)
+
+
+def _calendar_errors(tag, item):
+    value = item[-1]
+    if value.kind is ERROR:
+        return [_scan_error(tag, value)]
+    if len(item) != 2 or not valid_name(value.value):
+        return [ParseError(value.pos, value.value, INVALID_CALENDAR)]
+    return []
+
+
+def _function_days(token):
+    # a range of a day onto itself, like M-M, is not valid
+    return token.kind is DAY or token.value in function_parser.day_ranges
+
+
+def _class_days(token):
+    return bool(_class_parser.expand_days(token))
+
+
+def _hour_errors(tag, tokens, valid_days, valid_hours):
+    out = []
+    days = hour = None
+    for token in tokens:
+        kind = token.kind
+        if kind is HOUR:
+            hour = token.value
+            if token.value not in valid_hours:
+                out.append(ParseError(token.pos, str(token.value), INVALID_HOUR))
+            if not valid_days(days):
+                out.append(ParseError(days.pos, '%s-%s' % days.value,
+                                      INVALID_RANGE))
+        elif kind is MINUTE:
+            # 24:00 is the last time of a day
+            if token.value not in VALID_MINUTES or (token.value and hour == 24):
+                out.append(ParseError(token.pos, '%02d' % token.value,
+                                      INVALID_MINUTE))
+        elif kind is DAY or kind is RANGE:
+            days = token
+        else:
+            out.append(_scan_error(tag, token))
+    return out
+
+
+def _scan_error(tag, token):
+    return ParseError(token.pos, tag[token.pos:token.pos + 1], token.value)